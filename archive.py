@@ -0,0 +1,168 @@
+import gzip
+import json
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+
+from history import month_first, month_key, month_last
+
+
+def _padded(first, masks):
+    # kuukauden maskit täyteen mittaan (tiedostossa lopun nollat puuttuvat)
+    return masks + array("I", [0]) * (month_last(first) - first + 1 - len(masks))
+
+
+# --------- KYLMÄ HISTORIA-ARKISTO ---------
+class Archive:
+    """Vanhat historiakuukaudet pakattuina käyttäjäkohtaisiin tiedostoihin.
+
+    <hakemisto>/<user_id>.json.gz = {"YYYY-MM": {"masks": [...], "extra": {...}}},
+    masks yksi per kuukauden päivä (lopun nollat pois). Yksi tiedosto per
+    käyttäjä eikä per kuukausi, jotta tiedostoja ei kerry satojatuhansia.
+    Tiedostoa luetaan vain, kun kysely osuu arkistoituun kuukauteen
+    (HistoryStats, period_masks); luetut käyttäjät pidetään pienessä
+    LRU-välimuistissa. Kyselyt ajetaan SQLitellä säikeissä, siksi lukko.
+    """
+
+    def __init__(self, directory, cache_size=64):
+        self.directory = Path(directory)
+        self.cache_size = cache_size
+        self.reads = 0  # tiedostolukuja (ei välimuistista), !perf ja vertailut
+        self._cache = OrderedDict()  # user_id -> {kuukausi: (maskit, extra)}
+        self._lock = threading.Lock()
+
+    def path(self, user_id):
+        return self.directory / f"{user_id}.json.gz"
+
+    def load(self, user_id):
+        """Käyttäjän arkistoidut kuukaudet: {ensimmäisen päivän ordinaali: (maskit, extra)}."""
+        with self._lock:
+            months = self._cache.get(user_id)
+            if months is not None:
+                self._cache.move_to_end(user_id)
+                return months
+        try:
+            with gzip.open(self.path(user_id), "rt", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = {}
+        self.reads += 1
+        months = {
+            date.fromisoformat(key + "-01").toordinal(): (array("I", segment["masks"]), segment.get("extra", {}))
+            for key, segment in raw.items()
+        }
+        self._remember(user_id, months)
+        return months
+
+    def _remember(self, user_id, months):
+        with self._lock:
+            self._cache[user_id] = months
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def month(self, user_id, first):
+        """Arkistoidun kuukauden maskit, yksi jokaiselle kuukauden päivälle."""
+        masks, _ = self.load(user_id).get(first, (array("I"), {}))
+        return _padded(first, masks)
+
+    def fill(self, user_id, rollups, masks, first):
+        """ORaa ikkunaan masks (masks[i] = päivä first + i) arkistoidut päivät."""
+        if rollups is None or first >= rollups.until:
+            return masks
+        last = first + len(masks) - 1
+        for month in rollups.months:
+            end = month_last(month)
+            if end < first or month > last:
+                continue
+            cold = self.month(user_id, month)
+            for day in range(max(month, first), min(end, last) + 1):
+                masks[day - first] |= cold[day - month]
+        return masks
+
+    def write(self, user_id, segments):
+        """Kirjoittaa kuukaudet ({kuukausi: (maskit, extra)}) yhdistäen ne
+        aiemmin arkistoituihin (maskit OR). Palauttaa kirjoitettujen
+        kuukausien yhdistetyt maskit. Kirjoitus on atominen (tmp + fsync +
+        replace); hakemiston fsync jätetään kutsujalle (write_batch)."""
+        months = dict(self.load(user_id))
+        merged = {}
+        for first, (masks, extra) in segments.items():
+            old_masks, old_extra = months.get(first, (array("I"), {}))
+            size = max(len(masks), len(old_masks))
+            masks = masks + array("I", [0]) * (size - len(masks))
+            for i, mask in enumerate(old_masks):
+                masks[i] |= mask
+            extra = {**old_extra, **extra}
+            months[first] = (masks, extra)
+            merged[first] = _padded(first, masks)
+        raw = {}
+        for first, (masks, extra) in sorted(months.items()):
+            values = masks.tolist()
+            while values and not values[-1]:
+                values.pop()
+            raw[month_key(first)] = {"masks": values, **({"extra": extra} if extra else {})}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(user_id)
+        tmp = path.with_name(path.name + ".tmp")
+        data = json.dumps(raw, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with open(tmp, "wb") as f:
+            with gzip.GzipFile(filename="", mode="wb", fileobj=f, compresslevel=6) as gz:
+                gz.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._remember(user_id, months)
+        return merged
+
+    def write_batch(self, segments):
+        """{user_id: kuukaudet} -> {user_id: yhdistetyt maskit}. Tiedostot on
+        synkronoitu kukin erikseen; hakemisto (uudelleennimeämiset)
+        synkronoidaan kerran koko erälle ennen kuin arkistointi journaloidaan."""
+        merged = {user_id: self.write(user_id, months) for user_id, months in segments.items()}
+        if merged:
+            self._sync_directory()
+        return merged
+
+    def _sync_directory(self):
+        # vain POSIX: Windowsissa hakemistoa ei voi avata fsyncia varten
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def split(history, until):
+        """Historian päivät ennen until-päivää kuukausittain: {kuukausi: (maskit, extra)}."""
+        segments = {}
+        if history.start is not None:
+            for i in range(min(until - history.start, len(history.masks))):
+                day = history.start + i
+                mask = history.masks[i]
+                month = month_first(day)
+                if month not in segments:
+                    segments[month] = (array("I", [0]) * (month_last(month) - month + 1), {})
+                segments[month][0][day - month] = mask
+        cut = date.fromordinal(until).isoformat()
+        for date_str, tasks in history.extra.items():
+            if date_str < cut:
+                month = month_first(date.fromisoformat(date_str).toordinal())
+                if month not in segments:
+                    segments[month] = (array("I", [0]) * (month_last(month) - month + 1), {})
+                segments[month][1][date_str] = tasks
+        return segments
+
+    def copy_to(self, directory):
+        """Kopioi arkiston toiseen hakemistoon (tallennusmuodon vaihto)."""
+        if not self.directory.is_dir():
+            return
+        target = Path(directory)
+        target.mkdir(parents=True, exist_ok=True)
+        for path in self.directory.glob("*.json.gz"):
+            (target / path.name).write_bytes(path.read_bytes())
@@ -0,0 +1,54 @@
+"""Mikrobenchmark: suunnitelmanäkymät välimuistista vs. renderöinti joka kutsulla.
+
+Ajo repon juuresta: python benchmarks/bench_plans.py
+"""
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from plans import DAY_HEADERS, DAY_NAMES, PlanRenderer, render_day, render_week
+
+# Botin asetusten kokoinen esimerkkiasetus; ei riipu asetustiedoston sisällöstä.
+TASKS = {f"task_{i}": i % 5 + 1 for i in range(18)}
+ROUTINE = [f"task_{i}" for i in range(9)]
+DAY_PLAN = {
+    day: {"label": f"{day.upper()} DAY", "core_tasks": [f"task_{9 + i}", f"task_{9 + (i + 3) % 9}"]}
+    for i, day in enumerate(DAY_NAMES)
+}
+
+
+def uncached():
+    for day in DAY_NAMES:
+        for view in DAY_HEADERS:
+            render_day(TASKS, DAY_PLAN, ROUTINE, day, view)
+    render_week(DAY_PLAN)
+
+
+def cached(renderer):
+    for day in DAY_NAMES:
+        for view in DAY_HEADERS:
+            renderer.day(day, view)
+    renderer.week()
+
+
+def best(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+if __name__ == "__main__":
+    renderer = PlanRenderer()
+    renderer.configure(TASKS, DAY_PLAN, ROUTINE)
+    views = len(DAY_NAMES) * len(DAY_HEADERS) + 1
+    number = 2000
+
+    slow = best(uncached, number)
+    fast = best(lambda: cached(renderer), number)
+    rebuild = best(lambda: renderer.configure(TASKS, DAY_PLAN, ROUTINE), 200)
+
+    print(f"näkymiä / kierros:   {views}")
+    print(f"renderöinti:         {slow / views * 1e6:8.2f} µs / näkymä")
+    print(f"välimuisti:          {fast / views * 1e6:8.2f} µs / näkymä")
+    print(f"nopeutus:            {slow / fast:8.1f}x")
+    print(f"configure (kaikki):  {rebuild * 1e6:8.1f} µs")
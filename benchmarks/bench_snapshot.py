@@ -0,0 +1,117 @@
+"""Käynnistysvertailu: JSON-tilannekuva vs. binäärinen .wab (binary_backend.py).
+
+Jokainen (muoto, käyttäjämäärä) ladataan omassa prosessissaan, jotta muisti
+ja välimuistit eivät sekoitu. Synteettinen data on sama kuin load_suite.py:ssä.
+
+    python benchmarks/bench_snapshot.py                  # 10k ja 100k käyttäjää
+    python benchmarks/bench_snapshot.py --users 1000 10000
+
+Mittarit:
+  load_s    DataStore.load(): tilannekuva + pistetaulukko
+  first_s   ensimmäiset 100 satunnaista käyttäjää (komentojen tapaan)
+  all_s     kaikkien käyttäjien läpikäynti (esim. päivänvaihto)
+  rss_mb    prosessin muisti latauksen jälkeen ja läpikäynnin jälkeen
+"""
+import argparse
+import json
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+# --------- YKSI LATAUS (ALIPROSESSI) ---------
+def worker(path):
+    from binary_backend import BinaryBackend
+    from store import DataStore, JsonBackend
+
+    path = Path(path)
+    baseline = rss_mb()
+    started = time.perf_counter()
+    store = DataStore(BinaryBackend(path) if path.suffix == ".wab" else JsonBackend(path))
+    store.load()
+    load_s = time.perf_counter() - started
+    loaded = rss_mb()
+
+    sample = random.Random(1).sample(list(store.users), min(100, len(store.users)))
+    started = time.perf_counter()
+    total = sum(store.users[user_id].points for user_id in sample)
+    first_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    total += sum(record.streak for record in store.users.values())
+    all_s = time.perf_counter() - started
+    return {
+        "load_s": round(load_s, 4),
+        "first_s": round(first_s, 5),
+        "all_s": round(all_s, 4),
+        "rss_load_mb": round(loaded - baseline, 1),
+        "rss_all_mb": round(rss_mb() - baseline, 1),
+        "checksum": total,
+    }
+
+
+def run(path):
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--worker", str(path)]
+    log = subprocess.run(cmd, capture_output=True, text=True)
+    if log.returncode != 0:
+        sys.stderr.write(log.stderr[-4000:])
+        raise SystemExit(f"{path} latautui virheeseen")
+    return json.loads(log.stdout)
+
+
+def main(users):
+    from binary_backend import convert
+    from load_suite import synthetic_data
+
+    print(f"{'käyttäjiä':>10} {'muoto':<6}{'koko MB':>9}{'load s':>9}{'100 s':>9}{'kaikki s':>10}{'RSS MB':>9}{'RSS kaikki':>12}")
+    for n_users in users:
+        workdir = Path(tempfile.mkdtemp(prefix=f"winter_arc_snapshot_{n_users}_"))
+        try:
+            json_path = workdir / "winter_arc_data.json"
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(synthetic_data(n_users, date.today()), f)
+            wab_path = workdir / "winter_arc_data.wab"
+            convert(json_path, wab_path)
+            results = {}
+            for name, path in (("json", json_path), ("wab", wab_path)):
+                result = results[name] = run(path)
+                print(
+                    f"{n_users:>10} {name:<6}{path.stat().st_size / 2**20:>9.1f}{result['load_s']:>9.3f}"
+                    f"{result['first_s']:>9.4f}{result['all_s']:>10.3f}{result['rss_load_mb']:>9.1f}"
+                    f"{result['rss_all_mb']:>12.1f}"
+                )
+            if results["json"]["checksum"] != results["wab"]["checksum"]:
+                raise SystemExit("muodot eivät täsmää")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.path[:0] = [str(ROOT), str(Path(__file__).resolve().parent)]
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        print(json.dumps(worker(args.worker)))
+    else:
+        main(args.users)
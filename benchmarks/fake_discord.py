@@ -0,0 +1,170 @@
+"""Discordin korvike benchmarkeille ja kuormitusajoille.
+
+Käyttäjät, kanavat, viestit ja komentojen ctx toimivat ilman verkkoyhteyttä.
+Lähetetyt viestit vain lasketaan (keep=True tallettaa myös sisällön), joten
+mittaukset näyttävät botin oman työn eivätkä Discordin viiveitä.
+
+    import winter_arc_bot as wab
+    fake = FakeDiscord()
+    install(wab, fake)
+    await wab.points_cmd.callback(fake.ctx(123))
+"""
+import itertools
+from types import SimpleNamespace
+
+import discord
+
+_ids = itertools.count(10**17)
+
+
+def _not_found(what):
+    # discord.NotFound tarvitsee HTTP-vastauksen; status ja reason riittävät
+    return discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), f"Unknown {what}")
+
+
+class FakeMessage:
+    __slots__ = ("id", "channel", "content", "embed", "edits")
+
+    def __init__(self, channel, content=None, embed=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.edits = 0
+
+    async def edit(self, content=None, embed=None, **kwargs):
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embed = embed
+        self.edits += 1
+        return self
+
+
+class MissingMessage:
+    """get_partial_message poistetulle viestille: muokkaus epäonnistuu kuten Discordissa."""
+
+    def __init__(self, channel, message_id):
+        self.id = message_id
+        self.channel = channel
+
+    async def edit(self, **kwargs):
+        raise _not_found("Message")
+
+
+class FakeChannel:
+    def __init__(self, channel_id, keep=False):
+        self.id = channel_id
+        self.keep = keep
+        self.sent = 0
+        self.messages = {}  # id -> FakeMessage (vain keep=True tai muokattavat)
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        self.sent += 1
+        message = FakeMessage(self, content, embed)
+        # viestit talteen, jotta fetch_message/edit toimii (leaderboard)
+        self.messages[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id):
+        return self.messages.get(message_id) or MissingMessage(self, message_id)
+
+    async def fetch_message(self, message_id):
+        message = self.messages.get(message_id)
+        if message is None:
+            raise _not_found("Message")
+        return message
+
+
+class FakeUser:
+    __slots__ = ("id", "name", "display_name", "mention", "keep", "sent", "inbox")
+
+    def __init__(self, user_id, keep=False):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.keep = keep
+        self.sent = 0
+        self.inbox = []
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        self.sent += 1
+        if self.keep:
+            self.inbox.append(content if embed is None else embed)
+
+
+class FakeGuild:
+    __slots__ = ("id",)
+
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class FakeCtx:
+    """Komennon konteksti: vastaukset menevät kanavalle, kuten oikeassa botissa."""
+
+    def __init__(self, author, channel, guild=None):
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.replies = []
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        if self.channel.keep:
+            self.replies.append(content if embed is None else embed)
+        return await self.channel.send(content, embed=embed)
+
+
+class NoLimit:
+    """Broadcasterin nopeusrajoittimen korvike: ei odota koskaan. Oikea
+    rajoitin odottaisi botin kelloa, jota simulaattori ei siirrä ajon aikana."""
+
+    async def acquire(self):
+        return None
+
+
+class FakeDiscord:
+    """Botin korvike: get_user/fetch_user/get_channel palauttavat korvikkeet,
+    jotka luodaan ensimmäisellä kysymiskerralla."""
+
+    def __init__(self, keep=False):
+        self.keep = keep
+        self.user = FakeUser(0)
+        self.users = {}
+        self.channels = {}
+        self.fetches = 0
+        self.commands_channel = FakeChannel(1, keep=keep)
+
+    def get_user(self, user_id):
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = FakeUser(user_id, keep=self.keep)
+        return user
+
+    async def fetch_user(self, user_id):
+        self.fetches += 1
+        return self.get_user(user_id)
+
+    def get_channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(channel_id, keep=self.keep)
+        return channel
+
+    def ctx(self, user_id, guild_id=None):
+        """Komennon konteksti; guild_id=None = yksityisviesti (koti-osio)."""
+        guild = FakeGuild(guild_id) if guild_id is not None else None
+        return FakeCtx(self.get_user(user_id), self.commands_channel, guild)
+
+    @property
+    def dms(self):
+        return sum(user.sent for user in self.users.values())
+
+
+def install(module, fake):
+    """Kytkee korvikkeen winter_arc_bot-moduuliin: kanavat, DM:t ja
+    nopeusrajoitin. Komennot kutsutaan suoraan: await cmd.callback(ctx, ...)."""
+    module.bot = fake
+    module.broadcaster.bot = fake
+    module.broadcaster.limiter = NoLimit()
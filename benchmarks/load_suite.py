@@ -0,0 +1,493 @@
+"""Kuormitusajo ilman Discordia: N synteettistä käyttäjää komentojen ja
+ajastettujen ajojen läpi.
+
+Jokainen käyttäjämäärä ajetaan omassa prosessissaan tyhjässä
+väliaikaishakemistossa (botin moduulitason tila ja muistihuippu eivät
+sekoitu). Tulos tallennetaan JSONina, jotta ajoja voi verrata keskenään.
+
+    python benchmarks/load_suite.py                          # 100, 1k, 10k ja 100k käyttäjää
+    python benchmarks/load_suite.py --users 100 1000 --ops 500
+    python benchmarks/load_suite.py --backend sqlite
+    python benchmarks/load_suite.py --backend binary
+    python benchmarks/load_suite.py --baseline benchmarks/results/load-20251101-120000.json
+
+Mittarit käyttäjämäärää kohden:
+  commands  p50/p99-viive (ms) ja läpäisy (komentoa/s): !done, !points, !leaderboard, !monthstats
+  jobs      ajastettujen ajojen kesto (s) koko käyttäjäjoukolle, DM-nopeusrajoitin pois päältä
+  memory    tracemallocin huippu datan latauksessa ja yhdessä ajokierroksessa (MB)
+  stress    rinnakkaiset !done/!buy samoille käyttäjille + exclusive-ajot; invarianttien tarkistus
+  upgrade   home_guild null: palvelimen komento sitoo palvelimen kotiosioon ja näkee vanhan datan
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_USERS = [100, 1_000, 10_000, 100_000]
+COMMANDS = ["done", "done_multi", "points", "leaderboard", "monthstats"]
+HISTORY_DAYS = 90
+STRESS_USERS = 20
+STRESS_OPS = 3000
+UPGRADE_GUILD = 4242  # palvelin, jolta tulee ensimmäinen komento päivityksen jälkeen
+# vertailussa suurempi arvo on huonompi, paitsi läpäisyssä
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "seconds", "peak_mb", "load_seconds")
+
+
+# --------- SYNTEETTINEN DATA ---------
+def synthetic_data(n_users, today, seed=1):
+    """Datatiedosto (skeemaversio 3) n_users käyttäjälle: historiaa
+    HISTORY_DAYS päivää, osa tämän päivän tehtävistä tehty ja joka
+    kymmenennellä muistutuksia. Viimeisin päivä on eilinen, joten
+    päivänvaihto tekee oikeaa työtä."""
+    from config import load_config
+    from history import History
+    from store import SCHEMA_VERSION, UserRecord
+
+    rng = random.Random(seed)
+    cfg = load_config(ROOT / "winter_arc_config.json")
+    tasks = list(cfg.tasks)
+    routine = list(cfg.routine_tasks)
+    yesterday = today - timedelta(days=1)
+    first = yesterday - timedelta(days=HISTORY_DAYS)
+
+    data = {}
+    for i in range(n_users):
+        user_id = 10**12 + i
+        history = History()
+        streak = 0
+        for d in range(HISTORY_DAYS):
+            day = first + timedelta(days=d)
+            if rng.random() < 0.2:
+                streak = 0
+                continue
+            done = [t for t in routine if rng.random() < 0.7] + rng.sample(tasks, 2)
+            history.set_day(day.isoformat(), done)
+            streak = streak + 1 if len(set(done) & set(routine)) >= cfg.min_tasks_for_streak else 0
+        reminders = {}
+        if i % 10 == 0:
+            reminders[today.isoformat()] = [{"text": "venyttely"}, {"text": "kauppa", "time": "23:59"}]
+            reminders[(today + timedelta(days=2)).isoformat()] = [{"text": "sali", "time": "07:00"}]
+        record = UserRecord(
+            points=rng.randrange(0, 500),
+            today={t: True for t in rng.sample(routine, 3)},
+            last_date=yesterday.isoformat(),
+            streak=streak,
+            best_streak=streak + rng.randrange(0, 10),
+            history=history,
+            reminders=reminders,
+        )
+        data[str(user_id)] = record.to_dict()
+    data["_meta"] = {"schema_version": SCHEMA_VERSION}
+    return data
+
+
+# --------- MITTAUS ---------
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure(calls, concurrency):
+    """Ajaa kutsut `concurrency` kerrallaan. Palauttaa viiveet (s) ja kokonaisajan."""
+    latencies = []
+
+    async def timed(make):
+        started = time.perf_counter()
+        await make()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(0, len(calls), concurrency):
+        await asyncio.gather(*(timed(make) for make in calls[i:i + concurrency]))
+    return latencies, time.perf_counter() - started
+
+
+def summary(latencies, wall):
+    return {
+        "ops": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 4),
+        "throughput": round(len(latencies) / wall, 1),
+    }
+
+
+async def run_commands(wab, fake, user_ids, ops, concurrency, rng):
+    cfg = wab.settings.current
+    tasks = list(cfg.tasks)
+    this_month = datetime.now(wab.FIN_TZ).strftime("%Y-%m")
+    last_month = (datetime.now(wab.FIN_TZ).date().replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+
+    def make(name):
+        uid = rng.choice(user_ids)
+        if name == "done":
+            return lambda: wab.done_cmd.callback(fake.ctx(uid), rng.choice(tasks))
+        if name == "done_multi":
+            # aamun check-in yhdellä komennolla
+            return lambda: wab.done_cmd.callback(fake.ctx(uid), *rng.sample(tasks, 4))
+        if name == "points":
+            return lambda: wab.points_cmd.callback(fake.ctx(uid))
+        if name == "leaderboard":
+            return lambda: wab.leaderboard_cmd.callback(fake.ctx(uid))
+        month = rng.choice([this_month, last_month])
+        return lambda: wab.monthstats_cmd.callback(fake.ctx(uid), month)
+
+    results = {}
+    for name in COMMANDS:
+        calls = [make(name) for _ in range(ops)]
+        latencies, wall = await measure(calls, concurrency)
+        results[name] = summary(latencies, wall)
+
+    # sekakuorma kuten oikeassa käytössä: enimmäkseen !done ja !points
+    mix = rng.choices(COMMANDS, weights=[4, 2, 2, 1, 1], k=ops)
+    latencies, wall = await measure([make(name) for name in mix], concurrency)
+    results["mixed"] = summary(latencies, wall)
+    return results
+
+
+def job_list(wab):
+    # kuten ajastimessa: jokainen työ ajetaan kaikille palvelinosioille
+    return [(name, wab.each_guild(job)) for name, job in (
+        ("midnight_rollover", wab.midnight_rollover),
+        ("daily_todayplan", wab.send_daily_todayplan),
+        ("daily_leaderboard", wab.update_daily_leaderboard),
+        ("evening_todo", wab.send_evening_todo),
+        ("timed_reminders", wab.send_timed_reminders),
+        ("daily_report", wab.send_daily_report),
+        ("day_completion_check", wab.send_day_completion_check),
+        ("weekly_summary", wab.send_weekly_summary),
+    )]
+
+
+async def run_jobs(wab, fake, now):
+    results = {}
+    for name, job in job_list(wab):
+        dms = fake.dms
+        started = time.perf_counter()
+        await job(now)
+        results[name] = {"seconds": round(time.perf_counter() - started, 4), "dms": fake.dms - dms}
+    return results
+
+
+async def run_stress(wab, fake, rng):
+    """Sama kuin lukitusten käsin ajettu stressitesti: paljon rinnakkaisia
+    !done/!buy-kutsuja harvoille käyttäjille ja välissä exclusive-ajoja.
+    Pisteiden pitää vastata tapahtumia täsmälleen."""
+    home = wab.partitions.home  # FakeCtx:n komennot (ei palvelinta) menevät koti-osioon
+    store = home.store
+    cfg = wab.settings.current
+    tasks = list(cfg.tasks)
+    reward = min(cfg.rewards, key=cfg.rewards.get)
+    user_ids = [1 + i for i in range(STRESS_USERS)]
+    before = {uid: store.get_user(uid).points for uid in user_ids}
+
+    applied = []
+    apply = store.apply
+
+    def recording(event_type, user_id=None, **fields):
+        event = apply(event_type, user_id, **fields)
+        applied.append(event)
+        return event
+
+    store.apply = recording
+    try:
+        calls = []
+        for _ in range(STRESS_OPS):
+            uid = rng.choice(user_ids)
+            if rng.random() < 0.7:
+                calls.append(wab.done_cmd.callback(fake.ctx(uid), *rng.sample(tasks, rng.choice((1, 3)))))
+            else:
+                calls.append(wab.buy_cmd.callback(fake.ctx(uid), reward))
+
+        async def exclusive_section():
+            async with home.locks.exclusive():
+                await asyncio.sleep(0.01)
+
+        for k in range(1, 4):
+            calls.insert(k * STRESS_OPS // 4, exclusive_section())
+        started = time.perf_counter()
+        await asyncio.gather(*calls)
+        wall = time.perf_counter() - started
+    finally:
+        store.apply = apply
+
+    expected = dict(before)
+    done_twice = 0
+    seen = set()
+    for event in applied:
+        uid = event.get("user")
+        if event["type"] == "tasks_done":
+            for task, points in event["tasks"].items():
+                expected[uid] += points
+                key = (uid, task)
+                done_twice += key in seen
+                seen.add(key)
+        elif event["type"] == "reward_bought":
+            expected[uid] -= event["cost"]
+    mismatched = [uid for uid in user_ids if store.get_user(uid).points != expected[uid]]
+    negative = [uid for uid in user_ids if store.get_user(uid).points < 0]
+    return {
+        "ops": STRESS_OPS,
+        "seconds": round(wall, 4),
+        "events": len(applied),
+        "points_mismatch": len(mismatched),
+        "negative_points": len(negative),
+        "task_done_twice": done_twice,
+        "locks_left": len(home.locks),
+        "ok": not mismatched and not negative and not done_twice and len(home.locks) == 0,
+    }
+
+
+async def run_upgrade(wab, fake, user_ids):
+    """Päivitys yhden palvelimen botista: home_guild on null, joten palvelimen
+    ensimmäinen komento sitoo sen kotiosioon ja näkee vanhan datatiedoston
+    pisteet. Toinen palvelin saa oman, tyhjän osionsa."""
+    home = wab.partitions.home
+    cfg = wab.settings.current
+    # kuorma on voinut tehdä jo jonkun käyttäjän kaikki tehtävät
+    uid, task = next(
+        (uid, t) for uid in user_ids for t in cfg.tasks if not home.store.get_user(uid).today.get(t)
+    )
+    before = home.store.get_user(uid).points
+    await wab.done_cmd.callback(fake.ctx(uid, guild_id=UPGRADE_GUILD), task)
+    await wab.done_cmd.callback(fake.ctx(uid, guild_id=UPGRADE_GUILD + 1), task)
+    other = wab.partitions.get(UPGRADE_GUILD + 1).store.find_user(uid)
+    result = {
+        "home_bound": home.store.meta.get("home_guild") == UPGRADE_GUILD,
+        "legacy_points": home.store.get_user(uid).points == before + cfg.tasks[task],
+        "other_guild_separate": other is not None and other.points == cfg.tasks[task],
+        "partitions": len(wab.partitions),
+    }
+    result["ok"] = result["home_bound"] and result["legacy_points"] and result["other_guild_separate"]
+    return result
+
+
+async def run_memory(wab, fake, now):
+    """Muistihuippu: data ladataan uudelleen tracemallocin ollessa päällä
+    ja ajetaan yksi kierros ajoja. Erillään viivemittauksista, koska
+    tracemalloc hidastaa jokaista allokaatiota."""
+    home = wab.partitions.home
+    await home.writer.sync()
+    tracemalloc.start()
+    started = time.perf_counter()
+    home.store.load()
+    load_seconds = time.perf_counter() - started
+    home.reminders.rebuild()
+    after_load = tracemalloc.get_traced_memory()[0]
+    for _, job in job_list(wab):
+        await job(now)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "load_seconds": round(load_seconds, 4),
+        "loaded_mb": round(after_load / 2**20, 2),
+        "peak_mb": round(peak / 2**20, 2),
+        "bytes_per_user": round(after_load / max(len(home.store.users), 1)),
+    }
+
+
+# --------- YKSI KÄYTTÄJÄMÄÄRÄ (ALIPROSESSI) ---------
+async def worker_main(n_users, ops, concurrency, backend, seed):
+    rng = random.Random(seed)
+    today = date.today()
+    data = synthetic_data(n_users, today, seed)
+    with open("winter_arc_data.json", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    del data
+    if backend == "sqlite":
+        from sqlite_backend import import_json
+        import_json("winter_arc_data.json", os.environ["WINTER_ARC_DB"])
+    elif backend == "binary":
+        from binary_backend import convert
+        convert("winter_arc_data.json", "winter_arc_data.wab")
+
+    import winter_arc_bot as wab
+    from fake_discord import FakeDiscord, install
+
+    fake = FakeDiscord()
+    install(wab, fake)
+
+    started = time.perf_counter()
+    wab.setup()
+    load_seconds = time.perf_counter() - started
+    await wab.start_background(jobs=False)
+    user_ids = list(wab.partitions.home.store.users)
+
+    # ajot ensin: keskiyön ajo vaihtaa kaikkien päivän (muuten ensimmäinen komento tekisi sen)
+    now = datetime.now(wab.FIN_TZ)
+    jobs = await run_jobs(wab, fake, now)
+    commands = await run_commands(wab, fake, user_ids, ops, concurrency, rng)
+    stress = await run_stress(wab, fake, rng)
+    upgrade = await run_upgrade(wab, fake, user_ids)
+    memory = await run_memory(wab, fake, now)
+    memory["load_seconds_untraced"] = round(load_seconds, 4)
+    memory["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return {
+        "users": len(user_ids),
+        "commands": commands,
+        "jobs": jobs,
+        "stress": stress,
+        "upgrade": upgrade,
+        "memory": memory,
+    }
+
+
+def run_worker(n_users, args):
+    workdir = Path(tempfile.mkdtemp(prefix=f"winter_arc_load_{n_users}_"))
+    out = workdir / "result.json"
+    env = dict(os.environ)
+    env["WINTER_ARC_CONFIG"] = str(ROOT / "winter_arc_config.json")
+    env["WINTER_ARC_METRICS_PORT"] = "0"
+    env.pop("WINTER_ARC_DB", None)
+    env.pop("WINTER_ARC_FORMAT", None)
+    if args.backend == "sqlite":
+        env["WINTER_ARC_DB"] = str(workdir / "winter_arc.db")
+    elif args.backend == "binary":
+        env["WINTER_ARC_FORMAT"] = "binary"
+    cmd = [
+        sys.executable, str(Path(__file__).resolve()), "--worker", str(n_users),
+        "--ops", str(args.ops), "--concurrency", str(args.concurrency),
+        "--backend", args.backend, "--seed", str(args.seed), "--worker-out", str(out),
+    ]
+    try:
+        log = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True)
+        if log.returncode != 0:
+            sys.stderr.write(log.stdout[-2000:] + log.stderr[-4000:])
+            raise SystemExit(f"{n_users} käyttäjän ajo epäonnistui")
+        with open(out, "r", encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --------- RAPORTTI JA VERTAILU ---------
+def print_result(result):
+    print(f"\n=== {result['users']} käyttäjää ===")
+    print(f"{'komento':<14}{'p50 ms':>10}{'p99 ms':>10}{'ops/s':>12}")
+    for name, row in result["commands"].items():
+        print(f"{name:<14}{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['throughput']:>12.0f}")
+    print(f"{'ajo':<22}{'s':>10}{'DM:t':>10}")
+    for name, row in result["jobs"].items():
+        print(f"{name:<22}{row['seconds']:>10.3f}{row['dms']:>10}")
+    memory = result["memory"]
+    print(
+        f"muisti: lataus {memory['load_seconds']:.2f} s, {memory['loaded_mb']} MB "
+        f"({memory['bytes_per_user']} B/käyttäjä), huippu {memory['peak_mb']} MB, RSS {memory['max_rss_mb']} MB"
+    )
+    stress = result["stress"]
+    problems = {k: v for k, v in stress.items() if k in ("points_mismatch", "negative_points", "task_done_twice", "locks_left") and v}
+    print(
+        f"stressi: {stress['ops']} kutsua {stress['seconds']:.2f} s, {stress['events']} tapahtumaa, "
+        f"{'OK' if stress['ok'] else f'VIRHE {problems}'}"
+    )
+    upgrade = result["upgrade"]
+    print(f"päivitys: palvelimen komento näkee vanhan datan {'OK' if upgrade['ok'] else f'VIRHE {upgrade}'}")
+
+
+def flatten(result, prefix=""):
+    rows = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            rows.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            rows[f"{prefix}{key}"] = value
+    return rows
+
+
+def compare(baseline, current, threshold):
+    """Tulostaa muutokset edelliseen ajoon; palauttaa heikentyneet mittarit."""
+    regressions = []
+    for users, result in current["results"].items():
+        old = baseline["results"].get(users)
+        if old is None:
+            continue
+        old_rows, new_rows = flatten(old), flatten(result)
+        print(f"\n--- vertailu, {users} käyttäjää ---")
+        for key, new in new_rows.items():
+            metric = key.rsplit(".", 1)[-1]
+            if key not in old_rows or not old_rows[key] or (metric not in LOWER_IS_BETTER and metric != "throughput"):
+                continue
+            change = (new - old_rows[key]) / old_rows[key]
+            worse = change if metric in LOWER_IS_BETTER else -change
+            flag = "  <-- heikompi" if worse > threshold else ""
+            print(f"{key:<40}{old_rows[key]:>12}{new:>12}{change:>+9.1%}{flag}")
+            if flag:
+                regressions.append((users, key, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=DEFAULT_USERS)
+    parser.add_argument("--ops", type=int, default=2000, help="kutsuja komentoa kohden")
+    parser.add_argument("--concurrency", type=int, default=50, help="rinnakkaisia komentoja kerrallaan")
+    parser.add_argument("--backend", choices=["json", "sqlite", "binary"], default="json")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="tulostiedosto (oletus benchmarks/results/load-<aika>.json)")
+    parser.add_argument("--baseline", type=Path, help="aiempi tulostiedosto vertailuun")
+    parser.add_argument("--threshold", type=float, default=0.2, help="sallittu heikkeneminen vertailussa (0.2 = 20 %%)")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-out", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        sys.path[:0] = [str(ROOT), str(Path(__file__).resolve().parent)]
+        result = asyncio.run(worker_main(args.worker, args.ops, args.concurrency, args.backend, args.seed))
+        # kuten botin sammutuksessa: vasta kun event loop on pysähtynyt
+        sys.modules["winter_arc_bot"].partitions.flush()
+        with open(args.worker_out, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "ops": args.ops,
+        "concurrency": args.concurrency,
+        "history_days": HISTORY_DAYS,
+        "results": {},
+    }
+    for n_users in args.users:
+        print(f"ajetaan {n_users} käyttäjää...", flush=True)
+        result = run_worker(n_users, args)
+        report["results"][str(n_users)] = result
+        print_result(result)
+
+    out = args.out or RESULTS_DIR / f"load-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nTulokset: {out}")
+
+    failed = [
+        users for users, result in report["results"].items()
+        if not result["stress"]["ok"] or not result["upgrade"]["ok"]
+    ]
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} mittaria heikkeni yli {args.threshold:.0%}.")
+            sys.exit(1)
+    if failed:
+        sys.exit(f"stressitestin tai päivityksen invariantit eivät pitäneet: {', '.join(failed)} käyttäjää")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,663 @@
+"""Aikasimulaattori: botti virtuaaliajassa päivien, kesäaikasiirtymien ja
+uudelleenkäynnistysten yli.
+
+Botin kello (clock.Clock) pysäytetään ja siirretään aina seuraavaan
+tapahtumaan: käyttäjän komentoon tai ajastetun työn ajohetkeen. Ajastimen
+omaa silmukkaa ei käynnistetä, vaan simulaattori kutsuu run_pending()
+next_due()-hetkinä, joten viikkojen käyttö menee sekunneissa. Komennot
+kutsutaan suoraan kuten load_suitessa (benchmarks/fake_discord.py).
+
+Käyttäjät ovat eri aikavyöhykkeillä (Helsinki, Lontoo, New York, Kolkata,
+Sydney); oletusjakso 1.3.–4.4.2026 sisältää USA:n, EU:n ja Australian
+kesäaikasiirtymät. Uudelleenkäynnistys kirjoittaa tilan levylle, pitää
+botin alhaalla --downtime tuntia (sinä aikana tulleet komennot menetetään)
+ja lataa tilan levyltä; --crash jättää journalin tiivistämättä.
+
+    python benchmarks/simulate.py
+    python benchmarks/simulate.py --users 2000 --days 60 --backend sqlite
+    python benchmarks/simulate.py --restarts 5 --downtime 30 --crash
+    python benchmarks/simulate.py --script oma.jsonl --users 0
+
+Skripti on JSONL, rivi per komento (aika käyttäjän tai minkä tahansa vyöhykkeen mukaan):
+    {"at": "2026-03-29T02:30:00+02:00", "user": 5, "command": "done", "args": ["wake", "water"]}
+Komennot: done, resetday, buy, remind, timezone, streak, points.
+
+Invariantit tarkistetaan jokaisen (Suomen aikaa) vuorokauden lopussa
+riippumatonta mallia vasten:
+  points     pisteet = tehtyjen tehtävien pisteet - ostot
+  streak     streak ja paras streak vastaavat mallin onnistuneita päiviä
+  history    eilinen historiassa = mallin eilinen päivä
+  rollover   keskiyön ajon jälkeen vyöhykkeen käyttäjien päivä on paikallinen päivä
+  future     kenenkään päivä ei ole paikallisen päivän jälkeen
+  reminders  erääntynyt muistutus (kellonajallinen tai 18:00-viestin) on tullut
+             käyttäjälle DM:nä, myös passiiviselle
+  inactive   raportti-DM:iä ei lähetetä käyttäjälle, joka ei ole tehnyt mitään
+             --inactive-days päivään (osa käyttäjistä lopettaa kesken jakson)
+Raportti: per päivä komennot, ajot, käsittelyaika (ms), kirjoitus (ms), DM:t
+ja rikkomukset. Paluuarvo 1, jos rikkomuksia löytyi.
+
+Sama --seed ja samat argumentit tuottavat samat päiväkohtaiset laskurit:
+kaikki ajastettujen töiden odotukset kulkevat botin kellon kautta, ja
+samaan hetkeen osuvat työt ajetaan peräkkäin käynnistysjärjestyksessä.
+--twice ajaa simulaation kahdesti ja vertaa laskureita (ei kestoja).
+
+    python benchmarks/simulate.py --twice --seed 7
+"""
+import argparse
+import asyncio
+import contextlib
+import heapq
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+ROOT = Path(__file__).resolve().parent.parent
+ZONES = [None, "Europe/London", "America/New_York", "Asia/Kolkata", "Australia/Sydney"]
+ZONE_WEIGHTS = [6, 1, 1, 1, 1]  # None = oletus (Suomen aika)
+DEFAULT_START = "2026-03-01"
+DEFAULT_DAYS = 35
+MAX_EXAMPLES = 10  # rikkomusesimerkkejä raportissa
+COUNTERS = ("commands", "jobs", "dms", "violations", "lost")  # --twice vertaa näitä
+LAPSE_SHARE = 0.15  # käyttäjistä lopettaa satunnaisena päivänä
+
+
+# --------- MALLI ---------
+class Model:
+    """Käyttäjän tila botista riippumatta: päivä on se, jonka botti on
+    käyttäjälle vaihtanut (last_date), muu lasketaan komennoista."""
+
+    __slots__ = ("date", "today", "points", "days", "run", "best", "last_success", "last_active", "reminded")
+
+    def __init__(self):
+        self.date = None
+        self.today = set()
+        self.points = 0
+        self.days = {}  # päivä -> päivän lopulliset tehtävät (viimeiset päivät)
+        self.run = 0  # onnistuneiden päivien putki päivään last_success asti
+        self.best = 0
+        self.last_success = None
+        self.last_active = None  # viimeisin päivä, jona jotain tehtiin
+        self.reminded = False
+
+    def follow(self, last_date, cfg):
+        """Botti vaihtoi päivän: edellinen päivä päätetään."""
+        if last_date == self.date:
+            return
+        if self.date is not None:
+            self.days[self.date] = self.today
+            if self.today:
+                self.last_active = date.fromisoformat(self.date)
+            if len(self.today.intersection(cfg.routine_tasks)) >= cfg.min_tasks_for_streak:
+                day = date.fromisoformat(self.date)
+                previous = self.last_success
+                self.run = self.run + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+                self.best = max(self.best, self.run)
+                self.last_success = day
+            # vain eilinen tarkistetaan historiasta
+            for old in [d for d in self.days if d < self.date]:
+                del self.days[old]
+        self.date = last_date
+        self.today = set()
+
+    def streak(self):
+        if self.date is None or self.last_success is None:
+            return 0
+        return self.run if date.fromisoformat(self.date) - self.last_success == timedelta(days=1) else 0
+
+
+# --------- AKTIIVISUUS ---------
+class Profile:
+    __slots__ = ("zone", "active", "routine", "sessions", "lapse")
+
+    def __init__(self, zone, active, routine, sessions, lapse=None):
+        self.zone = zone
+        self.active = active  # todennäköisyys, että käyttäjä käyttää bottia päivänä
+        self.routine = routine  # todennäköisyys tehdä kukin rutiinitehtävä
+        self.sessions = sessions
+        self.lapse = lapse  # päivä, josta alkaen käyttäjä ei enää käytä bottia
+
+
+def local_moment(day, minutes, zone):
+    """Paikallinen kellonaika UTC-hetkeksi. Kesäaikaan siirryttäessä
+    puuttuva tunti osuu siirtymän jälkeiseen aikaan (zoneinfon fold=0)."""
+    moment = datetime.combine(day, dtime(minutes // 60, minutes % 60), tzinfo=zone)
+    return moment.astimezone(ZoneInfo("UTC"))
+
+
+def random_day(rng, cfg, profiles, day, default):
+    """Yhden paikallisen päivän komennot kaikille käyttäjille: (hetki, käyttäjä, komento, argumentit)."""
+    tasks = list(cfg.tasks)
+    routine = sorted(cfg.routine_tasks)
+    cheapest = min(cfg.rewards, key=cfg.rewards.get) if cfg.rewards else None
+    actions = []
+    for uid, profile in profiles.items():
+        if profile.lapse is not None and day >= profile.lapse:
+            continue
+        if rng.random() > profile.active:
+            continue
+        zone = ZoneInfo(profile.zone) if profile.zone else default
+        done = [t for t in routine if rng.random() < profile.routine] + rng.sample(tasks, rng.randrange(0, 3))
+        rng.shuffle(done)
+        sessions = rng.randrange(1, profile.sessions + 1)
+        for i in range(sessions):
+            if rng.random() < 0.05:
+                # keskiyön tuntumassa: päivänvaihdon ja komennon kilpa
+                minutes = rng.choice([rng.randrange(0, 20), rng.randrange(23 * 60 + 40, 24 * 60)])
+            else:
+                minutes = rng.randrange(6 * 60, 23 * 60 + 30)
+            chunk = done[i::sessions]
+            if chunk:
+                actions.append((local_moment(day, minutes, zone), uid, "done", chunk))
+        if rng.random() < 0.02:
+            actions.append((local_moment(day, rng.randrange(8 * 60, 22 * 60), zone), uid, "resetday", []))
+        if cheapest and rng.random() < 0.05:
+            actions.append((local_moment(day, rng.randrange(12 * 60, 23 * 60), zone), uid, "buy", [cheapest]))
+        if rng.random() < 0.03:
+            minutes = rng.randrange(7 * 60, 20 * 60)
+            due = minutes + rng.randrange(10, 180)
+            args = ["today" if due < 24 * 60 else "tomorrow", f"{due // 60 % 24:02d}:{due % 60:02d} venyttely {day:%m%d}"]
+            actions.append((local_moment(day, minutes, zone), uid, "remind", args))
+        elif rng.random() < 0.03:
+            # 18:00-viestin muistutus; viikon päähän ehtii passivoitua (raportti ohitetaan)
+            later = day + timedelta(days=rng.randrange(1, 10))
+            args = [later.isoformat(), f"maksa laskut {day:%m%d}"]
+            actions.append((local_moment(day, rng.randrange(7 * 60, 17 * 60), zone), uid, "remind", args))
+    return actions
+
+
+def read_script(path):
+    actions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                moment = datetime.fromisoformat(row["at"]).astimezone(ZoneInfo("UTC"))
+                actions.append((moment, int(row["user"]), row["command"], list(row.get("args", []))))
+    return actions
+
+
+# --------- SIMULAATTORI ---------
+class Simulation:
+    def __init__(self, wab, fake, args):
+        self.wab = wab
+        self.fake = fake
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.cfg = wab.settings.current
+        self.models = {}
+        self.profiles = {}
+        self.queue = []  # (hetki, järjestys, käyttäjä, komento, argumentit)
+        self.counter = 0
+        self.days = {}  # Suomen päivä -> rivin laskurit
+        self.violations = {}  # invariantti -> määrä
+        self.examples = []
+        self.lost = 0
+        self.sent = {}  # käyttäjä -> DM:t edellisen päivän tarkistukseen mennessä
+        self.dms = 0  # DM:t yhteensä edellisen päivän lopussa
+        self.expected = {}  # käyttäjä -> [(erääntymishetki, muistutuksen teksti)]
+        self.downtimes = []  # (alku, loppu): botti alhaalla
+        self.jobs_lock = asyncio.Lock()  # samaan hetkeen osuvat työt peräkkäin
+
+    # --- apurit ---
+    @property
+    def home(self):
+        return self.wab.partitions.home  # FakeCtx:n komennot menevät koti-osioon
+
+    def now(self):
+        return self.wab.clock.now(self.wab.FIN_TZ)
+
+    def row(self):
+        day = self.now().date()
+        row = self.days.get(day)
+        if row is None:
+            row = self.days[day] = {
+                "commands": 0, "command_ms": 0.0, "jobs": 0, "job_ms": 0.0,
+                "rollover_ms": 0.0, "write_ms": 0.0, "dms": 0, "violations": 0, "lost": 0,
+            }
+        return row
+
+    def violation(self, kind, text):
+        self.violations[kind] = self.violations.get(kind, 0) + 1
+        self.row()["violations"] += 1
+        if len(self.examples) < MAX_EXAMPLES:
+            self.examples.append(f"{self.now():%Y-%m-%d %H:%M} {kind}: {text}")
+
+    def push(self, actions):
+        for moment, uid, command, cmd_args in actions:
+            heapq.heappush(self.queue, (moment, self.counter, uid, command, cmd_args))
+            self.counter += 1
+
+    # --- ajastin ---
+    def instrument(self):
+        """Kääritään ajastetut työt: kesto päivän riville ja keskiyön ajon tarkistus."""
+        for job in self.wab.scheduler.jobs.values():
+            job.callback = self._timed(job.name, job.callback)
+
+    def _timed(self, name, callback):
+        # run_pending() käynnistää erääntyneet työt rinnakkain; kuvaajien
+        # renderöinti prosessipoolissa kestää oikeaa aikaa, joten rinnakkaiset
+        # ajot lomittuisivat eri tavoin eri kerroilla. Lukko (FIFO) ajaa ne
+        # käynnistysjärjestyksessä.
+        async def run(due):
+            async with self.jobs_lock:
+                started = time.perf_counter()
+                await callback(due)
+                elapsed = (time.perf_counter() - started) * 1000
+            row = self.row()
+            row["jobs"] += 1
+            row["job_ms"] += elapsed
+            if name == "midnight_rollover":
+                row["rollover_ms"] += elapsed
+                self.check_rollover(due)
+        return run
+
+    async def boot(self):
+        """Kuten start_background(), mutta ajastimen silmukan sijaan simulaattori
+        ajaa erääntyneet työt."""
+        wab = self.wab
+        for part in wab.partitions:
+            part.leaderboard.interval = 0  # pistetaulukkoviestiä ei simuloida
+            part.deliveries.inactive_days = self.cfg.dm_inactive_days
+        now = self.now()
+        await wab.each_guild(wab.rollover_stale)(now)
+        await wab.each_guild(wab.deliver_overdue_reminders)(now)
+        wab.scheduler.start(last_runs=self.home.store.meta.get("jobs", {}), now=now, loop=False)
+
+    async def restart(self, downtime):
+        wab = self.wab
+        wab.scheduler.stop()
+        for part in wab.partitions:
+            if self.args.crash:
+                # kaatuminen: vain journal kirjoitettu, ei tiivistystä
+                part.store.backend.write(part.store.drain())
+            else:
+                part.writer.flush()
+        print(f"[sim] {self.now():%Y-%m-%d %H:%M %Z} uudelleenkäynnistys, alhaalla {downtime}")
+        self.downtimes.append((self.now(), self.now() + downtime))
+        await self.advance_to(self.now() + downtime)
+        # alhaallaoloaikana tulleet komennot menetetään
+        while self.queue and self.queue[0][0] <= self.now():
+            heapq.heappop(self.queue)
+            self.lost += 1
+            self.row()["lost"] += 1
+        wab.partitions.load()
+        await self.boot()
+
+    # --- komennot ---
+    async def command(self, uid, name, cmd_args):
+        wab = self.wab
+        ctx = self.fake.ctx(uid)
+        fn = getattr(wab, f"{name}_cmd").callback
+        started = time.perf_counter()
+        if name == "remind":
+            await fn(ctx, cmd_args[0], text=" ".join(cmd_args[1:]))
+        elif name == "timezone":
+            await fn(ctx, name=" ".join(cmd_args) or None)
+        else:
+            await fn(ctx, *cmd_args)
+        row = self.row()
+        row["commands"] += 1
+        row["command_ms"] += (time.perf_counter() - started) * 1000
+
+    async def act(self, uid, name, cmd_args):
+        record = self.home.store.find_user(uid)
+        model = self.models.setdefault(uid, Model())
+        points = record.points if record is not None else 0
+        await self.command(uid, name, cmd_args)
+        record = self.home.store.find_user(uid)
+        model.follow(record.last_date, self.cfg)
+        if name == "done":
+            new = {t for t in cmd_args if t in self.cfg.tasks} - model.today
+            model.points += sum(self.cfg.tasks[t] for t in new)
+            model.today |= new
+            if model.today:
+                model.last_active = date.fromisoformat(model.date)
+        elif name == "resetday":
+            model.today = set()
+        elif name == "buy":
+            cost = self.cfg.rewards.get(cmd_args[0].lower())
+            if cost is not None and points >= cost:
+                model.points -= cost
+        elif name == "remind":
+            self.expect_reminder(uid, record, cmd_args)
+
+    # --- invariantit ---
+    def check_rollover(self, due):
+        """Keskiyön ajon jälkeen jokaisella ajon vyöhykkeen käyttäjällä on paikallinen päivä."""
+        for part in self.wab.partitions:
+            for uid, record in part.timezones.users_at(due):
+                local = due.astimezone(part.timezones.zone_of(uid)).date().isoformat()
+                if record.last_date is not None and record.last_date != local:
+                    self.violation("rollover", f"käyttäjä {uid}: {record.last_date} != {local}")
+
+    def check(self):
+        store = self.home.store
+        timezones = self.home.timezones
+        now = self.now()
+        for uid, model in self.models.items():
+            record = store.find_user(uid)
+            if record is None:
+                self.violation("points", f"käyttäjä {uid} puuttuu")
+                continue
+            model.follow(record.last_date, self.cfg)
+            local = timezones.local(uid, now)
+            if record.last_date > local.date().isoformat():
+                self.violation("future", f"käyttäjä {uid}: {record.last_date} > {local.date()}")
+            if record.points != model.points:
+                self.violation("points", f"käyttäjä {uid}: {record.points} != {model.points}")
+            if (record.streak, record.best_streak) != (model.streak(), model.best):
+                self.violation(
+                    "streak",
+                    f"käyttäjä {uid}: {record.streak}/{record.best_streak} != {model.streak()}/{model.best}",
+                )
+            yesterday = (date.fromisoformat(record.last_date) - timedelta(days=1)).isoformat()
+            if yesterday in model.days:
+                stored = set(record.history.get(yesterday) or ())
+                if stored != model.days[yesterday]:
+                    self.violation("history", f"käyttäjä {uid} {yesterday}: {sorted(stored)} != {sorted(model.days[yesterday])}")
+            self.check_inactive(uid, model, now)
+            if model.reminded:
+                self.check_reminders(uid, now)
+
+    def inactive(self, model, now):
+        """Malli: käyttäjä ei ole tehnyt mitään inactive_days päivään (päivän
+        marginaali vyöhyke-erojen takia)."""
+        days = self.cfg.dm_inactive_days
+        cutoff = now.date() - timedelta(days=days + 1)
+        return days > 0 and (model.last_active is None or model.last_active < cutoff)
+
+    def check_inactive(self, uid, model, now):
+        user = self.fake.users.get(uid)
+        sent = user.sent if user is not None else 0
+        new = sent - self.sent.get(uid, 0)
+        self.sent[uid] = sent
+        # muistutukset ovat käyttäjän itse pyytämiä, ne saa passiivinenkin
+        if new and not model.reminded and self.inactive(model, now):
+            self.violation("inactive", f"käyttäjä {uid}: {new} DM:ää, viimeksi aktiivinen {model.last_active}")
+
+    def expect_reminder(self, uid, record, cmd_args):
+        """Botin hyväksymä muistutus odotetaan perille erääntymishetkellään."""
+        text = " ".join(cmd_args[1:])  # kellonaika ja teksti; botti tallettaa tekstin
+        known = {t for _, t in self.expected.get(uid, [])}
+        zone = self.home.timezones.zone_of(uid)
+        for date_str, entries in record.reminders.items():
+            for entry in entries:
+                if entry["text"] not in known and text.endswith(entry["text"]):
+                    due = datetime.strptime(f"{date_str} {entry.get('time') or '18:00'}", "%Y-%m-%d %H:%M")
+                    self.expected.setdefault(uid, []).append((due.replace(tzinfo=zone), entry["text"]))
+                    self.models[uid].reminded = True
+
+    def check_reminders(self, uid, now):
+        """Erääntyneet muistutukset löytyvät käyttäjän DM:istä; LATE_GRACEa pidempi
+        alhaallaolo erääntymisen jälkeen saa poistaa muistutuksen toimittamatta."""
+        user = self.fake.users.get(uid)
+        inbox = [message for message in (user.inbox if user is not None else ()) if isinstance(message, str)]
+        pending = []
+        for due, text in self.expected.get(uid, []):
+            if due > now:
+                pending.append((due, text))
+            elif not any(text in message for message in inbox) and not self.expired(due):
+                self.violation("reminders", f"käyttäjä {uid}: {due:%Y-%m-%d %H:%M %Z} \"{text}\" ei tullut perille")
+        self.expected[uid] = pending
+        if not pending:
+            self.models[uid].reminded = False
+
+    def expired(self, due):
+        return any(start <= due + self.wab.LATE_GRACE and end - due > self.wab.LATE_GRACE for start, end in self.downtimes)
+
+    async def advance_to(self, moment):
+        """Siirtää kelloa (ei koskaan taaksepäin) ja antaa kellon herättämien
+        odottajien edetä ennen seuraavaa tapahtumaa."""
+        self.wab.clock.set(max(self.now(), moment))
+        await asyncio.sleep(0)
+
+    async def end_of_day(self):
+        row = self.row()
+        # myös ajojen ulkopuolella lähetetyt (käynnistyksen myöhästyneet muistutukset)
+        row["dms"] += self.fake.dms - self.dms
+        self.dms = self.fake.dms
+        for part in self.wab.partitions:
+            started = time.perf_counter()
+            await part.writer.sync()
+            row["write_ms"] += (time.perf_counter() - started) * 1000
+        self.check()
+
+    # --- pääsilmukka ---
+    async def run(self, start, end, restarts, script):
+        wab = self.wab
+        wab.clock.set(start)
+        self.instrument()
+        await self.boot()
+
+        if script is not None:
+            self.push(script)
+            generated = None
+        else:
+            for i in range(self.args.users):
+                uid = 1 + i
+                lapse = None
+                if self.rng.random() < LAPSE_SHARE:
+                    lapse = start.date() + timedelta(days=self.rng.randrange(1, max(2, self.args.days)))
+                self.profiles[uid] = Profile(
+                    zone=self.rng.choices(ZONES, ZONE_WEIGHTS)[0],
+                    active=self.rng.uniform(0.5, 0.98),
+                    routine=self.rng.uniform(0.4, 0.95),
+                    sessions=self.rng.randrange(1, 4),
+                    lapse=lapse,
+                )
+                if self.profiles[uid].zone:
+                    self.push([(start, uid, "timezone", [self.profiles[uid].zone])])
+            generated = start.astimezone(wab.FIN_TZ).date() - timedelta(days=1)
+
+        day = self.now().date()
+        while True:
+            # paikallinen päivä D alkaa aikaisintaan Suomen päivän D-1 iltapäivänä
+            while generated is not None and generated <= self.now().date():
+                generated += timedelta(days=1)
+                self.push(random_day(self.rng, self.cfg, self.profiles, generated, wab.FIN_TZ))
+
+            candidates = [moment for moment in (wab.scheduler.next_due(), self.queue[0][0] if self.queue else None) if moment]
+            if restarts:
+                candidates.append(restarts[0])
+            moment = min(candidates, default=end)
+            midnight = datetime.combine(day + timedelta(days=1), dtime(), tzinfo=wab.FIN_TZ)
+            if midnight <= moment or end <= moment:
+                # vuorokausi vaihtuu (Suomen aikaa) ennen seuraavaa tapahtumaa;
+                # kello ei koskaan palaa taaksepäin (alhaallaolo voi ylittää keskiyön)
+                await self.advance_to(min(midnight, end) - timedelta(microseconds=1))
+                await self.end_of_day()
+                if midnight >= end:
+                    break
+                await self.advance_to(midnight)
+                day = midnight.date()
+                continue
+            await self.advance_to(moment)
+
+            if restarts and restarts[0] <= moment:
+                restarts.pop(0)
+                await self.restart(timedelta(hours=self.args.downtime))
+            elif wab.scheduler.next_due() is not None and wab.scheduler.next_due() <= moment:
+                tasks = await wab.scheduler.run_pending(self.now())
+                await asyncio.gather(*tasks)
+            else:
+                _, _, uid, name, cmd_args = heapq.heappop(self.queue)
+                await self.act(uid, name, cmd_args)
+
+        for part in wab.partitions:
+            part.writer.flush()
+
+    # --- raportti ---
+    def report(self):
+        header = f"{'päivä':<10} {'UTC':>6} {'kom.':>6} {'ms':>8} {'ajot':>5} {'ms':>8} {'vaihto':>7} {'kirj.':>7} {'DM':>6} {'virh.':>5}"
+        print(header)
+        print("-" * len(header))
+        for day, row in sorted(self.days.items()):
+            offset = datetime.combine(day, dtime(12), tzinfo=self.wab.FIN_TZ).strftime("%z")
+            lost = f"  (menetetty {row['lost']})" if row["lost"] else ""
+            print(
+                f"{day.isoformat():<10} {offset:>6} {row['commands']:>6} {row['command_ms']:>8.1f} {row['jobs']:>5} "
+                f"{row['job_ms']:>8.1f} {row['rollover_ms']:>7.1f} {row['write_ms']:>7.1f} {row['dms']:>6} "
+                f"{row['violations']:>5}{lost}"
+            )
+        totals = {key: sum(row[key] for row in self.days.values()) for key in ("commands", "command_ms", "jobs", "job_ms", "dms")}
+        days = max(1, len(self.days))
+        print()
+        print(
+            f"Yhteensä {totals['commands']} komentoa ({totals['command_ms'] / max(1, totals['commands']):.3f} ms/komento), "
+            f"{totals['jobs']} ajoa, {totals['dms']} DM:ää; käsittelyaika {(totals['command_ms'] + totals['job_ms']) / days:.1f} ms/päivä."
+        )
+        if self.lost:
+            print(f"Alhaallaoloaikana menetettiin {self.lost} komentoa.")
+        inactive = sum(self.inactive(model, self.now()) for model in self.models.values())
+        if self.cfg.dm_inactive_days:
+            print(f"Passiivisia (ei tehtäviä {self.cfg.dm_inactive_days} päivään) lopussa {inactive}; raportti-DM:t heille ohitettu.")
+        if not self.violations:
+            print(f"Invariantit OK ({len(self.models)} käyttäjää).")
+            return True
+        print("RIKKOMUKSIA: " + ", ".join(f"{kind} {count}" for kind, count in sorted(self.violations.items())))
+        for line in self.examples:
+            print("  " + line)
+        return False
+
+    def summary(self):
+        return {
+            "users": len(self.models),
+            "days": {
+                day.isoformat(): {key: round(value, 3) for key, value in row.items()}
+                for day, row in sorted(self.days.items())
+            },
+            "violations": self.violations,
+            "examples": self.examples,
+            "lost": self.lost,
+            "inactive": sum(self.inactive(model, self.now()) for model in self.models.values()),
+        }
+
+
+# --------- AJO ---------
+async def simulate(args, log):
+    with contextlib.redirect_stdout(log):
+        import winter_arc_bot as wab
+        from fake_discord import FakeDiscord, install
+
+        fake = FakeDiscord(keep=True)  # muistutusten tarkistus etsii tekstit DM:istä
+        install(wab, fake)
+        wab.setup()
+
+    wab.settings.current.dm_inactive_days = args.inactive_days  # myös uudelleen ladatuille osioille
+    sim = Simulation(wab, fake, args)
+    fin = wab.FIN_TZ
+    start = datetime.combine(date.fromisoformat(args.start), dtime(), tzinfo=fin)
+    end = start + timedelta(days=args.days)
+    rng = random.Random(args.seed + 1)
+    restarts = sorted(start + timedelta(days=rng.uniform(1, args.days - 1)) for _ in range(args.restarts)) if args.days > 2 else []
+    script = read_script(args.script) if args.script else None
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        await sim.run(start, end, restarts, script)
+    wall = time.perf_counter() - started
+    ok = sim.report()
+    print(f"Simuloitiin {args.days} päivää {wall:.1f} sekunnissa ({args.backend}).")
+    return ok, sim.summary()
+
+
+def counters(result):
+    """Ajosta riippumattomat tulokset: päivien laskurit ilman kestoja."""
+    return {
+        "days": {day: {key: row[key] for key in COUNTERS} for day, row in result["days"].items()},
+        "violations": result["violations"],
+        "lost": result["lost"],
+        "inactive": result["inactive"],
+    }
+
+
+def check_determinism(argv):
+    """Ajaa simulaation kahdesti omissa prosesseissaan samoilla argumenteilla
+    ja vertaa päiväkohtaisia laskureita. Palauttaa True, jos ne ovat samat."""
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="winter_arc_twice_") as tmp:
+        for n in (1, 2):
+            out = Path(tmp) / f"run{n}.json"
+            proc = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), *argv, "--out", str(out)],
+                capture_output=True, text=True,
+            )
+            if not out.exists():
+                print(proc.stdout + proc.stderr)
+                print(f"Ajo {n} epäonnistui (paluuarvo {proc.returncode}).")
+                return False
+            runs.append(counters(json.loads(out.read_text(encoding="utf-8"))))
+    first, second = runs
+    differing = [
+        f"  {day}: {first['days'].get(day)} / {second['days'].get(day)}"
+        for day in sorted(set(first["days"]) | set(second["days"]))
+        if first["days"].get(day) != second["days"].get(day)
+    ]
+    if not differing and first == second:
+        dms = sum(row["dms"] for row in first["days"].values())
+        print(f"Deterministinen: kaksi ajoa, samat laskurit {len(first['days'])} päivältä ({dms} DM:ää).")
+        return True
+    print("EI DETERMINISTINEN: laskurit eroavat ajojen välillä")
+    for line in differing[:MAX_EXAMPLES]:
+        print(line)
+    for key in ("violations", "lost", "inactive"):
+        if first[key] != second[key]:
+            print(f"  {key}: {first[key]} / {second[key]}")
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", default=DEFAULT_START, help="ensimmäinen päivä (Suomen aikaa), YYYY-MM-DD")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backend", choices=["json", "sqlite", "binary"], default="json")
+    parser.add_argument("--restarts", type=int, default=2)
+    parser.add_argument("--downtime", type=float, default=2.0, help="tuntia alhaalla per uudelleenkäynnistys")
+    parser.add_argument("--inactive-days", type=int, default=7, help="raportti-DM:t vain näin monen päivän sisällä aktiivisille (0 = kaikille)")
+    parser.add_argument("--crash", action="store_true", help="uudelleenkäynnistys ilman tiivistystä (journal toistetaan)")
+    parser.add_argument("--script", help="JSONL-komennot satunnaisen käytön sijaan")
+    parser.add_argument("--out", help="päiväkohtaiset tulokset JSONina")
+    parser.add_argument("--keep", action="store_true", help="säilytä työhakemisto (data ja botin loki)")
+    parser.add_argument("--twice", action="store_true", help="aja kahdesti ja vertaa päiväkohtaisia laskureita")
+    args = parser.parse_args()
+    if args.twice:
+        sys.exit(0 if check_determinism([arg for arg in sys.argv[1:] if arg != "--twice"]) else 1)
+
+    workdir = Path(tempfile.mkdtemp(prefix="winter_arc_sim_"))
+    out = Path(args.out).resolve() if args.out else None
+    os.environ["WINTER_ARC_CONFIG"] = str(ROOT / "winter_arc_config.json")
+    os.environ["WINTER_ARC_METRICS_PORT"] = "0"
+    os.environ.pop("WINTER_ARC_DB", None)
+    os.environ.pop("WINTER_ARC_FORMAT", None)
+    if args.backend == "sqlite":
+        os.environ["WINTER_ARC_DB"] = str(workdir / "winter_arc.db")
+    elif args.backend == "binary":
+        os.environ["WINTER_ARC_FORMAT"] = "binary"
+    sys.path[:0] = [str(ROOT), str(Path(__file__).resolve().parent)]
+    os.chdir(workdir)
+    try:
+        with open(workdir / "bot.log", "w", encoding="utf-8") as log:
+            ok, result = asyncio.run(simulate(args, log))
+        if out is not None:
+            out.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+    finally:
+        os.chdir(ROOT)
+        if args.keep:
+            print(f"Työhakemisto: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import MutableMapping
+from datetime import date
+from pathlib import Path
+
+from history import History, Rollups, register_tasks
+from store import SCHEMA_VERSION, DataStore, JsonBackend, UserRecord, WriteBatch, delivery_issue
+
+# Binäärinen tilannekuva (.wab). Kaikki luvut little-endian.
+#
+#   otsake    32 tavua: MAGIC, formaatti, skeemaversio, käyttäjiä (n),
+#             metan sijainti ja pituus
+#   indeksi   sarakkeet: user_id Q[n], pisteet q[n], datan alku Q[n + 1],
+#             streak I[n], paras streak I[n], last_date I[n] (ordinaali, 0 = ei),
+#             liput B[n]
+#   data      per käyttäjä: historian alku I (ordinaali, 0 = tyhjä), päiviä I,
+#             maskit I[päiviä] ja loppuun JSON harvinaisille kentille
+#             (today, reminders, tz, delivery, historian extra ja rollups), jos niitä on
+#   meta      JSON
+#
+# Tiedosto avataan mmap:lla: latauksessa luetaan vain otsake ja indeksi
+# (pisteet pistetaulukkoon), ja käyttäjätietue puretaan vasta kun sitä
+# käytetään ensimmäisen kerran.
+MAGIC = b"WABS"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHIQQ")
+HEADER_SIZE = 32
+BLOB_HEADER = struct.Struct("<II")
+HAS_REMINDERS = 1
+HAS_TIMEZONE = 2
+HAS_EXTRA = 4  # historiassa bitittömiä tehtäviä (arkistointi tarkistaa ne)
+HAS_DELIVERY_ISSUE = 8  # DM-raportit pois tai toimitus epäonnistuu
+# Vanhin skeemaversio, jonka tiedosto luetaan sellaisenaan: versiot 4 ja 5
+# lisäsivät vain harvinaisia kenttiä (tz, delivery), joten rakenne on sama.
+MIN_SCHEMA_VERSION = 3
+
+
+def _le(values):
+    """Taulukko tiedoston tavujärjestykseen (little-endian)."""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def _column(typecode, buffer, start, count):
+    values = array(typecode)
+    values.frombytes(buffer[start:start + count * values.itemsize])
+    return _le(values), start + count * values.itemsize
+
+
+def _ordinal(date_str):
+    return date.fromisoformat(date_str).toordinal() if date_str else 0
+
+
+def encode_record(record):
+    """Tietue -> (pisteet, streak, paras streak, last_date, liput, data)."""
+    history = record.history
+    masks = history.masks if history.start is not None else array("I")
+    end = len(masks)
+    while end and not masks[end - 1]:
+        end -= 1
+    rare = {}
+    if record.today:
+        rare["today"] = record.today
+    if record.reminders:
+        rare["reminders"] = record.reminders
+    if record.tz:
+        rare["tz"] = record.tz
+    if record.delivery:
+        rare["delivery"] = record.delivery
+    if history.extra:
+        rare["extra"] = history.extra
+    if history.rollups is not None:
+        rare["rollups"] = history.rollups.encode()
+    blob = (
+        BLOB_HEADER.pack(history.start if end else 0, end)
+        + _le(masks[:end]).tobytes()
+        + (json.dumps(rare, ensure_ascii=False).encode("utf-8") if rare else b"")
+    )
+    flags = (
+        (HAS_REMINDERS if record.reminders else 0)
+        | (HAS_TIMEZONE if record.tz else 0)
+        | (HAS_EXTRA if history.extra else 0)
+        | (HAS_DELIVERY_ISSUE if delivery_issue(record) else 0)
+    )
+    return record.points, record.streak, record.best_streak, _ordinal(record.last_date), flags, blob
+
+
+def build_snapshot(meta, rows):
+    """rows: (user_id, pisteet, streak, paras, last_date, liput, data) -> tiedoston osat."""
+    n = len(rows)
+    ids, points, offsets = array("Q"), array("q"), array("Q")
+    streaks, bests, lasts, flags = array("I"), array("I"), array("I"), array("B")
+    blobs = []
+    position = HEADER_SIZE + n * (8 + 8 + 8 + 4 + 4 + 4 + 1) + 8
+    for user_id, pts, streak, best, last, flag, blob in rows:
+        ids.append(user_id)
+        points.append(pts)
+        offsets.append(position)
+        streaks.append(streak)
+        bests.append(best)
+        lasts.append(last)
+        flags.append(flag)
+        blobs.append(blob)
+        position += len(blob)
+    offsets.append(position)
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, SCHEMA_VERSION, n, position, len(meta_bytes))
+    parts = [header.ljust(HEADER_SIZE, b"\0")]
+    parts += [_le(column).tobytes() for column in (ids, points, offsets, streaks, bests, lasts, flags)]
+    parts += blobs
+    parts.append(meta_bytes)
+    return parts
+
+
+def write_parts(path, parts):
+    """Kuten store.write_snapshot: väliaikaistiedosto ja atominen vaihto."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        for part in parts:
+            f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+        size = os.fstat(f.fileno()).st_size
+    os.replace(tmp_path, path)
+    return size
+
+
+# --------- MUISTIKARTOITETTU TILANNEKUVA ---------
+class Snapshot:
+    """Avattu .wab-tiedosto: indeksin sarakkeet muistissa, käyttäjädata mmap:ssa."""
+
+    def __init__(self, path):
+        self.meta = {}
+        self.ids = array("Q")
+        self.positions = {}  # user_id -> rivi indeksissä
+        self.size = 0
+        self._mm = None
+        if not path.exists() or path.stat().st_size == 0:
+            return
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        self.size = len(mm)
+        magic, version, schema, n, meta_at, meta_len = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise RuntimeError(f"{path}: tuntematon tiedostomuoto")
+        if not MIN_SCHEMA_VERSION <= schema <= SCHEMA_VERSION:
+            raise RuntimeError(
+                f"{path}: skeemaversio {schema}, botti {SCHEMA_VERSION}. "
+                "Muunna JSONiksi (python binary_backend.py) ja takaisin uudella versiolla."
+            )
+        at = HEADER_SIZE
+        self.ids, at = _column("Q", mm, at, n)
+        self.points, at = _column("q", mm, at, n)
+        self.offsets, at = _column("Q", mm, at, n + 1)
+        self.streaks, at = _column("I", mm, at, n)
+        self.bests, at = _column("I", mm, at, n)
+        self.lasts, at = _column("I", mm, at, n)
+        self.flags, at = _column("B", mm, at, n)
+        self.positions = dict(zip(self.ids, range(n)))
+        self.meta = json.loads(mm[meta_at:meta_at + meta_len].decode("utf-8"))
+
+    def row(self, user_id):
+        """Käyttäjän rivi uuteen tilannekuvaan purkamatta dataa."""
+        i = self.positions[user_id]
+        blob = self._mm[self.offsets[i]:self.offsets[i + 1]]
+        return self.points[i], self.streaks[i], self.bests[i], self.lasts[i], self.flags[i], blob
+
+    def record(self, user_id):
+        i = self.positions[user_id]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        first, days = BLOB_HEADER.unpack_from(self._mm, start)
+        masks, at = _column("I", self._mm, start + BLOB_HEADER.size, days)
+        rare = json.loads(self._mm[at:end].decode("utf-8")) if at < end else {}
+        rollups = Rollups.decode(rare["rollups"]) if "rollups" in rare else None
+        if days:
+            history = History(first or None, masks, rare.get("extra", {}), rollups)
+        else:
+            history = History(extra=rare.get("extra", {}), rollups=rollups)
+        last = self.lasts[i]
+        return UserRecord(
+            points=self.points[i],
+            today=rare.get("today", {}),
+            last_date=date.fromordinal(last).isoformat() if last else None,
+            streak=self.streaks[i],
+            best_streak=self.bests[i],
+            history=history,
+            reminders=rare.get("reminders", {}),
+            tz=rare.get("tz"),
+            delivery=rare.get("delivery", {}),
+        )
+
+
+class LazyUsers(MutableMapping):
+    """DataStore.users binääritilannekuvasta: tietue puretaan mmap:sta
+    ensimmäisellä käyttökerralla ja pidetään sen jälkeen tavallisena oliona.
+    Läpikäynti (items, values) purkaa kaikki."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._loaded = {}
+        self._unread = set(snapshot.positions)
+
+    def __getitem__(self, user_id):
+        record = self._loaded.get(user_id)
+        if record is None:
+            if user_id not in self._unread:
+                raise KeyError(user_id)
+            record = self._loaded[user_id] = self.snapshot.record(user_id)
+            self._unread.discard(user_id)
+        return record
+
+    def __setitem__(self, user_id, record):
+        self._loaded[user_id] = record
+        self._unread.discard(user_id)
+
+    def __delitem__(self, user_id):
+        if user_id in self._loaded:
+            del self._loaded[user_id]
+        else:
+            self._unread.remove(user_id)
+
+    def __contains__(self, user_id):
+        return user_id in self._loaded or user_id in self._unread
+
+    def __iter__(self):
+        return iter(list(self._loaded) + list(self._unread))
+
+    def __len__(self):
+        return len(self._loaded) + len(self._unread)
+
+    @property
+    def materialized(self):
+        return len(self._loaded)
+
+    def last_date(self, user_id):
+        """Käyttäjän last_date purkamatta tietuetta (päivänvaihto)."""
+        record = self._loaded.get(user_id)
+        if record is not None:
+            return record.last_date
+        last = self.snapshot.lasts[self.snapshot.positions[user_id]]
+        return date.fromordinal(last).isoformat() if last else None
+
+    def points(self):
+        """(user_id, pisteet) kaikille purkamatta tietueita (pistetaulukko)."""
+        snapshot = self.snapshot
+        for user_id in self._unread:
+            yield user_id, snapshot.points[snapshot.positions[user_id]]
+        for user_id, record in self._loaded.items():
+            yield user_id, record.points
+
+    def _flagged(self, flag, has):
+        snapshot = self.snapshot
+        candidates = [user_id for user_id in self._unread if snapshot.flags[snapshot.positions[user_id]] & flag]
+        for user_id, record in list(self._loaded.items()):
+            if has(record):
+                yield user_id, record
+        for user_id in candidates:
+            yield user_id, self[user_id]
+
+    def with_reminders(self):
+        """(user_id, tietue) vain niille, joilla voi olla muistutuksia."""
+        return self._flagged(HAS_REMINDERS, lambda record: record.reminders)
+
+    def with_timezone(self):
+        """(user_id, tietue) vain !timezone-asetuksen tehneille."""
+        return self._flagged(HAS_TIMEZONE, lambda record: record.tz)
+
+    def with_delivery_issues(self):
+        """(user_id, tietue) niille, joiden DM-raportit ovat pois tai epäonnistuvat."""
+        return self._flagged(HAS_DELIVERY_ISSUE, delivery_issue)
+
+    def with_history_before(self, ordinal):
+        """(user_id, tietue) niille, joiden historia alkaa ennen päivää ordinal.
+        Purkamattomilta luetaan vain datan alun historian aloituspäivä."""
+        snapshot = self.snapshot
+        cut = date.fromordinal(ordinal).isoformat()
+
+        def old(record):
+            history = record.history
+            return (history.start or ordinal) < ordinal or any(d < cut for d in history.extra)
+
+        candidates = []
+        for user_id in self._unread:
+            i = snapshot.positions[user_id]
+            first, days = BLOB_HEADER.unpack_from(snapshot._mm, snapshot.offsets[i])
+            if days and first < ordinal or snapshot.flags[i] & HAS_EXTRA:
+                candidates.append(user_id)
+        for user_id, record in list(self._loaded.items()):
+            if old(record):
+                yield user_id, record
+        for user_id in candidates:
+            record = self[user_id]
+            if old(record):
+                yield user_id, record
+
+
+# --------- BINÄÄRITALLENNUS (TILANNEKUVA + JOURNAL) ---------
+class BinaryBackend(JsonBackend):
+    """Kuten JsonBackend (sama journal ja kyselyt), mutta tilannekuva on
+    muistikartoitettu binääritiedosto. Käynnistys ei jäsennä koko dataa:
+    vain indeksi luetaan, ja käyttäjät puretaan laiskasti.
+
+    Tiivistyksessä muuttumattomien käyttäjien data kopioidaan tavuina
+    vanhasta tiedostosta; vain muuttuneet käyttäjät serialisoidaan.
+    """
+
+    def __init__(self, path, journal_path=None, compact_every=1000):
+        super().__init__(path, journal_path, compact_every)
+        self.snapshot = None
+
+    def load(self):
+        # vanha mmap jää auki, kunnes kaikki siihen viittaavat on vapautettu
+        self.snapshot = Snapshot(self.path)
+        self.bytes_read = self.snapshot.size
+        meta = self.snapshot.meta
+        meta["schema_version"] = SCHEMA_VERSION
+        register_tasks(meta.get("task_bits", ()))
+        users = LazyUsers(self.snapshot)
+        self._encoded = {}
+
+        events = self.journal.read(after_seq=meta.get("journal_seq", 0))
+        # journalista toistettavat muuttavat tietuetta: ne serialisoidaan uudelleen
+        self._stale = {event["user"] for event in events if event.get("user") is not None}
+        self._stale.update(user_id for event in events for user_id in event.get("users", ()))
+        self._journal_len = len(events)
+        if self.journal.path.exists():
+            self.bytes_read += self.journal.path.stat().st_size
+        return users, meta, events
+
+    def _snapshot(self, store):
+        for user_id in self._stale:
+            record = store.users.get(user_id)
+            if record is None:
+                self._encoded.pop(user_id, None)
+            else:
+                self._encoded[user_id] = encode_record(record)
+        self._stale.clear()
+        store.meta["journal_seq"] = store.seq
+        rows = []
+        for user_id in store.users:
+            row = self._encoded.get(user_id)
+            if row is None and user_id in self.snapshot.positions:
+                # ei muuttunut latauksen jälkeen: data suoraan vanhasta tiedostosta
+                row = self.snapshot.row(user_id)
+            elif row is None:
+                # luotu latauksen jälkeen ilman omaa tapahtumaa (esim. get_user)
+                row = encode_record(store.users[user_id])
+            rows.append((user_id,) + row)
+        return build_snapshot(store.meta, rows)
+
+    def write(self, batch):
+        written = 0
+        if batch.events:
+            written += self.journal.append(batch.events)
+        if batch.parts is not None:
+            written += write_parts(self.path, batch.parts)
+            self.journal.truncate()
+        return written
+
+
+# --------- MUUNNOKSET JSON <-> BINÄÄRI ---------
+def convert(source_path, target_path):
+    """Lukee tilannekuvan journaleineen ja kirjoittaa sen toiseen muotoon;
+    muoto päätellään päätteestä (.wab = binääri, muuten JSON)."""
+
+    def backend(path):
+        return BinaryBackend(path) if Path(path).suffix == ".wab" else JsonBackend(path)
+
+    source = DataStore(backend(source_path))
+    source.load()
+    target = backend(target_path)
+    target.load()
+    store = DataStore(target)
+    store.users = {user_id: source.users[user_id] for user_id in source.users}
+    store.meta = dict(source.meta)
+    store.seq = 0
+    target._stale = set(store.users)
+    target.write(WriteBatch([], target._snapshot(store)))
+    source.archive.copy_to(store.archive.directory)
+    return len(store.users)
+
+
+if __name__ == "__main__":
+    # python binary_backend.py winter_arc_data.json winter_arc_data.wab  (tai toisin päin)
+    if len(sys.argv) != 3:
+        print("Käyttö: python binary_backend.py <lähde.json|.wab> <kohde.wab|.json>")
+        sys.exit(1)
+    count = convert(sys.argv[1], sys.argv[2])
+    print(f"Muunnettiin {count} käyttäjää tiedostoon {sys.argv[2]}.")
@@ -0,0 +1,267 @@
+import asyncio
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+
+import discord
+
+from clock import Clock
+
+# Epäonnistuneen käyttäjän uusi yritys aikaisintaan BACKOFF_BASE * 2^(n - 1)
+# päästä n:nnen peräkkäisen epäonnistumisen jälkeen, enintään BACKOFF_MAX.
+# Pitkä odotus vain pysyville syille (DM:t estetty, käyttäjää ei ole);
+# tilapäiset (Discordin 5xx, verkko) alkavat TRANSIENT_BASEsta ja kasvavat
+# enintään BACKOFF_BASEen.
+BACKOFF_BASE = timedelta(hours=12)
+BACKOFF_MAX = timedelta(days=14)
+TRANSIENT_BASE = timedelta(minutes=5)
+PERMANENT_REASONS = ("forbidden", "not_found")
+# fetch_user-kutsulla haettuja käyttäjiä pidetään muistissa enintään näin monta (LRU)
+USER_CACHE_SIZE = 5000
+
+
+# --------- NOPEUSRAJOITIN ---------
+class TokenBucket:
+    """Yksinkertainen token bucket: enintään `rate` pyyntöä sekunnissa,
+    hetkellisesti `burst` kerralla. Pitää DM-ryöpyt selvästi Discordin
+    globaalin rajan (50 pyyntöä / s) alla, jolloin 429-vastauksia ei synny."""
+
+    def __init__(self, rate, burst=None, clock=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.clock = clock or Clock()
+        self._tokens = self.capacity
+        self._updated = self.clock.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = self.clock.monotonic()
+                self._tokens = min(self.capacity, self._tokens + max(now - self._updated, 0.0) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await self.clock.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastResult:
+    __slots__ = ("name", "delivered", "failed", "skipped", "skipped_by", "duration")
+
+    def __init__(self, name):
+        self.name = name
+        self.delivered = 0
+        self.failed = 0
+        self.skipped = 0
+        self.skipped_by = {}  # syy -> ohitettuja (empty, off, backoff, inactive, not_found)
+        self.duration = 0.0
+
+    def skip(self, reason):
+        self.skipped += 1
+        self.skipped_by[reason] = self.skipped_by.get(reason, 0) + 1
+
+    def __str__(self):
+        reasons = ", ".join(f"{reason} {n}" for reason, n in sorted(self.skipped_by.items()))
+        return (
+            f"{self.name}: {self.delivered} toimitettu, {self.failed} epäonnistui, "
+            f"{self.skipped} ohitettu{f' ({reasons})' if reasons else ''}, {self.duration:.1f} s"
+        )
+
+
+# --------- JAKELUN TILA ---------
+def failure_reason(error):
+    """Poikkeus -> lyhyt syy tallennettavaksi (esim. "forbidden" = DM:t estetty)."""
+    if isinstance(error, discord.Forbidden):
+        return "forbidden"
+    if isinstance(error, discord.NotFound):
+        return "not_found"
+    if isinstance(error, discord.HTTPException):
+        return f"http_{error.status}"
+    return type(error).__name__
+
+
+def last_active(record):
+    """Viimeisin päivä (ordinaali), jona käyttäjä merkitsi jotain tehdyksi, tai None."""
+    if record.last_date is not None and any(record.today.values()):
+        return date.fromisoformat(record.last_date).toordinal()
+    return record.history.last_day()
+
+
+class Deliveries:
+    """Osion käyttäjien DM-jakelun tila (UserRecord.delivery).
+
+    Käyttäjä ohitetaan ilman yhtään API-kutsua, jos hän on kieltänyt
+    raportit (!notifications off), edellinen epäonnistuminen on vielä
+    backoff-ajan sisällä, tai hän ei ole tehnyt mitään inactive_days
+    päivään. Tulokset tallennetaan yhtenä tapahtumana per ajo, ja
+    onnistuminen kirjataan vain kerran päivässä tai epäonnistumisten jälkeen.
+    """
+
+    def __init__(self, store, inactive_days=0):
+        self.store = store
+        self.inactive_days = inactive_days  # 0 = ei rajaa
+
+    def skip_reason(self, user_id, now, report=True):
+        """Syy ohittaa käyttäjä nyt, tai None. report=False: käyttäjän itse
+        pyytämä viesti (muistutus), jota opt-out ja passiivisuus eivät estä."""
+        record = self.store.find_user(user_id)
+        if record is None:
+            return None
+        delivery = record.delivery
+        if report and delivery.get("off"):
+            return "off"
+        retry = delivery.get("retry")
+        if retry is not None and now < datetime.fromisoformat(retry):
+            return "backoff"
+        if report and self.inactive_days:
+            # last_date vaihtuu joka yö kaikille, joten aktiivisuus katsotaan tehdyistä tehtävistä
+            last = last_active(record)
+            if last is None or last < (now.date() - timedelta(days=self.inactive_days)).toordinal():
+                return "inactive"
+        return None
+
+    def record(self, now, delivered, failed):
+        """Kirjaa ajon tulokset: delivered = [user_id], failed = [(user_id, syy)]."""
+        today = now.date().isoformat()
+        ok = []
+        for user_id in delivered:
+            delivery = self.store.users[user_id].delivery
+            if delivery.get("ok") != today or "failures" in delivery:
+                ok.append(user_id)
+        failures = []
+        for user_id, reason in failed:
+            n = self.store.users[user_id].delivery.get("failures", 0) + 1
+            if reason in PERMANENT_REASONS:
+                wait = min(BACKOFF_BASE * 2 ** min(n - 1, 16), BACKOFF_MAX)
+            else:
+                wait = min(TRANSIENT_BASE * 2 ** min(n - 1, 16), BACKOFF_BASE)
+            failures.append([user_id, reason, (now + wait).astimezone(timezone.utc).isoformat()])
+        if ok or failures:
+            self.store.apply(
+                "deliveries_recorded", date=today, ok=ok, failed=failures,
+                users=ok + [user_id for user_id, _, _ in failures],
+            )
+
+    def counts(self, now):
+        """Tilannekuva !perf-komentoon: {"off": n, "backoff": n, "failing": n}."""
+        counts = {"off": 0, "backoff": 0, "failing": 0}
+        for _, record in self.store.with_delivery_issues():
+            delivery = record.delivery
+            counts["off"] += bool(delivery.get("off"))
+            counts["failing"] += "failures" in delivery
+            retry = delivery.get("retry")
+            counts["backoff"] += retry is not None and now < datetime.fromisoformat(retry)
+        return counts
+
+
+# --------- DM-JAKELU ---------
+class Broadcaster:
+    """Yhteinen DM-jakelu ajastetuille raporteille.
+
+    Käyttäjät haetaan ensin botin välimuistista (bot.get_user) ja vasta
+    sitten REST-kutsulla; haetut käyttäjäoliot pidetään tallessa seuraavia
+    ajoja varten (enintään cache_size, vähiten käytetyt pois; NotFound
+    poistaa heti). Viestit lähetetään `concurrency` rinnakkaisella
+    lähettäjällä token bucketin tahdissa.
+    """
+
+    def __init__(self, bot, concurrency=8, rate=25.0, metrics=None, clock=None, cache_size=USER_CACHE_SIZE):
+        self.bot = bot
+        self.clock = clock or Clock()
+        self.metrics = metrics  # metrics.Metrics: viestit ajon ja tuloksen mukaan
+        self.concurrency = concurrency
+        self.limiter = TokenBucket(rate, clock=self.clock)
+        self.last_results = {}  # ajon nimi -> viimeisin BroadcastResult
+        self.cache_size = cache_size
+        self._users = OrderedDict()  # fetch_user-kutsulla haetut käyttäjät (LRU)
+
+    async def resolve(self, user_id):
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            return user
+        user = self._users.get(user_id)
+        if user is not None:
+            self._users.move_to_end(user_id)
+            return user
+        await self.limiter.acquire()
+        user = await self.bot.fetch_user(user_id)
+        self._users[user_id] = user
+        while len(self._users) > self.cache_size:
+            self._users.popitem(last=False)
+        return user
+
+    async def send(self, name, messages, deliveries=None, now=None, report=True, outcomes=None):
+        """Lähettää viestit. messages: iteroitava (user_id, teksti);
+        teksti None tarkoittaa, ettei käyttäjälle ole tällä kertaa mitään.
+        Tekstin sijaan voi antaa async-funktion, joka palauttaa send()-
+        parametrit (esim. liitetiedosto, jonka voi lähettää vain kerran).
+
+        deliveries (Deliveries): ohitettavat käyttäjät karsitaan ennen
+        kutsuja, ja onnistumiset ja epäonnistumiset kirjataan ajon lopuksi.
+        report=False: käyttäjän itse pyytämä viesti (ks. Deliveries.skip_reason).
+        outcomes (dict): täytetään user_id -> None (toimitettu) tai ohitus- tai
+        epäonnistumissyy, kun viestin jatkotoimet riippuvat perillemenosta."""
+        result = BroadcastResult(name)
+        started = self.clock.monotonic()
+        now = now or self.clock.now(timezone.utc)
+        queue = enumerate(messages)
+        delivered, failed = [], []  # (järjestysnumero, ...): kirjataan syötteen järjestyksessä
+        outcomes = {} if outcomes is None else outcomes
+
+        async def worker():
+            for index, (user_id, content) in queue:
+                if content is None:
+                    result.skip("empty")
+                    continue
+                if deliveries is not None:
+                    reason = deliveries.skip_reason(user_id, now, report)
+                    if reason is not None:
+                        result.skip(reason)
+                        outcomes[user_id] = reason
+                        continue
+                try:
+                    user = await self.resolve(user_id)
+                except Exception as error:
+                    # esim. käyttäjää ei ole enää (NotFound)
+                    result.failed += 1
+                    failed.append((index, user_id, failure_reason(error)))
+                    outcomes[user_id] = failure_reason(error)
+                    continue
+                try:
+                    kwargs = await content() if callable(content) else {"content": content}
+                except Exception as error:
+                    # viestin koostaminen epäonnistui (esim. kuvaaja): ei käyttäjän vika
+                    result.failed += 1
+                    print(f"[broadcast] {name}: viesti käyttäjälle {user_id}: {error!r}")
+                    outcomes[user_id] = failure_reason(error)
+                    continue
+                try:
+                    await self.limiter.acquire()
+                    await user.send(**kwargs)
+                    result.delivered += 1
+                    delivered.append((index, user_id))
+                    outcomes[user_id] = None
+                except Exception as error:
+                    result.failed += 1  # esim. DM estetty (Forbidden)
+                    failed.append((index, user_id, failure_reason(error)))
+                    outcomes[user_id] = failure_reason(error)
+                    if outcomes[user_id] == "not_found":
+                        self._users.pop(user_id, None)  # käyttäjä poistunut
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        if deliveries is not None:
+            # lähettäjien valmistumisjärjestys vaihtelee; tapahtumaloki ei saa vaihdella
+            deliveries.record(
+                now,
+                [user_id for _, user_id in sorted(delivered)],
+                [(user_id, reason) for _, user_id, reason in sorted(failed)],
+            )
+        result.duration = self.clock.monotonic() - started
+        self.last_results[name] = result
+        if self.metrics is not None:
+            for outcome in ("delivered", "failed", "skipped"):
+                self.metrics.inc("broadcast_messages_total", getattr(result, outcome), job=name, result=outcome)
+            for reason, n in result.skipped_by.items():
+                self.metrics.inc("broadcast_skipped_total", n, job=name, reason=reason)
+        print(f"[broadcast] {result}")
+        return result
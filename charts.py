@@ -0,0 +1,191 @@
+import asyncio
+import multiprocessing
+import struct
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from history import mask_value
+
+# Kuvat piirretään ilman ulkoisia kirjastoja: suorakulmiot tavutaulukkoon ja
+# PNG-pakkaus zlibillä. Tekstit (otsikot, akselit) kulkevat viestin mukana.
+# Piirtofunktiot ajetaan prosessipoolissa; ne saavat historian tiiviinä
+# array('I')-tavuina (4 tavua / päivä), eivät sanakirjoina.
+
+BACKGROUND = (255, 255, 255)
+GRID = (230, 232, 236)
+HEAT = ((235, 237, 240), (155, 233, 168), (64, 196, 99), (48, 161, 78), (33, 110, 57))
+AREA = (84, 134, 235)
+LINE = (40, 80, 180)
+BARS = (64, 196, 99)
+
+CELL = 11  # heatmapin ruutu ja väli pikseleinä
+GAP = 2
+
+
+# --------- PIIRTO ---------
+class Canvas:
+    __slots__ = ("width", "height", "pixels")
+
+    def __init__(self, width, height, colour=BACKGROUND):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(bytes(colour) * (width * height))
+
+    def fill(self, x0, y0, x1, y1, colour):
+        """Täyttää suorakulmion [x0, x1) x [y0, y1)."""
+        x0, x1 = max(x0, 0), min(x1, self.width)
+        if x1 <= x0:
+            return
+        row = bytes(colour) * (x1 - x0)
+        for y in range(max(y0, 0), min(y1, self.height)):
+            start = (y * self.width + x0) * 3
+            self.pixels[start:start + len(row)] = row
+
+    def png(self):
+        stride = self.width * 3
+        raw = b"".join(
+            b"\x00" + bytes(self.pixels[y * stride:(y + 1) * stride]) for y in range(self.height)
+        )
+
+        def chunk(kind, data):
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+        header = struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)  # 8-bit RGB
+        return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+def _masks(data):
+    masks = array("I")
+    masks.frombytes(data)
+    return masks
+
+
+def heatmap(data, first, days):
+    """GitHub-tyylinen kalenteri: sarake = viikko (ma–su), ruudun väri =
+    päivän tehtävien määrä suhteessa jakson parhaaseen päivään.
+    first = ensimmäisen päivän ordinaali, days = piirrettävien päivien määrä
+    (loput, esim. tulevat päivät, jätetään tyhjiksi)."""
+    masks = _masks(data)
+    counts = [mask.bit_count() for mask in masks[:days]]
+    best = max(counts, default=0)
+    offset = date.fromordinal(first).weekday()
+    weeks = (offset + len(masks) + 6) // 7
+    canvas = Canvas(GAP + weeks * (CELL + GAP), GAP + 7 * (CELL + GAP))
+    for i in range(len(masks)):
+        if i < days:
+            count = counts[i]
+            level = 0 if not count else min(4, 1 + (count * 4 - 1) // best)
+            colour = HEAT[level]
+        else:
+            colour = GRID
+        column, row = divmod(offset + i, 7)
+        x, y = GAP + column * (CELL + GAP), GAP + row * (CELL + GAP)
+        canvas.fill(x, y, x + CELL, y + CELL, colour)
+    return canvas.png()
+
+
+def progress(data, weights, width=600, height=220):
+    """Pisteet ajan yli: yläosassa kertyneet pisteet alueena, alaosassa
+    päivän pisteet pylväinä. weights = [(bitti, pisteet)] kuten mask_value."""
+    masks = _masks(data)
+    daily = [mask_value(mask, weights) for mask in masks]
+    total = 0
+    cumulative = []
+    for points in daily:
+        total += points
+        cumulative.append(total)
+
+    canvas = Canvas(width, height)
+    margin = 8
+    split = int(height * 0.68)
+    top, bottom = margin, split - margin // 2
+    for k in range(5):  # vaakaviivat neljänneksittäin
+        y = top + (bottom - top) * k // 4
+        canvas.fill(margin, y, width - margin, y + 1, GRID)
+    canvas.fill(margin, height - margin, width - margin, height - margin + 1, GRID)
+    if not daily:
+        return canvas.png()
+
+    step = (width - 2 * margin) / len(daily)
+    peak = max(total, 1)
+    best = max(max(daily), 1)
+    for i, (points, value) in enumerate(zip(daily, cumulative)):
+        x0 = margin + int(i * step)
+        x1 = max(margin + int((i + 1) * step), x0 + 1)
+        y = bottom - int((bottom - top) * value / peak)
+        canvas.fill(x0, y, x1, bottom, AREA)
+        canvas.fill(x0, y, x1, min(y + 2, bottom), LINE)
+        if points:
+            bar = max(int((height - margin - split) * points / best), 1)
+            canvas.fill(x0 + (1 if x1 - x0 > 2 else 0), height - margin - bar, x1, height - margin, BARS)
+    return canvas.png()
+
+
+# --------- PROSESSIPOOLI JA VÄLIMUISTI ---------
+class ChartRenderer:
+    """Renderöi kuvat prosessipoolissa, jottei event loop pysähdy, ja pitää
+    valmiit PNG:t LRU-välimuistissa. Avaimeen kuuluu käyttäjän viimeisimmän
+    muutoksen järjestysnumero, joten vanhentunut kuva ei koskaan palaudu.
+    Sama avain yhtä aikaa pyydettynä renderöidään vain kerran."""
+
+    def __init__(self, workers=2, cache_size=256, metrics=None):
+        self.workers = workers
+        self.cache_size = cache_size
+        self.metrics = metrics
+        self._cache = OrderedDict()  # avain -> PNG-tavut
+        self._pending = {}           # avain -> asyncio.Future (renderöinti kesken)
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn: ei kopioida kirjoitussäikeitä ja lukkoja lapsiprosesseihin
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def render(self, key, fn, *args):
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+            self._count("hit")
+            return png
+        pending = self._pending.get(key)
+        if pending is not None:
+            self._count("hit")
+            return await asyncio.shield(pending)
+
+        self._count("miss")
+        loop = asyncio.get_running_loop()
+        future = self._pending[key] = loop.create_future()
+        started = time.perf_counter()
+        try:
+            png = await loop.run_in_executor(self._executor(), fn, *args)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # merkitään käsitellyksi, vaikka kukaan muu ei odottaisi
+            raise
+        else:
+            future.set_result(png)
+        finally:
+            del self._pending[key]
+        if self.metrics is not None:
+            self.metrics.observe("chart_seconds", time.perf_counter() - started, chart=fn.__name__)
+        self._cache[key] = png
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return png
+
+    def _count(self, result):
+        if self.metrics is not None:
+            self.metrics.inc("chart_cache_total", result=result)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,68 @@
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+
+
+# --------- KELLO ---------
+class Clock:
+    """Botin kello: kaikki "mikä hetki nyt on" -kyselyt kulkevat tämän kautta
+    (ajastin, käyttäjien paikallinen aika, ajot).
+
+    Oletuksena järjestelmän aika. set() pysäyttää kellon annettuun hetkeen,
+    minkä jälkeen aika etenee vain set()- ja advance()-kutsuilla; näin
+    benchmarks/simulate.py ajaa viikkoja päivänvaihtoja ja ajastettuja ajoja
+    sekunneissa. Myös odotukset (sleep) ja välien mittaus (monotonic)
+    kulkevat kellon kautta: pysäytetyllä kellolla sleep() palaa vasta, kun
+    kelloa on siirretty yli herätyshetken. Vain mittareihin kirjattavat
+    kestot (time.perf_counter) käyttävät aina oikeaa aikaa.
+    """
+
+    def __init__(self):
+        self.virtual = None  # pysäytetty hetki (UTC) tai None = järjestelmän aika
+        self._sleepers = []  # (herätyshetki, järjestysnumero, future) pysäytetyllä kellolla
+        self._order = itertools.count()
+
+    def now(self, tz):
+        if self.virtual is None:
+            return datetime.now(tz)
+        return self.virtual.astimezone(tz)
+
+    def monotonic(self):
+        """Sekunteja mielivaltaisesta alkuhetkestä (välien mittaamiseen)."""
+        if self.virtual is None:
+            return time.monotonic()
+        return self.virtual.timestamp()
+
+    async def sleep(self, seconds):
+        if self.virtual is None:
+            await asyncio.sleep(seconds)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.virtual + timedelta(seconds=max(seconds, 0.0)), next(self._order), future))
+        self._wake()
+        await future
+
+    def set(self, moment):
+        """Siirtää kellon hetkeen moment (aikavyöhyketietoinen)."""
+        self.virtual = moment.astimezone(timezone.utc)
+        self._wake()
+
+    def advance(self, delta):
+        if self.virtual is None:
+            raise RuntimeError("advance() vain pysäytetylle kellolle (kutsu ensin set())")
+        self.virtual += delta
+        self._wake()
+
+    def reset(self):
+        """Takaisin järjestelmän aikaan: odottajat herätetään heti."""
+        self.virtual = None
+        self._wake()
+
+    def _wake(self):
+        # herätysjärjestys: herätyshetki, sitten sleep()-kutsujen järjestys
+        while self._sleepers and (self.virtual is None or self._sleepers[0][0] <= self.virtual):
+            _, _, future = heapq.heappop(self._sleepers)
+            if not future.done():
+                future.set_result(None)
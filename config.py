@@ -0,0 +1,173 @@
+import json
+from pathlib import Path
+
+from history import BIT, MAX_TASKS, TASK_BITS, StatsConfig, mask_of, register_tasks, weights_of
+from plans import DAY_NAMES, PlanRenderer
+
+CHANNEL_KEYS = ("today_plan", "week_vision", "leaderboard")
+HISTORY_HOT_DAYS = 120  # oletus: vanhemmat kuukaudet siirretään kylmään arkistoon
+DM_INACTIVE_DAYS = 30   # oletus: raportti-DM:t vain viimeksi näin monen päivän sisällä aktiivisille
+
+
+class ConfigError(Exception):
+    """Asetustiedosto puuttuu tai on virheellinen. Viesti näytetään !reload-komennossa."""
+
+
+# --------- ASETUKSET ---------
+class Config:
+    """Yksi asetusversio valmiiksi käännettynä. Olio on muuttumaton:
+    !reload rakentaa kokonaan uuden ja vaihtaa sen käyttöön yhdellä
+    sijoituksella, joten komento, joka otti asetukset alussa talteen,
+    näkee ne yhtenäisinä loppuun asti.
+    """
+
+    __slots__ = (
+        "version", "tasks", "rewards", "day_plan", "routine_tasks", "min_tasks_for_streak",
+        "channels", "task_bits", "core_sets", "scheduled_tasks", "routine_mask",
+        "point_weights", "stats", "plans", "home_guild", "leaderboard_interval",
+        "history_hot_days", "dm_inactive_days",
+    )
+
+    def __init__(self, version, tasks, rewards, day_plan, routine_tasks, min_tasks_for_streak, channels,
+                 home_guild=None, leaderboard_interval=60, history_hot_days=HISTORY_HOT_DAYS,
+                 dm_inactive_days=DM_INACTIVE_DAYS):
+        self.version = version
+        self.tasks = tasks                  # tehtävä -> pisteet
+        self.rewards = rewards              # palkinto -> hinta
+        self.day_plan = day_plan            # päivä -> {"label", "core_tasks"}
+        self.routine_tasks = routine_tasks  # päivittäiset rutiinit (tuple)
+        self.min_tasks_for_streak = min_tasks_for_streak
+        self.channels = channels            # "today_plan"/"week_vision"/"leaderboard" -> kanava-ID
+        self.home_guild = home_guild        # palvelin, jonka data on vanhassa datatiedostossa (None = ensimmäinen palvelin, ks. Partitions.bind_home)
+        self.leaderboard_interval = leaderboard_interval  # pistetaulukon muokkausväli sekunteina (0 = vain klo 06)
+        self.history_hot_days = history_hot_days  # näin monta päivää historiaa muistissa (0 = ei arkistoida)
+        self.dm_inactive_days = dm_inactive_days  # raportti-DM:t vain näin monen päivän sisällä aktiivisille (0 = kaikille)
+
+        # valmiiksi lasketut hakurakenteet
+        self.task_bits = {task: BIT[task] for task in tasks}
+        self.core_sets = {day: frozenset(plan["core_tasks"]) for day, plan in day_plan.items()}
+        self.scheduled_tasks = frozenset().union(*self.core_sets.values())  # jonkin päivän ydintehtävät
+        self.routine_mask, _ = mask_of(routine_tasks)
+        self.point_weights = weights_of(tasks)
+        self.stats = StatsConfig(self.routine_mask, min_tasks_for_streak, self.point_weights)
+        self.plans = PlanRenderer()
+        self.plans.configure(tasks, day_plan, routine_tasks, version=version)
+
+    def core_tasks(self, day_name):
+        plan = self.day_plan.get(day_name)
+        return plan["core_tasks"] if plan else []
+
+
+# --------- LATAUS JA TARKISTUS ---------
+def _points(value, where):
+    if isinstance(value, dict):
+        value = value.get("points")
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise ConfigError(f"{where}: pisteiden pitää olla ei-negatiivinen kokonaisluku")
+    return value
+
+
+def parse_config(raw, version):
+    """Tarkistaa luetun JSON-datan ja kääntää sen Config-olioksi."""
+    if not isinstance(raw, dict):
+        raise ConfigError("tiedoston pitää olla JSON-olio")
+    for key in ("tasks", "rewards", "day_plan", "daily_routine_tasks", "min_tasks_for_streak", "channels"):
+        if key not in raw:
+            raise ConfigError(f"puuttuu kenttä '{key}'")
+
+    if not isinstance(raw["tasks"], dict) or not raw["tasks"]:
+        raise ConfigError("'tasks' pitää olla ei-tyhjä olio")
+    tasks = {}
+    for name, value in raw["tasks"].items():
+        if name != name.lower() or not name:
+            raise ConfigError(f"tehtävän nimi '{name}' pitää kirjoittaa pienillä kirjaimilla")
+        tasks[name] = _points(value, f"tasks.{name}")
+
+    if not isinstance(raw["rewards"], dict):
+        raise ConfigError("'rewards' pitää olla olio")
+    rewards = {}
+    for name, value in raw["rewards"].items():
+        if name != name.lower() or not name:
+            raise ConfigError(f"palkinnon nimi '{name}' pitää kirjoittaa pienillä kirjaimilla")
+        rewards[name] = _points(value, f"rewards.{name}")
+
+    day_plan = {}
+    for day in DAY_NAMES:
+        plan = raw["day_plan"].get(day) if isinstance(raw["day_plan"], dict) else None
+        if not isinstance(plan, dict) or not isinstance(plan.get("label"), str):
+            raise ConfigError(f"day_plan.{day}: tarvitaan 'label' ja 'core_tasks'")
+        core = plan.get("core_tasks")
+        if not isinstance(core, list):
+            raise ConfigError(f"day_plan.{day}.core_tasks pitää olla lista")
+        unknown = [t for t in core if t not in tasks]
+        if unknown:
+            raise ConfigError(f"day_plan.{day}: tuntemattomat tehtävät {', '.join(map(str, unknown))}")
+        day_plan[day] = {"label": plan["label"], "core_tasks": list(core)}
+    extra_days = set(raw["day_plan"]) - set(DAY_NAMES)
+    if extra_days:
+        raise ConfigError(f"day_plan: tuntemattomat päivät {', '.join(sorted(extra_days))}")
+
+    routine = raw["daily_routine_tasks"]
+    if not isinstance(routine, list) or any(t not in tasks for t in routine):
+        raise ConfigError("'daily_routine_tasks' pitää olla lista tasks-kohdan tehtäviä")
+    minimum = raw["min_tasks_for_streak"]
+    if not isinstance(minimum, int) or isinstance(minimum, bool) or not 0 <= minimum <= len(routine):
+        raise ConfigError(f"'min_tasks_for_streak' pitää olla 0–{len(routine)}")
+
+    channels = {}
+    for key in CHANNEL_KEYS:
+        value = raw["channels"].get(key) if isinstance(raw["channels"], dict) else None
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ConfigError(f"channels.{key}: kanavan ID pitää olla kokonaisluku")
+        channels[key] = value
+    home_guild = raw.get("home_guild")
+    if home_guild is not None and (not isinstance(home_guild, int) or isinstance(home_guild, bool)):
+        raise ConfigError("'home_guild' pitää olla palvelimen ID tai null")
+    interval = raw.get("leaderboard_interval", 60)
+    if not isinstance(interval, (int, float)) or isinstance(interval, bool) or interval < 0:
+        raise ConfigError("'leaderboard_interval' pitää olla sekunteja (0 = ei päivitetä heti)")
+    hot_days = raw.get("history_hot_days", HISTORY_HOT_DAYS)
+    if not isinstance(hot_days, int) or isinstance(hot_days, bool) or not (hot_days == 0 or hot_days >= 31):
+        raise ConfigError("'history_hot_days' pitää olla päiviä, vähintään 31 (0 = ei arkistoida)")
+    inactive_days = raw.get("dm_inactive_days", DM_INACTIVE_DAYS)
+    if not isinstance(inactive_days, int) or isinstance(inactive_days, bool) or inactive_days < 0:
+        raise ConfigError("'dm_inactive_days' pitää olla päiviä (0 = raportit kaikille)")
+
+    # bittipaikat vasta kun kaikki muu on kunnossa, ettei virheellinen
+    # tiedosto kuluta pysyviä paikkoja
+    new = [t for t in tasks if t not in BIT]
+    if len(TASK_BITS) + len(new) > MAX_TASKS:
+        raise ConfigError(f"enintään {MAX_TASKS} eri tehtävää historian bittimaskissa")
+    register_tasks(new)
+
+    return Config(
+        version, tasks, rewards, day_plan, tuple(routine), minimum, channels, home_guild, interval,
+        hot_days, inactive_days,
+    )
+
+
+def load_config(path, version=1):
+    path = Path(path)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        raise ConfigError(f"tiedostoa {path} ei löydy")
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"{path} ei ole kelvollista JSONia (rivi {e.lineno}: {e.msg})")
+    return parse_config(raw, version)
+
+
+class Settings:
+    """Voimassa olevat asetukset. current vaihdetaan vain kokonaisena
+    uutena Config-oliona; virheellinen tiedosto jättää vanhat voimaan."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.current = None
+
+    def reload(self):
+        version = self.current.version + 1 if self.current is not None else 1
+        config = load_config(self.path, version)
+        self.current = config
+        return config
@@ -0,0 +1,141 @@
+from pathlib import Path
+
+from locks import LockManager
+from reminders import ReminderIndex
+from store import DataStore, PersistenceWorker
+from timezones import TimezoneIndex
+
+# Kotipalvelimen osio: vanha datatiedosto, asetustiedoston kanavat ja
+# yksityisviesteinä annetut komennot.
+HOME = 0
+
+
+# --------- PALVELINOSIO ---------
+class Partition:
+    """Yhden palvelimen (guild) data ja ajonaikainen tila: oma tietovarasto
+    ja kirjoittaja, lukot, pistetaulukko sekä aikavyöhyke- ja muistutusindeksi.
+    Komento koskee vain oman palvelimensa osiota, joten palvelimen exclusive-ajo
+    (esim. päivänvaihto) ei pysäytä muiden palvelimien komentoja.
+    """
+
+    def __init__(self, key, backend, tz, metrics=None, clock=None):
+        self.key = key  # guild ID, HOME = kotipalvelin
+        self.store = DataStore(backend)
+        self.writer = PersistenceWorker(self.store, interval=0.5)
+        self.store.on_dirty = self.writer.notify
+        self.store.sync = self.writer.sync
+        self.store.metrics = metrics
+        self.locks = LockManager()  # saman käyttäjän muutokset yksi kerrallaan
+        self.timezones = TimezoneIndex(self.store, tz, clock)  # käyttäjien vyöhykkeet, tz = oletus
+        self.reminders = ReminderIndex(self.store, self.timezones.zone_of)  # muistutusten erääntymisindeksi
+        self.leaderboard = None  # live.LiveMessage: osion pistetaulukkoviesti
+        self.deliveries = None   # broadcast.Deliveries: DM-jakelun tila ja ohitukset
+
+    @property
+    def channels(self):
+        """!setchannel-komennolla asetetut kanavat: nimi -> kanava-ID (0 = pois)."""
+        return self.store.meta.get("channels", {})
+
+    def __repr__(self):
+        return f"<Partition {self.key or 'home'}: {len(self.store.users)} käyttäjää>"
+
+
+# --------- OSIOT ---------
+class Partitions:
+    """Kaikki palvelinosiot. Koti-osio käyttää vanhaa datatiedostoa, muut
+    omaa tiedostoaan hakemistossa directory (<guild_id>.json, .wab tai .db).
+    Uuden palvelimen osio luodaan sen ensimmäisestä komennosta.
+
+    make_backend(path) luo tallennuksen; on_open(partition) ajetaan, kun
+    osio on ladattu (esim. bittitaulukon tallennus ja muistutusindeksi).
+    """
+
+    def __init__(self, home_backend, directory, suffix, make_backend, tz, metrics=None, clock=None):
+        self.home_backend = home_backend
+        self.directory = Path(directory)
+        self.suffix = suffix
+        self.make_backend = make_backend
+        self.tz = tz
+        self.metrics = metrics
+        self.clock = clock  # clock.Clock, jaetaan osioiden aikavyöhykeindekseille
+        self.on_open = None
+        self._partitions = {}
+        self._started = False
+
+    def __iter__(self):
+        return iter(list(self._partitions.values()))
+
+    def __len__(self):
+        return len(self._partitions)
+
+    @property
+    def home(self):
+        return self._partitions[HOME]
+
+    def key_for(self, guild_id, home_guild=None):
+        """Osion avain: yksityisviestit ja kotipalvelin -> HOME. Kotipalvelin on
+        asetustiedoston home_guild; jos sitä ei ole asetettu, kotiosioon
+        sidotaan ensimmäinen palvelin, jolta komento tulee (ks. bind_home)."""
+        if guild_id is None:
+            return HOME
+        if home_guild is None:
+            home_guild = self.home.store.meta.get("home_guild") or self.bind_home(guild_id)
+        return HOME if guild_id == home_guild else guild_id
+
+    def bind_home(self, guild_id):
+        """Sitoo palvelimen kotiosioon ja tallentaa valinnan (meta home_guild).
+        Päivitettäessä yhden palvelimen botista vanha datatiedosto kuuluu sille
+        palvelimelle, joten sen komennot näkevät vanhat pisteet ja historian.
+        Palvelinta, jolla on jo oma osio, ei sidota: palauttaa None."""
+        if guild_id in self._partitions:
+            return None
+        self.home.store.apply("meta_set", key="home_guild", value=guild_id)
+        print(f"[guilds] palvelin {guild_id} sidottiin kotiosioon (vanha datatiedosto)")
+        return guild_id
+
+    def _discover(self):
+        if not self.directory.is_dir():
+            return []
+        # JSON- ja binääriosiolla voi olla pelkkä journal, jos tilannekuvaa ei ole vielä kirjoitettu
+        suffixes = {self.suffix, ".journal"}
+        return sorted({
+            int(path.stem) for path in self.directory.iterdir()
+            if path.suffix in suffixes and path.stem.isdigit()
+        })
+
+    def load(self):
+        """Lataa koti-osion ja kaikki levyltä löytyvät palvelinosiot."""
+        self._partitions = {}
+        self._open(HOME, self.home_backend)
+        for key in self._discover():
+            self._open(key, self.make_backend(self.directory / f"{key}{self.suffix}"))
+
+    def _open(self, key, backend):
+        partition = Partition(key, backend, self.tz, self.metrics, self.clock)
+        partition.store.load()
+        self._partitions[key] = partition
+        if self.on_open is not None:
+            self.on_open(partition)
+        if self._started:
+            partition.writer.start()
+        return partition
+
+    def get(self, key):
+        partition = self._partitions.get(key)
+        if partition is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            partition = self._open(key, self.make_backend(self.directory / f"{key}{self.suffix}"))
+            print(f"[guilds] uusi palvelinosio {key}")
+        return partition
+
+    def start(self):
+        """Käynnistää kirjoittajat (event loopissa); myöhemmin luodut osiot käynnistyvät heti."""
+        self._started = True
+        for partition in self:
+            if not partition.writer.is_running():
+                partition.writer.start()
+
+    def flush(self):
+        """Kirjoittaa kaikkien osioiden odottavat muutokset (sammutus)."""
+        for partition in self:
+            partition.writer.flush()
@@ -0,0 +1,553 @@
+import json
+import sys
+from array import array
+from datetime import date
+from pathlib import Path
+
+# Tehtävien bittipaikat. Järjestys on pysyvä: uudet tehtävät lisätään
+# loppuun, poistettujen paikkoja ei käytetä uudelleen (muuten vanha
+# historia tulkittaisiin väärin). Asetustiedoston uudet tehtävät saavat
+# paikan register_tasks()-kutsulla, ja koko taulukko tallennetaan dataan
+# (meta "task_bits"). Enintään MAX_TASKS tehtävää.
+MAX_TASKS = 32
+TASK_BITS = [
+    "wake",
+    "morning_workout",
+    "protein",
+    "water",
+    "vitamins",
+    "stretch",
+    "tidy",
+    "sleep_early",
+    "no_phone",
+    "gym_push",
+    "gym_pull",
+    "gym_legs",
+    "light_activity",
+    "groceries",
+    "dishes",
+    "laundry",
+    "clean_quick",
+    "big_clean",
+]
+BIT = {name: i for i, name in enumerate(TASK_BITS)}
+
+
+def register_tasks(names):
+    """Antaa bittipaikan tehtäville, joilla sitä ei vielä ole. Palauttaa
+    lisätyt nimet; ValueError, jos paikat loppuvat."""
+    new = [name for name in dict.fromkeys(names) if name not in BIT]
+    if len(TASK_BITS) + len(new) > MAX_TASKS:
+        raise ValueError(f"enintään {MAX_TASKS} eri tehtävää (bittipaikat loppuivat)")
+    for name in new:
+        BIT[name] = len(TASK_BITS)
+        TASK_BITS.append(name)
+    return new
+
+
+def mask_of(tasks):
+    """Tehtävien nimet -> (bittimaski, nimet joilla ei ole bittiä)."""
+    mask = 0
+    extra = []
+    for task in tasks:
+        bit = BIT.get(task)
+        if bit is None:
+            extra.append(task)
+        else:
+            mask |= 1 << bit
+    return mask, extra
+
+
+def tasks_of(mask):
+    """Bittimaski -> tehtävien nimet bittijärjestyksessä."""
+    tasks = []
+    while mask:
+        low = mask & -mask
+        tasks.append(TASK_BITS[low.bit_length() - 1])
+        mask ^= low
+    return tasks
+
+
+def weights_of(values):
+    """{tehtävä: arvo} -> lista (bitti, arvo) bitillisistä tehtävistä, esim. pisteille."""
+    return [(1 << BIT[task], value) for task, value in values.items() if task in BIT]
+
+
+def mask_value(mask, weights):
+    return sum(value for bit, value in weights if mask & bit)
+
+
+# --------- HISTORIA ---------
+class History:
+    """Menneiden päivien tehtävät bittimaskeina: masks[i] on päivän
+    start + i maski (array('I'), 4 tavua / päivä). Tehtävät, joilla ei ole
+    bittipaikkaa (esim. poistetut), pidetään erikseen extra-sanakirjassa,
+    joten muunnos vanhaan listamuotoon on häviötön.
+    """
+
+    __slots__ = ("start", "masks", "extra", "rollups", "_prefix")
+
+    def __init__(self, start=None, masks=None, extra=None, rollups=None):
+        self.start = start                # ensimmäisen päivän ordinaali tai None
+        self.masks = masks if masks is not None else array("I")
+        self.extra = extra if extra is not None else {}  # päivämäärä -> [nimet]
+        self.rollups = rollups            # Rollups, jos vanhimmat kuukaudet on arkistoitu
+        self._prefix = None               # PrefixIndex, rakennetaan ensimmäisessä kyselyssä
+
+    def __len__(self):
+        return sum(1 for _ in self.items())
+
+    def __bool__(self):
+        return any(self.masks) or bool(self.extra)
+
+    def __contains__(self, date_str):
+        return bool(self.get(date_str))
+
+    def copy(self):
+        """Itsenäinen kopio (esim. päivänvaihdon esikatselu); kumulatiiviset
+        summat rakennetaan kopiolle tarvittaessa uudelleen."""
+        return History(self.start, array("I", self.masks), dict(self.extra), self.rollups)
+
+    def _offset(self, date_str):
+        return date.fromisoformat(date_str).toordinal() - self.start
+
+    def set_day(self, date_str, tasks):
+        mask, extra = mask_of(tasks)
+        if extra:
+            self.extra[date_str] = extra
+        else:
+            self.extra.pop(date_str, None)
+        if not mask and (self.start is None or not 0 <= self._offset(date_str) < len(self.masks)):
+            return
+        day = date.fromisoformat(date_str).toordinal()
+        if self.start is None:
+            self.start = day
+            self._prefix = None
+        if day < self.start:
+            self.masks[0:0] = array("I", [0]) * (self.start - day)
+            self.start = day
+            self._prefix = None
+        i = day - self.start
+        if i >= len(self.masks):
+            self.masks.extend(array("I", [0]) * (i + 1 - len(self.masks)))
+        self.masks[i] = mask
+        if self._prefix is not None:
+            # päivänvaihdossa lisätään vain uusi päivä; vanhan päivän muutos rakentaa uudelleen
+            if i < self._prefix.days:
+                self._prefix = None
+            else:
+                self._prefix.extend(self.masks)
+
+    def prefix(self, config):
+        """Kumulatiiviset summat tällä asetuksella (ks. PrefixIndex)."""
+        if self._prefix is None or self._prefix.config is not config:
+            self._prefix = PrefixIndex(config, self.start or 0)
+            self._prefix.extend(self.masks)
+        return self._prefix
+
+    def stats(self, config, load_month):
+        """Tilastot koko historialle. Ilman arkistoa sama kuin prefix();
+        muuten HistoryStats, joka lukee arkistoidut kuukaudet rollupeista ja
+        hakee kylmän kuukauden päivät load_month(kuukauden ordinaali)
+        -kutsulla vain, kun kysely alkaa tai päättyy kesken kuukautta."""
+        if self.rollups is None:
+            return self.prefix(config)
+        return HistoryStats(self, config, load_month)
+
+    def archive(self, rollups):
+        """Poistaa päivät ennen rollups.until-päivää (ne on kirjoitettu
+        kylmään arkistoon) ja ottaa käyttöön niiden kuukausien yhteenvedot."""
+        if self.start is not None and self.start < rollups.until:
+            del self.masks[:rollups.until - self.start]
+            self.start = rollups.until if self.masks else None
+            self._prefix = None
+        cut = date.fromordinal(rollups.until).isoformat()
+        for date_str in [d for d in self.extra if d < cut]:
+            del self.extra[date_str]
+        self.rollups = rollups
+
+    def mask(self, date_str):
+        if self.start is None:
+            return 0
+        i = self._offset(date_str)
+        return self.masks[i] if 0 <= i < len(self.masks) else 0
+
+    def last_day(self):
+        """Viimeisin päivä (ordinaali), jona jotain on tehty, tai None. Jos
+        muistissa ei ole yhtään tällaista päivää, arvio arkistosta: viimeisen
+        aktiivisen arkistoidun kuukauden viimeinen päivä."""
+        last = None
+        if self.start is not None:
+            for i in range(len(self.masks) - 1, -1, -1):
+                if self.masks[i]:
+                    last = self.start + i
+                    break
+        if self.extra:
+            latest = max(date.fromisoformat(date_str).toordinal() for date_str in self.extra)
+            last = latest if last is None else max(last, latest)
+        if last is None and self.rollups is not None:
+            active = [first for first, row in self.rollups.months.items() if row[0]]
+            if active:
+                last = month_last(max(active))
+        return last
+
+    def get(self, date_str, default=None):
+        tasks = tasks_of(self.mask(date_str)) + self.extra.get(date_str, [])
+        return tasks or default
+
+    def items(self):
+        """(päivämäärä, tehtävät) jokaiselle päivälle, jona jotain on tehty."""
+        days = {}
+        if self.start is not None:
+            for i, mask in enumerate(self.masks):
+                if mask:
+                    days[date.fromordinal(self.start + i).isoformat()] = tasks_of(mask)
+        for date_str, extra in self.extra.items():
+            days[date_str] = days.get(date_str, []) + extra
+        return sorted(days.items())
+
+    def values(self):
+        return [tasks for _, tasks in self.items()]
+
+    def window(self, start_str, end_str):
+        """Maskit väliltä start..end (mukaan lukien), yksi per päivä."""
+        first = date.fromisoformat(start_str).toordinal()
+        last = date.fromisoformat(end_str).toordinal()
+        if last < first:
+            return array("I")
+        if self.start is None:
+            return array("I", [0]) * (last - first + 1)
+        lo, hi = first - self.start, last - self.start + 1
+        inner = self.masks[max(lo, 0):max(min(hi, len(self.masks)), 0)]
+        before = array("I", [0]) * min(max(-lo, 0), last - first + 1)
+        after = array("I", [0]) * (last - first + 1 - len(before) - len(inner))
+        return before + inner + after
+
+    # --- muunnos vanhaan listamuotoon ja takaisin ---
+    @classmethod
+    def from_lists(cls, days):
+        """{päivämäärä: [tehtävät]} -> History."""
+        history = cls()
+        for date_str in sorted(days):
+            history.set_day(date_str, days[date_str])
+        return history
+
+    def to_lists(self):
+        return dict(self.items())
+
+    # --- tiivis JSON-muoto (datatiedosto, skeemaversio 3) ---
+    @classmethod
+    def decode(cls, raw):
+        extra = {d: list(t) for d, t in raw.get("extra", {}).items()}
+        rollups = Rollups.decode(raw["rollups"]) if raw.get("rollups") else None
+        if not raw.get("masks"):
+            return cls(extra=extra, rollups=rollups)
+        start = date.fromisoformat(raw["start"]).toordinal()
+        return cls(start, array("I", raw["masks"]), extra, rollups)
+
+    def encode(self):
+        # nollat lopusta pois, ettei tiedostoon jää turhia päiviä
+        masks = self.masks.tolist()
+        while masks and not masks[-1]:
+            masks.pop()
+        raw = {"start": date.fromordinal(self.start).isoformat() if masks else None, "masks": masks}
+        if self.extra:
+            raw["extra"] = self.extra
+        if self.rollups is not None:
+            raw["rollups"] = self.rollups.encode()
+        return raw
+
+
+# --------- ARKISTOIDUT KUUKAUDET ---------
+def month_key(ordinal):
+    """Päivän ordinaali -> kuukauden avain 'YYYY-MM'."""
+    return date.fromordinal(ordinal).strftime("%Y-%m")
+
+
+def month_first(ordinal):
+    """Päivän kuukauden ensimmäisen päivän ordinaali."""
+    return date.fromordinal(ordinal).replace(day=1).toordinal()
+
+
+def month_last(first):
+    """Kuukauden (ensimmäisen päivän ordinaali) viimeisen päivän ordinaali."""
+    day = date.fromordinal(first)
+    following = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return following.toordinal() - 1
+
+
+def rollup_of(masks, config):
+    """Päivien maskit -> yhteenveto array('I'): [tehtäväpäivät, onnistuneet
+    päivät, tehtävän 0 päivät, tehtävän 1 päivät, ...] bittijärjestyksessä."""
+    row = array("I", [0]) * (2 + len(TASK_BITS))
+    for mask in masks:
+        if not mask:
+            continue
+        row[0] += 1
+        row[1] += (mask & config.routine_mask).bit_count() >= config.min_routines
+        while mask:
+            low = mask & -mask
+            row[1 + low.bit_length()] += 1
+            mask ^= low
+    return row
+
+
+def runs_of(first, masks, config):
+    """Onnistuneiden päivien putket [alku, loppu] ordinaaleina (masks[i] = päivä first + i)."""
+    runs = []
+    for i, mask in enumerate(masks):
+        if mask and (mask & config.routine_mask).bit_count() >= config.min_routines:
+            if runs and runs[-1][1] == first + i - 1:
+                runs[-1][1] = first + i
+            else:
+                runs.append([first + i, first + i])
+    return runs
+
+
+def merge_runs(runs):
+    """Järjestää putket ja yhdistää päällekkäiset ja peräkkäiset."""
+    merged = []
+    for a, b in sorted(runs):
+        if merged and a <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return merged
+
+
+class Rollups:
+    """Kylmään arkistoon siirrettyjen kuukausien yhteenvedot, jotka pysyvät
+    muistissa: koko historian !stats ei tarvitse vanhoja päiviä lainkaan.
+
+    until   ensimmäinen arkistoimaton päivä (ordinaali); sitä vanhemmat vain arkistossa
+    months  kuukauden ensimmäinen päivä (ordinaali) -> rollup_of()-rivi
+    runs    arkistoitujen päivien onnistuneet putket [alku, loppu] ordinaaleina
+
+    Onnistuneet päivät on laskettu arkistointihetken asetuksilla; myöhempi
+    streak-rajan muutos ei muuta arkistoituja kuukausia.
+    """
+
+    __slots__ = ("until", "months", "runs")
+
+    def __init__(self, until, months=None, runs=None):
+        self.until = until
+        self.months = months if months is not None else {}
+        self.runs = runs if runs is not None else []
+
+    def replace(self, until, months, config):
+        """Uusi Rollups, jossa annettujen kuukausien ({ensimmäinen päivä:
+        maskit}) rivit ja putket on laskettu uudelleen."""
+        rows = dict(self.months)
+        runs = []
+        for a, b in self.runs:
+            # vanhat putket pois uudelleen laskettavien kuukausien kohdalta
+            for first in sorted(months):
+                last = month_last(first)
+                if a < first <= b:
+                    runs.append([a, first - 1])
+                if a <= last and b >= first:
+                    a = last + 1
+            if a <= b:
+                runs.append([a, b])
+        for first, masks in months.items():
+            rows[first] = rollup_of(masks, config)
+            runs.extend(runs_of(first, masks, config))
+        return Rollups(max(until, self.until), rows, merge_runs(runs))
+
+    @classmethod
+    def decode(cls, raw):
+        return cls(
+            date.fromisoformat(raw["until"]).toordinal(),
+            {date.fromisoformat(key + "-01").toordinal(): array("I", row) for key, row in raw["months"].items()},
+            [[date.fromisoformat(a).toordinal(), date.fromisoformat(b).toordinal()] for a, b in raw.get("runs", [])],
+        )
+
+    def encode(self):
+        return {
+            "until": date.fromordinal(self.until).isoformat(),
+            "months": {month_key(first): row.tolist() for first, row in sorted(self.months.items())},
+            "runs": [[date.fromordinal(a).isoformat(), date.fromordinal(b).isoformat()] for a, b in self.runs],
+        }
+
+
+# --------- KUMULATIIVISET INDEKSIT ---------
+class StatsConfig:
+    """Tilastojen laskuun tarvittavat asetukset. Uusi olio (esim. asetusten
+    muuttuessa) rakentaa käyttäjien indeksit uudelleen seuraavalla kyselyllä."""
+
+    __slots__ = ("routine_mask", "min_routines", "weights")
+
+    def __init__(self, routine_mask, min_routines, weights):
+        self.routine_mask = routine_mask
+        self.min_routines = min_routines
+        self.weights = weights  # lista (bitti, pisteet)
+
+
+class PrefixIndex:
+    """Käyttäjän historian kumulatiiviset summat (prefix sum): taulukon
+    kohta i on summa päivistä start .. start + i - 1. Minkä tahansa
+    aikavälin tehtäväpäivät, onnistuneet päivät ja pisteet saadaan kahden
+    luvun erotuksena. Lisäksi pidetään lista onnistuneiden päivien
+    putkista (streak-historia).
+    """
+
+    def __init__(self, config, start):
+        self.config = config
+        self.start = start
+        self.days = 0
+        self.tasks = [array("I", [0]) for _ in TASK_BITS]  # bitti -> tehty-päivät
+        self.active = array("I", [0])   # päivät, joina jotain tehty
+        self.success = array("I", [0])  # streak-rajan täyttäneet päivät
+        self.points = array("I", [0])   # tehtävien pisteet
+        self.done = array("I", [0])     # tehtyjä tehtäviä yhteensä
+        self.runs = []                  # onnistuneiden päivien putket [alku, loppu] (indeksit)
+
+    def extend(self, masks):
+        """Lisää masks-taulukon päivät, joita indeksissä ei vielä ole."""
+        config = self.config
+        for i in range(self.days, len(masks)):
+            mask = masks[i]
+            for bit, column in enumerate(self.tasks):
+                column.append(column[-1] + ((mask >> bit) & 1))
+            self.active.append(self.active[-1] + (mask != 0))
+            ok = (mask & config.routine_mask).bit_count() >= config.min_routines
+            self.success.append(self.success[-1] + ok)
+            self.points.append(self.points[-1] + mask_value(mask, config.weights))
+            self.done.append(self.done[-1] + mask.bit_count())
+            if ok:
+                if self.runs and self.runs[-1][1] == i - 1:
+                    self.runs[-1][1] = i
+                else:
+                    self.runs.append([i, i])
+        self.days = len(masks)
+
+    def _span(self, first, last):
+        # päivämäärät (ordinaaleina, mukaan lukien) -> indeksit kumulatiivisiin taulukoihin
+        lo = min(max(first - self.start, 0), self.days)
+        hi = min(max(last - self.start + 1, 0), self.days)
+        return lo, max(lo, hi)
+
+    def _sum(self, column, first, last):
+        lo, hi = self._span(first, last)
+        return column[hi] - column[lo]
+
+    def task_days(self, task, first, last):
+        return self._sum(self.tasks[BIT[task]], first, last)
+
+    def active_days(self, first, last):
+        return self._sum(self.active, first, last)
+
+    def success_days(self, first, last):
+        return self._sum(self.success, first, last)
+
+    def points_between(self, first, last):
+        return self._sum(self.points, first, last)
+
+    def tasks_between(self, first, last):
+        return self._sum(self.done, first, last)
+
+    def streaks(self):
+        """Onnistuneiden päivien putket: lista (alku, loppu, pituus) päivämäärinä."""
+        return [
+            (date.fromordinal(self.start + a), date.fromordinal(self.start + b), b - a + 1)
+            for a, b in self.runs
+        ]
+
+
+class HistoryStats:
+    """PrefixIndexin rajapinta historialle, jonka alkupää on arkistoitu.
+
+    Päivät ennen rollups.until-päivää lasketaan kuukausien yhteenvedoista;
+    kuukausi, jonka kysely kattaa vain osittain, luetaan arkistosta
+    (load_month) ja lasketaan kerran tätä oliota kohden. Uudemmat päivät
+    tulevat tavallisesta PrefixIndexistä.
+    """
+
+    def __init__(self, history, config, load_month):
+        self.config = config
+        self.hot = history.prefix(config)
+        self.rollups = history.rollups
+        self.load_month = load_month
+        self._months = {}  # kuukausi -> sen päivien maskit (osittaiset kyselyt)
+
+    def _cold(self, first, last):
+        # arkistoitujen päivien first..last yhteenveto (ks. rollup_of)
+        last = min(last, self.rollups.until - 1)
+        total = [0] * (2 + len(TASK_BITS))
+        if last < first:
+            return total
+        for month, row in self.rollups.months.items():
+            end = month_last(month)
+            if end < first or month > last:
+                continue
+            if first > month or last < end:
+                masks = self._months.get(month)
+                if masks is None:
+                    masks = self._months[month] = self.load_month(month)
+                lo = max(first, month) - month
+                row = rollup_of(masks[lo:min(last, end) - month + 1], self.config)
+            for i, value in enumerate(row):
+                total[i] += value
+        return total
+
+    def _hot(self, column, first, last):
+        return self.hot._sum(column, max(first, self.rollups.until), last)
+
+    def task_days(self, task, first, last):
+        return self._cold(first, last)[2 + BIT[task]] + self._hot(self.hot.tasks[BIT[task]], first, last)
+
+    def active_days(self, first, last):
+        return self._cold(first, last)[0] + self._hot(self.hot.active, first, last)
+
+    def success_days(self, first, last):
+        return self._cold(first, last)[1] + self._hot(self.hot.success, first, last)
+
+    def points_between(self, first, last):
+        row = self._cold(first, last)
+        cold = sum(row[1 + bit.bit_length()] * value for bit, value in self.config.weights)
+        return cold + self._hot(self.hot.points, first, last)
+
+    def tasks_between(self, first, last):
+        return sum(self._cold(first, last)[2:]) + self._hot(self.hot.done, first, last)
+
+    def streaks(self):
+        """Kuten PrefixIndex.streaks(); arkiston ja tuoreen historian rajan
+        ylittävä putki yhdistetään yhdeksi."""
+        hot = self.hot
+        runs = [[max(hot.start + a, self.rollups.until), hot.start + b] for a, b in hot.runs]
+        runs = merge_runs(self.rollups.runs + [run for run in runs if run[0] <= run[1]])
+        return [(date.fromordinal(a), date.fromordinal(b), b - a + 1) for a, b in runs]
+
+
+if __name__ == "__main__":
+    # python history.py winter_arc_data.json vanha_muoto.json
+    # Kirjoittaa datatiedoston historian vanhassa listamuodossa (esim. ulkoisille työkaluille).
+    # Arkistoidut kuukaudet luetaan mukaan kylmästä arkistosta (<data>.archive),
+    # joten vienti on häviötön: tuotaessa koko historia on taas muistissa.
+    if len(sys.argv) != 3:
+        print("Käyttö: python history.py <winter_arc_data.json> <kohde.json>")
+        sys.exit(1)
+    from archive import Archive  # archive tuo tämän moduulin
+
+    source = Path(sys.argv[1])
+    with open(source, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    register_tasks(data.get("_meta", {}).get("task_bits", ()))
+    archive = Archive(source.with_suffix(".archive"))
+    for key, raw in data.items():
+        if key.isdigit() and isinstance(raw.get("history"), dict) and "masks" in raw["history"]:
+            history = History.decode(raw["history"])
+            days = history.to_lists()
+            if history.rollups is not None:
+                for first, (masks, extra) in archive.load(int(key)).items():
+                    for i, mask in enumerate(masks):
+                        if mask:
+                            days[date.fromordinal(first + i).isoformat()] = tasks_of(mask)
+                    for date_str, tasks in extra.items():
+                        days[date_str] = days.get(date_str, []) + tasks
+            raw["history"] = dict(sorted(days.items()))
+    # listamuoto on skeemaversio 2; botti migroi sen takaisin ladatessa
+    data.get("_meta", {})["schema_version"] = 2
+    with open(sys.argv[2], "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"Kirjoitettiin {sys.argv[2]}.")
@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+import json
+import traceback
+
+import discord
+
+from clock import Clock
+
+
+# --------- ELÄVÄ VIESTI ---------
+class LiveMessage:
+    """Kanavalla pysyvä viesti (esim. pistetaulukko), jota muokataan datan
+    muuttuessa. Muutokset kootaan: touch() ajastaa päivityksen, ja viestiä
+    muokataan enintään kerran interval-sekunnissa. Jos näytettävä sisältö ei
+    ole muuttunut (tiiviste), muokkausta ei tehdä lainkaan.
+
+    render() palauttaa embedin, target() parin (kanava-ID, viesti-ID) ja
+    remember(viesti-ID) tallettaa uuden viestin ID:n, kun viesti luodaan
+    uudelleen (esim. joku on poistanut sen).
+    """
+
+    def __init__(self, bot, render, target, remember, interval=60.0, clock=None):
+        self.bot = bot
+        self.clock = clock or Clock()
+        self.render = render
+        self.target = target
+        self.remember = remember
+        self.interval = interval
+        self.message = None    # välimuistissa oleva viesti: ei fetch_messagea joka kerta
+        self.digest = None     # viimeksi näytetyn embedin tiiviste
+        self.last_edit = 0.0   # clock.monotonic() viimeisimmästä muokkauksesta
+        self.edits = 0
+        self.skipped = 0
+        self._task = None
+
+    def touch(self):
+        """Data muuttui: päivitys ajetaan viimeistään interval-sekunnin päästä
+        edellisestä muokkauksesta. Useampi muutos välissä = yksi muokkaus."""
+        if self.interval <= 0 or self._task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # lataus tai työkalu ilman event loopia
+        self._task = loop.create_task(self._later())
+
+    def reset(self):
+        """Kanava vaihtui: seuraava päivitys luo uuden viestin."""
+        self.message = None
+        self.digest = None
+
+    async def _later(self):
+        await self.clock.sleep(max(0.0, self.last_edit + self.interval - self.clock.monotonic()))
+        # vapautetaan ennen päivitystä, jotta sen aikana tulleet muutokset ajastavat uuden
+        self._task = None
+        try:
+            await self.refresh()
+        except discord.HTTPException as e:
+            print(f"[live] viestin päivitys epäonnistui: {e}")
+        except Exception:
+            # irrallinen tehtävä: muuten virhe näkyisi vain "Task exception was never retrieved"
+            print("[live] viestin päivitys epäonnistui:")
+            traceback.print_exc()
+
+    async def refresh(self, force=False):
+        """Päivittää viestin heti. Palauttaa True, jos viestiä muokattiin tai
+        se luotiin. force=True muokkaa, vaikka sisältö ei olisi muuttunut
+        (paljastaa poistetun viestin ja luo sen uudelleen)."""
+        channel_id, message_id = self.target()
+        channel = self.bot.get_channel(channel_id) if channel_id else None
+        if channel is None:
+            return False
+        if self.message is not None and self.message.channel.id != channel.id:
+            self.reset()
+        if self.message is None and message_id:
+            # PartialMessage riittää muokkaukseen, joten viestiä ei tarvitse hakea
+            self.message = channel.get_partial_message(message_id)
+
+        embed = self.render()
+        digest = hashlib.sha1(json.dumps(embed.to_dict(), sort_keys=True).encode("utf-8")).hexdigest()
+        if not force and self.message is not None and digest == self.digest:
+            self.skipped += 1
+            return False
+
+        self.last_edit = self.clock.monotonic()
+        if self.message is not None:
+            try:
+                await self.message.edit(embed=embed)
+                self.digest = digest
+                self.edits += 1
+                return True
+            except discord.NotFound:
+                self.message = None  # viesti poistettu: luodaan uusi
+        self.message = await channel.send(embed=embed)
+        self.remember(self.message.id)
+        self.digest = digest
+        self.edits += 1
+        return True
@@ -0,0 +1,69 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class _UserLock:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+# --------- KÄYTTÄJÄKOHTAISET LUKOT ---------
+class LockManager:
+    """Sarjallistaa saman käyttäjän read-modify-write-komennot.
+
+    Eri käyttäjien komennot etenevät rinnakkain. Lukko luodaan vasta
+    tarvittaessa ja poistetaan, kun kukaan ei enää käytä tai odota sitä,
+    joten lukkoja on muistissa vain aktiivisille käyttäjille.
+
+    exclusive() on koko datan kattaville ajoille (esim. iltamuistutusten
+    poisto kaikilta): se odottaa käynnissä olevat käyttäjäkomennot loppuun
+    ja pitää uudet odottamassa, kunnes se vapautuu.
+    """
+
+    def __init__(self):
+        self._locks = {}  # user_id -> _UserLock
+        self._global = asyncio.Lock()
+        self._active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._open = asyncio.Event()  # False kun exclusive-ajo on käynnissä
+        self._open.set()
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def user(self, user_id):
+        user_id = int(user_id)
+        while not self._open.is_set():
+            await self._open.wait()
+
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = _UserLock()
+        entry.refs += 1
+        self._active += 1
+        self._idle.clear()
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.refs -= 1
+            if entry.refs == 0:
+                del self._locks[user_id]
+            self._active -= 1
+            if self._active == 0:
+                self._idle.set()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        async with self._global:
+            self._open.clear()
+            try:
+                await self._idle.wait()
+                yield
+            finally:
+                self._open.set()
@@ -0,0 +1,259 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import discord
+
+PREFIX = "winter_arc_"
+
+# Histogrammien rajat sekunteina. Komennon kesto sisältää vastausviestin
+# lähetyksen, ajastetut työt voivat kestää minuutteja (DM-jakelu).
+COMMAND_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0)
+STORAGE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+CHART_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Tunnetut mittarit: nimi -> (tyyppi, kuvaus, histogrammin rajat)
+METRICS = {
+    "command_seconds": ("histogram", "Komennon kesto (before_invoke -> after_invoke)", COMMAND_BUCKETS),
+    "command_errors_total": ("counter", "Virheeseen päättyneet komennot", None),
+    "job_seconds": ("histogram", "Ajastetun työn kesto", JOB_BUCKETS),
+    "job_runs_total": ("counter", "Ajastetut ajot tuloksen mukaan (ok/error/skipped)", None),
+    "broadcast_messages_total": ("counter", "DM-jakelun viestit tuloksen mukaan", None),
+    "broadcast_skipped_total": ("counter", "Ohitetut DM:t syyn mukaan (empty/off/backoff/inactive)", None),
+    "storage_seconds": ("histogram", "Datan lataus (load) ja kirjoituserät (write)", STORAGE_BUCKETS),
+    "storage_bytes_total": ("counter", "Luetut ja kirjoitetut tavut", None),
+    "storage_errors_total": ("counter", "Epäonnistuneet kirjoituserät", None),
+    "chart_seconds": ("histogram", "Kuvan renderöinti prosessipoolissa (välimuistin ohi)", CHART_BUCKETS),
+    "chart_cache_total": ("counter", "Kuvapyynnöt välimuistin osuman mukaan (hit/miss)", None),
+    "discord_requests_total": ("counter", "Discordin REST-kutsut", None),
+    "discord_errors_total": ("counter", "Virheeseen päättyneet REST-kutsut HTTP-tilan mukaan", None),
+    "discord_rate_limited_total": ("counter", "429-vastaukset (route tai global)", None),
+}
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --------- HISTOGRAMMI ---------
+class Histogram:
+    """Kiinteät rajat kuten Prometheuksessa: counts[i] on havainnot, jotka
+    ovat <= bounds[i] mutta suurempia kuin edellinen raja (viimeinen = +Inf)."""
+
+    __slots__ = ("bounds", "counts", "count", "total", "max", "last")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.last = value
+
+    def quantile(self, q):
+        """Arvio lokeroista lineaarisella interpoloinnilla (kuten
+        histogram_quantile); ei koskaan suurempi kuin suurin havainto."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+# --------- MITTARIT ---------
+class Metrics:
+    """Kevyt mittarirekisteri: laskurit, histogrammit ja kysyttäessä
+    luettavat arvot (gauge). Säieturvallinen, koska tallennuksen
+    kirjoitussäie kirjaa omat mittauksensa."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}    # (nimi, labelit) -> arvo
+        self._histograms = {}  # (nimi, labelit) -> Histogram
+        self._gauges = {}      # nimi -> (kuvaus, funktio)
+        self._server = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(METRICS[name][2])
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def gauge(self, name, fn, help=""):
+        """Arvo, joka luetaan vasta raporttia tehdessä (esim. käyttäjämäärä)."""
+        self._gauges[name] = (help, fn)
+
+    # --- luku ---
+    def counters(self, name):
+        """{labelit (dict-tuple) : arvo} yhdelle laskurille."""
+        with self._lock:
+            return {labels: value for (n, labels), value in self._counters.items() if n == name}
+
+    def histograms(self, name):
+        with self._lock:
+            return {labels: h for (n, labels), h in self._histograms.items() if n == name}
+
+    def total(self, name, **labels):
+        """Laskurin summa kaikista sarjoista, joissa annetut labelit täsmäävät."""
+        want = set(_labels(labels))
+        return sum(value for series, value in self.counters(name).items() if want <= set(series))
+
+    @property
+    def uptime(self):
+        return time.time() - self.started
+
+    # --- Prometheus-tekstimuoto ---
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        names = {}
+        for (name, labels), value in counters:
+            names.setdefault(name, []).append(("counter", labels, value))
+        for (name, labels), histogram in histograms:
+            names.setdefault(name, []).append(("histogram", labels, histogram))
+
+        for name in sorted(names):
+            kind, help_text, _ = METRICS.get(name, (names[name][0][0], "", None))
+            full = PREFIX + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for kind, labels, value in names[name]:
+                if kind == "counter":
+                    lines.append(f"{full}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, n in zip(list(value.bounds) + [float("inf")], value.counts):
+                    cumulative += n
+                    le = (("le", _format_value(float(bound))),)
+                    lines.append(f"{full}_bucket{_format_labels(labels, le)} {cumulative}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {_format_value(value.total)}")
+                lines.append(f"{full}_count{_format_labels(labels)} {value.count}")
+
+        gauges = [("uptime_seconds", ("Aika käynnistyksestä", lambda: round(self.uptime, 1)))]
+        gauges += sorted(self._gauges.items())
+        for name, (help_text, fn) in gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            full = PREFIX + name
+            lines += [f"# HELP {full} {help_text}", f"# TYPE {full} gauge", f"{full} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+    # --- HTTP-päätepiste ---
+    @property
+    def serving(self):
+        return self._server is not None
+
+    async def serve(self, host="127.0.0.1", port=9108):
+        """Käynnistää /metrics-päätepisteen (Prometheus-tekstimuoto).
+        Oletuksena vain paikallisesti: scrape samalta koneelta tai tunnelin yli."""
+
+        async def handle(reader, writer):
+            try:
+                request = await asyncio.wait_for(reader.readline(), 5)
+                while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                    pass
+                parts = request.split()
+                if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] in (b"/metrics", b"/"):
+                    status, body = "200 OK", self.render().encode("utf-8")
+                else:
+                    status, body = "404 Not Found", b"not found\n"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body
+                )
+                await writer.drain()
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        self._server = await asyncio.start_server(handle, host, port)
+        return self._server
+
+
+# --------- DISCORDIN REST-KUTSUT ---------
+class _RateLimitLog(logging.Handler):
+    """discord.py hoitaa 429-vastaukset itse ja kirjaa niistä varoituksen;
+    lasketaan ne lokiviesteistä."""
+
+    def __init__(self, metrics):
+        super().__init__(logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        message = str(record.msg)
+        if "responded with 429" in message:
+            self.metrics.inc("discord_rate_limited_total", scope="route")
+        elif "Global rate limit" in message:
+            self.metrics.inc("discord_rate_limited_total", scope="global")
+
+
+def instrument_discord(client, metrics):
+    """Laskee botin REST-kutsut reitin mukaan ja 429-vastaukset."""
+    http = client.http
+    request = http.request
+
+    async def counted(route, **kwargs):
+        metrics.inc("discord_requests_total", method=route.method, route=route.path)
+        try:
+            return await request(route, **kwargs)
+        except discord.HTTPException as e:
+            metrics.inc("discord_errors_total", status=e.status)
+            raise
+
+    http.request = counted
+    logging.getLogger("discord.http").addHandler(_RateLimitLog(metrics))
@@ -0,0 +1,68 @@
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Päivänäkymien otsikot: näkymä -> muoto (day, label)
+DAY_HEADERS = {
+    "today": "**{day} — {label}**",
+    "tomorrow": "📅 **Huominen — {day}: {label}**",
+    "dayplan": "📅 **{day} — {label}**",
+}
+CORE_TITLES = {
+    "today": "__Tämän päivän ydintehtävät:__",
+    "tomorrow": "__Ydintehtävät:__",
+    "dayplan": "__Ydintehtävät:__",
+}
+
+
+# --------- RENDERÖINTI ---------
+def format_task(tasks, t):
+    return f"- **{t}** ({tasks.get(t, '?')} pts)"
+
+
+def render_day(tasks, day_plan, routine_tasks, day_name, view="today"):
+    """Päivän suunnitelma tekstinä tai None, jos päivälle ei ole suunnitelmaa."""
+    plan = day_plan.get(day_name)
+    if not plan:
+        return None
+    text = DAY_HEADERS[view].format(day=day_name, label=plan["label"]) + "\n\n"
+    text += "__Päivittäinen rutiini:__\n" + "\n".join(format_task(tasks, t) for t in routine_tasks) + "\n\n"
+    text += CORE_TITLES[view] + "\n" + "\n".join(format_task(tasks, t) for t in plan["core_tasks"])
+    return text
+
+
+def render_week(day_plan):
+    lines = []
+    for day in DAY_NAMES:
+        plan = day_plan[day]
+        lines.append(f"**{day}** — {plan['label']} → {', '.join(plan['core_tasks'])}")
+    return "**Winter Arc -viikkosuunnitelma:**\n" + "\n".join(lines)
+
+
+# --------- VÄLIMUISTI ---------
+class PlanRenderer:
+    """Valmiiksi renderöidyt suunnitelmanäkymät.
+
+    Kaikki päivä- ja viikkonäkymät renderöidään kerralla configure()-kutsussa
+    ja avaimena on (asetusversio, päivä, näkymä). Komennot ja ajastetut
+    lähetykset vain hakevat valmiin tekstin; versio vaihtuu ja näkymät
+    renderöidään uudelleen vain, kun tehtävä- tai suunnitelma-asetukset muuttuvat.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._views = {}
+
+    def configure(self, tasks, day_plan, routine_tasks, version=None):
+        version = version if version is not None else self.version + 1
+        views = {(version, "week", None): render_week(day_plan)}
+        for day in DAY_NAMES:
+            for view in DAY_HEADERS:
+                views[(version, day, view)] = render_day(tasks, day_plan, routine_tasks, day, view)
+        # vaihdetaan kerralla, ettei kukaan näe puoliksi päivitettyä välimuistia
+        self._views = views
+        self.version = version
+
+    def day(self, day_name, view="today"):
+        return self._views.get((self.version, day_name, view))
+
+    def week(self):
+        return self._views[(self.version, "week", None)]
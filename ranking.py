@@ -0,0 +1,151 @@
+from bisect import bisect_left, bisect_right, insort
+
+# Lohkon tavoitekoko. Lohkot pidetään pieninä, joten lisäys ja poisto
+# siirtävät vain lohkon verran alkioita koko listan sijaan.
+LOAD = 256
+
+
+# --------- LEADERBOARD-INDEKSI ---------
+class RankingIndex:
+    """Pisteiden mukaan järjestetty indeksi (lohkotettu järjestetty lista).
+
+    Avain on (-pisteet, user_id), joten järjestys on suurimmasta pienimpään
+    ja tasapisteissä pienempi id ensin. Pisteiden muutos on kaksi
+    binäärihakua ja lohkon sisäinen siirto; top-k ja oma sija eivät käy
+    koko käyttäjälistaa läpi. Lohkojen koot ovat Fenwick-puussa, joten sija
+    ja sijan avain löytyvät O(log n) ajassa; puu rakennetaan uudelleen vain,
+    kun lohko jaetaan tai poistuu.
+    """
+
+    def __init__(self, items=()):
+        self._points = {}  # user_id -> pisteet
+        self._chunks = []  # järjestetyt lohkot avaimia
+        self._maxes = []   # kunkin lohkon suurin avain
+        self._sizes = [0]  # lohkojen koot Fenwick-puuna (indeksit 1..lohkoja)
+        self.rebuild(items)
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, user_id):
+        return user_id in self._points
+
+    def rebuild(self, items):
+        """Rakentaa indeksin kerralla iteroitavasta (user_id, pisteet)."""
+        self._points = dict(items)
+        keys = sorted((-pts, uid) for uid, pts in self._points.items())
+        self._chunks = [keys[i:i + LOAD] for i in range(0, len(keys), LOAD)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._build_sizes()
+
+    def _build_sizes(self):
+        sizes = [0] + [len(chunk) for chunk in self._chunks]
+        for i in range(1, len(sizes)):
+            parent = i + (i & -i)
+            if parent < len(sizes):
+                sizes[parent] += sizes[i]
+        self._sizes = sizes
+
+    def _resize(self, i, delta):
+        i += 1
+        while i < len(self._sizes):
+            self._sizes[i] += delta
+            i += i & -i
+
+    def _before(self, i):
+        """Avaimia lohkoissa ennen lohkoa i."""
+        total = 0
+        while i > 0:
+            total += self._sizes[i]
+            i -= i & -i
+        return total
+
+    def update(self, user_id, points):
+        old = self._points.get(user_id)
+        if old == points:
+            return
+        if old is not None:
+            self._remove((-old, user_id))
+        self._points[user_id] = points
+        self._insert((-points, user_id))
+
+    def discard(self, user_id):
+        old = self._points.pop(user_id, None)
+        if old is not None:
+            self._remove((-old, user_id))
+
+    def _insert(self, key):
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            self._build_sizes()
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+        chunk = self._chunks[i]
+        insort(chunk, key)
+        self._maxes[i] = chunk[-1]
+        if len(chunk) > 2 * LOAD:
+            # jaetaan liian iso lohko kahtia
+            self._chunks[i:i + 1] = [chunk[:LOAD], chunk[LOAD:]]
+            self._maxes[i:i + 1] = [chunk[LOAD - 1], chunk[-1]]
+            self._build_sizes()
+        else:
+            self._resize(i, 1)
+
+    def _remove(self, key):
+        i = bisect_left(self._maxes, key)
+        chunk = self._chunks[i]
+        del chunk[bisect_left(chunk, key)]
+        if chunk:
+            self._maxes[i] = chunk[-1]
+            self._resize(i, -1)
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+            self._build_sizes()
+
+    def _key_at(self, index):
+        # laskeudutaan Fenwick-puussa: viimeinen lohko, jota ennen on <= index avainta
+        if not 0 <= index < len(self._points):
+            raise IndexError(index)
+        i, step = 0, 1 << (len(self._sizes) - 1).bit_length()
+        while step:
+            if i + step < len(self._sizes) and self._sizes[i + step] <= index:
+                i += step
+                index -= self._sizes[i]
+            step >>= 1
+        return self._chunks[i][index]
+
+    def top(self, k=10):
+        """Palauttaa k parasta listana (user_id, pisteet)."""
+        result = []
+        for chunk in self._chunks:
+            for neg_pts, uid in chunk:
+                if len(result) >= k:
+                    return result
+                result.append((uid, -neg_pts))
+        return result
+
+    def rank(self, user_id):
+        """Käyttäjän sija (1 = paras) tai None, jos käyttäjää ei ole."""
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        key = (-points, user_id)
+        i = bisect_left(self._maxes, key)
+        return self._before(i) + bisect_right(self._chunks[i], key)
+
+    def around(self, user_id, radius=2):
+        """Käyttäjän sija ja naapurit: lista (sija, user_id, pisteet)."""
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        first = max(1, rank - radius)
+        last = min(len(self._points), rank + radius)
+        rows = []
+        for r in range(first, last + 1):
+            neg_pts, uid = self._key_at(r - 1)
+            rows.append((r, uid, -neg_pts))
+        return rows
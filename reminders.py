@@ -0,0 +1,177 @@
+import heapq
+from datetime import date, datetime, time, timedelta
+
+# Ilman kellonaikaa olevat muistutukset tulevat päivän 18:00-viestissä.
+DIGEST_TIME = time(18, 0)
+# Kuinka myöhässä (esim. botti alhaalla) muistutus vielä toimitetaan; sitä
+# vanhemmat poistetaan vanhentuneina.
+LATE_GRACE = timedelta(hours=12)
+# Toimittamatta jääneen muistutuksen uusi yritys aikaisintaan näin pian (tai
+# käyttäjän jakelun backoffin päättyessä).
+RETRY_DELAY = timedelta(minutes=15)
+
+
+def parse_date(date_str):
+    return date.fromisoformat(date_str)
+
+
+# --------- MUISTUTUSINDEKSI ---------
+class ReminderIndex:
+    """Kaikkien käyttäjien muistutusten indeksi.
+
+    Kellonajalliset muistutukset ovat ajankohdan mukaan järjestetyssä
+    keossa, ja 18:00-viestin muistutuksille pidetään päivämäärä ->
+    käyttäjät -hakemistoa. Toimitus koskee siis vain niitä käyttäjiä,
+    joilla on jotain erääntymässä. Itse muistutukset ovat käyttäjän
+    tietueessa; keosta poistetaan laiskasti, eli vanhentunut rivi
+    tunnistetaan ja ohitetaan vasta kun se nousee keon päälle.
+
+    Muistutus poistetaan käyttäjän tietueesta vasta, kun se on mennyt
+    perille; toimittamatta jäänyt palaa kekoon retry()-hetkelle.
+
+    Kellonajat ovat käyttäjän omaa aikaa: zone_of(user_id) palauttaa
+    käyttäjän aikavyöhykkeen (timezones.TimezoneIndex.zone_of).
+    """
+
+    def __init__(self, store, zone_of):
+        self.store = store
+        self.zone_of = zone_of
+        self._heap = []     # (erääntymishetki, user_id, päivämäärä, kellonaika)
+        self._by_date = {}  # päivämäärä -> {user_id}, 18:00-viestin muistutukset
+        self._retries = {}  # (user_id, päivämäärä, kellonaika) -> uusi yritys
+
+    def rebuild(self):
+        self._heap = []
+        self._by_date = {}
+        self._retries = {}
+        for user_id, record in self.store.with_reminders():
+            for date_str, entries in record.reminders.items():
+                for entry in entries:
+                    self._index(user_id, date_str, entry)
+        heapq.heapify(self._heap)
+
+    def _due(self, user_id, date_str, time_str):
+        clock = time.fromisoformat(time_str) if time_str else DIGEST_TIME
+        return datetime.combine(parse_date(date_str), clock, tzinfo=self.zone_of(user_id))
+
+    def _index(self, user_id, date_str, entry):
+        time_str = entry.get("time")
+        if time_str:
+            self._heap.append((self._due(user_id, date_str, time_str), user_id, date_str, time_str))
+        else:
+            self._by_date.setdefault(date_str, set()).add(user_id)
+
+    def add(self, user_id, date_str, entry):
+        time_str = entry.get("time")
+        if time_str:
+            heapq.heappush(self._heap, (self._due(user_id, date_str, time_str), user_id, date_str, time_str))
+        else:
+            self._by_date.setdefault(date_str, set()).add(user_id)
+
+    def reindex(self, user_id):
+        """Käyttäjän aikavyöhyke vaihtui: kellonajalliset muistutukset uusilla
+        erääntymishetkillä. Vanhat rivit ohitetaan keosta laiskasti (_live)."""
+        record = self.store.find_user(user_id)
+        if record is None:
+            return
+        for date_str, entries in record.reminders.items():
+            for entry in entries:
+                if entry.get("time"):
+                    self.add(user_id, date_str, entry)
+
+    def refresh(self, user_id, date_str):
+        """Päivittää 18:00-hakemiston, kun käyttäjän päivän muistutuksia on poistettu."""
+        record = self.store.find_user(user_id)
+        entries = record.reminders.get(date_str, []) if record is not None else []
+        users = self._by_date.get(date_str)
+        if users is None:
+            return
+        if any(not entry.get("time") for entry in entries):
+            users.add(user_id)
+        else:
+            users.discard(user_id)
+            if not users:
+                del self._by_date[date_str]
+
+    def retry(self, user_id, date_str, time_str, at):
+        """Toimittamatta jäänyt muistutus (esim. jakelun backoff) uudelleen
+        hetkellä at; time_str None = 18:00-viestin muistutukset. Palauttaa
+        False, jos at on yli LATE_GRACE alkuperäisen ajankohdan jälkeen:
+        silloin muistutus on vanhentunut."""
+        if at - self._due(user_id, date_str, time_str) > LATE_GRACE:
+            return False
+        self._retries[(user_id, date_str, time_str)] = at
+        # "" = 18:00-viestin muistutus: None ei ole keossa vertailukelpoinen kellonaikojen kanssa
+        heapq.heappush(self._heap, (at, user_id, date_str, time_str or ""))
+        return True
+
+    def _live(self, item):
+        due, user_id, date_str, time_str = item
+        time_str = time_str or None
+        record = self.store.find_user(user_id)
+        if record is None:
+            return False
+        if due != self._due(user_id, date_str, time_str) and due != self._retries.get((user_id, date_str, time_str)):
+            return False
+        return any(entry.get("time") == time_str for entry in record.reminders.get(date_str, []))
+
+    def next_due(self, after=None):
+        """Seuraava kellonajallinen erääntyminen (tiukasti after-hetken jälkeen)."""
+        while self._heap and not self._live(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        if after is None or self._heap[0][0] > after:
+            return self._heap[0][0]
+        for item in sorted(self._heap):
+            if item[0] > after and self._live(item):
+                return item[0]
+        return None
+
+    def pop_due(self, now):
+        """Poistaa keosta ja palauttaa viimeistään now erääntyneet:
+        lista (erääntymishetki, user_id, päivämäärä, kellonaika)."""
+        due = []
+        seen = set()
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            key = (item[1], item[2], item[3] or None)
+            if key in seen or not self._live(item):
+                continue
+            seen.add(key)
+            self._retries.pop(key, None)
+            due.append((item[0],) + key)
+        return due
+
+    def users_for(self, date_str):
+        """Käyttäjät, joilla on 18:00-viestin muistutuksia päivälle."""
+        return set(self._by_date.get(date_str, ()))
+
+    def overdue_digest(self, now):
+        """Menneiltä 18:00-hetkiltä toimittamatta jääneet: lista
+        (erääntymishetki, user_id, päivämäärä, None)."""
+        result = []
+        for date_str, users in list(self._by_date.items()):
+            for user_id in users:
+                due = self._due(user_id, date_str, None)
+                if due <= now:
+                    result.append((due, user_id, date_str, None))
+        return result
+
+
+def entries_at(record, date_str, time_str):
+    """Käyttäjän päivän muistutustekstit annetulla kellonajalla (None = 18:00-viestin)."""
+    return [entry["text"] for entry in record.reminders.get(date_str, []) if entry.get("time") == time_str]
+
+
+def upcoming(record, today_str):
+    """Käyttäjän tulevat muistutukset listauksen järjestyksessä:
+    lista (päivämäärä, indeksi päivän listassa, muistutus)."""
+    rows = []
+    for date_str, entries in record.reminders.items():
+        if date_str < today_str:
+            continue
+        for i, entry in enumerate(entries):
+            rows.append((date_str, i, entry))
+    rows.sort(key=lambda row: (row[0], row[2].get("time") or DIGEST_TIME.strftime("%H:%M"), row[1]))
+    return rows
@@ -0,0 +1,277 @@
+import asyncio
+import heapq
+import itertools
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from clock import Clock
+
+# Pisin yksittäinen uni. Ajastin herää silti täsmälleen seuraavan ajon
+# kohdalla; tämä vain korjaa tilanteet, joissa kone on ollut lepotilassa
+# tai kello on siirtynyt.
+MAX_SLEEP = 3600
+
+
+# --------- AJASTUSSÄÄNNÖT ---------
+class Cron:
+    """Ajo tiettyyn paikalliseen kellonaikaan, halutessa vain tiettyinä
+    viikonpäivinä (0 = maanantai ... 6 = sunnuntai)."""
+
+    def __init__(self, hour, minute, weekdays=None):
+        self.hour = hour
+        self.minute = minute
+        self.weekdays = frozenset(weekdays) if weekdays is not None else None
+
+    def _at(self, day, tz):
+        return datetime(day.year, day.month, day.day, self.hour, self.minute, tzinfo=tz)
+
+    def _matches(self, day):
+        return self.weekdays is None or day.weekday() in self.weekdays
+
+    def next_after(self, moment):
+        """Ensimmäinen ajohetki, joka on tiukasti moment-hetken jälkeen."""
+        tz = moment.tzinfo
+        day = moment.date()
+        for _ in range(8):
+            if self._matches(day):
+                candidate = self._at(day, tz)
+                if candidate > moment:
+                    return candidate
+            day += timedelta(days=1)
+        raise ValueError("Cron ilman yhtään viikonpäivää")
+
+    def last_at_or_before(self, moment):
+        """Viimeisin ajohetki, joka on viimeistään moment."""
+        tz = moment.tzinfo
+        day = moment.date()
+        for _ in range(8):
+            if self._matches(day):
+                candidate = self._at(day, tz)
+                if candidate <= moment:
+                    return candidate
+            day -= timedelta(days=1)
+        raise ValueError("Cron ilman yhtään viikonpäivää")
+
+    def describe(self):
+        names = ["ma", "ti", "ke", "to", "pe", "la", "su"]
+        days = "joka päivä" if self.weekdays is None else ",".join(names[d] for d in sorted(self.weekdays))
+        return f"{self.hour:02d}:{self.minute:02d} {days}"
+
+
+class Zoned:
+    """Cron-ajo jokaisen käytössä olevan aikavyöhykkeen paikalliseen aikaan
+    (zones() -> joukko tzinfo-olioita). Vyöhykkeet, joiden kello on samalla
+    hetkellä sama, ovat yksi ajohetki. Työ saa ajohetken sen vyöhykkeen
+    aikana, ja päättelee siitä ryhmän (timezones.TimezoneIndex.users_at)."""
+
+    def __init__(self, cron, zones):
+        self.cron = cron
+        self.zones = zones
+
+    def next_after(self, moment):
+        return min((self.cron.next_after(moment.astimezone(zone)) for zone in self.zones()), default=None)
+
+    def last_at_or_before(self, moment):
+        return max((self.cron.last_at_or_before(moment.astimezone(zone)) for zone in self.zones()), default=None)
+
+    def describe(self):
+        count = len(self.zones())
+        return self.cron.describe() + (f" paikallista aikaa ({count} vyöhykettä)" if count > 1 else "")
+
+
+class Dynamic:
+    """Ajohetket kysytään funktiolta next_fn(moment), joka palauttaa
+    seuraavan hetken tiukasti moment-hetken jälkeen tai None. Väliin jääneitä
+    ajoja ei ajeta perässä; työ hoitaa itse myöhästyneet (ks. reminders.py)."""
+
+    def __init__(self, next_fn, label="dynaaminen"):
+        self.next_fn = next_fn
+        self.label = label
+
+    def next_after(self, moment):
+        return self.next_fn(moment)
+
+    def last_at_or_before(self, moment):
+        return None
+
+    def describe(self):
+        return self.label
+
+
+class Job:
+    __slots__ = ("name", "spec", "callback", "catch_up", "last_run", "running")
+
+    def __init__(self, name, spec, callback, catch_up):
+        self.name = name
+        self.spec = spec
+        self.callback = callback
+        self.catch_up = catch_up  # kuinka myöhässä väliin jäänyt ajo vielä ajetaan
+        self.last_run = None
+        self.running = False
+
+
+# --------- AJASTIN ---------
+class Scheduler:
+    """Yksi ajastin kaikille ajastetuille töille.
+
+    Seuraavat ajohetket ovat kekossa, ja ajastin nukkuu suoraan seuraavaan
+    ajoon asti. Jokaisen työn viimeisin ajo tallennetaan (on_ran), joten
+    uudelleenkäynnistyksen aikana väliin jäänyt ajo voidaan ajaa perässä.
+    Työ saa argumenttina ajohetken, jolle se oli ajastettu.
+    """
+
+    def __init__(self, tz, on_ran=None, metrics=None, clock=None):
+        self.tz = tz
+        self.clock = clock or Clock()  # clock.Clock: simulaattori ajaa virtuaaliaikaa
+        self.on_ran = on_ran  # on_ran(name, ajohetki) -> tallennus
+        self.metrics = metrics  # metrics.Metrics: ajojen kesto ja tulos
+        self.jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._task = None
+        self._wake = None
+        self._running = set()  # käynnissä olevat ajot: vahva viite, ettei GC keskeytä
+
+    def add(self, name, spec, callback, catch_up=timedelta(hours=1)):
+        self.jobs[name] = Job(name, spec, callback, catch_up)
+
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, last_runs=None, now=None, loop=True):
+        """Käynnistää ajastimen. last_runs: name -> ISO-aika viimeisestä ajosta.
+        loop=False laskee vain ajohetket; kutsuja ajaa run_pending()-kutsut
+        itse next_due()-hetkinä (simulaattori)."""
+        now = now or self.clock.now(self.tz)
+        self._prime(last_runs or {}, now)
+        self._wake = asyncio.Event()
+        if loop:
+            self._task = asyncio.create_task(self._loop())
+
+    def _prime(self, last_runs, now):
+        self._heap = []
+        for job in self.jobs.values():
+            last = last_runs.get(job.name)
+            job.last_run = datetime.fromisoformat(last) if last else None
+            due = job.spec.last_at_or_before(now)
+            if job.last_run is None:
+                # ensimmäinen käynnistys: ei ajeta mitään takautuvasti
+                pass
+            elif due is not None and job.last_run < due and now - due <= job.catch_up:
+                # Zoned-työltä on voinut jäädä väliin useampi vyöhyke: vanhimmasta alkaen
+                due = min(due, job.spec.next_after(max(job.last_run, now - job.catch_up)))
+                print(f"[scheduler] ajetaan väliin jäänyt {job.name} ({due:%Y-%m-%d %H:%M %Z})")
+                self._push(due, job)
+                continue
+            self._push(job.spec.next_after(now), job)
+
+    def _push(self, due, job):
+        if due is not None:
+            heapq.heappush(self._heap, (due, next(self._counter), job.name))
+
+    def reschedule(self, name, now=None):
+        """Laskee työn seuraavan ajohetken uudelleen (esim. kun Dynamic-työlle
+        on tullut uusi, aiempi ajohetki) ja herättää ajastimen."""
+        job = self.jobs[name]
+        now = now or self.clock.now(self.tz)
+        self._heap = [item for item in self._heap if item[2] != name]
+        heapq.heapify(self._heap)
+        self._push(job.spec.next_after(now), job)
+        if self._wake is not None:
+            self._wake.set()
+
+    def stop(self):
+        """Pysäyttää silmukan ja peruu kesken olevat ajot."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+
+    async def _loop(self):
+        while True:
+            now = self.clock.now(self.tz)
+            await self.run_pending(now)
+            self._wake.clear()
+            delay = MAX_SLEEP
+            if self._heap:
+                delay = min(delay, (self._heap[0][0] - self.clock.now(self.tz)).total_seconds())
+            if delay > 0:
+                try:
+                    # reschedule() herättää aiemmin, jos keon kärki muuttuu
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_pending(self, now):
+        """Käynnistää kaikki työt, joiden ajohetki on viimeistään now. Saman
+        työn useampi erääntynyt hetki ajetaan peräkkäin yhdessä tehtävässä."""
+        pending = {}
+        while self._heap and self._heap[0][0] <= now:
+            due, _, name = heapq.heappop(self._heap)
+            job = self.jobs[name]
+            self._push(self._following(job, due, now), job)
+            pending.setdefault(name, []).append(due)
+        tasks = []
+        for name, dues in pending.items():
+            task = asyncio.create_task(self._run(self.jobs[name], dues))
+            # event loop pitää tehtävistä vain heikot viitteet
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            tasks.append(task)
+        return tasks
+
+    def _following(self, job, due, now):
+        """Ajohetki due:n jälkeen. Myöhässä ajettaessa väliin jääneet hetket
+        (esim. muiden vyöhykkeiden ajot) ajetaan järjestyksessä, jos ne ovat
+        catch_up-ajan sisällä; Dynamic-työt eivät aja perässä."""
+        if due < now and job.spec.last_at_or_before(now) is not None:
+            following = job.spec.next_after(due)
+            if following is not None and following <= now and now - following <= job.catch_up:
+                return following
+        return job.spec.next_after(max(due, now))
+
+    async def _run(self, job, dues):
+        if job.running:
+            for due in dues:
+                print(f"[scheduler] {job.name} on yhä käynnissä, ohitetaan {due:%H:%M}")
+                if self.metrics is not None:
+                    self.metrics.inc("job_runs_total", job=job.name, status="skipped")
+            return
+        job.running = True
+        try:
+            for due in dues:
+                await self._run_one(job, due)
+        finally:
+            job.running = False
+
+    async def _run_one(self, job, due):
+        # ajo kirjataan ennen suoritusta: kaatuminen kesken ajon ei johda
+        # samojen DM-viestien uudelleenlähetykseen käynnistyksessä
+        job.last_run = due
+        if self.on_ran is not None:
+            self.on_ran(job.name, due)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            await job.callback(due)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception:
+            status = "error"
+            print(f"[scheduler] {job.name} epäonnistui:")
+            traceback.print_exc()
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe("job_seconds", time.perf_counter() - started, job=job.name)
+                self.metrics.inc("job_runs_total", job=job.name, status=status)
+
+    def next_due(self):
+        """Seuraavan ajon hetki tai None."""
+        return self._heap[0][0] if self._heap else None
+
+    def upcoming(self):
+        """Tulevat ajot aikajärjestyksessä: lista (ajohetki, Job)."""
+        return [(due, self.jobs[name]) for due, _, name in sorted(self._heap)]
@@ -0,0 +1,343 @@
+import json
+import sqlite3
+import sys
+import threading
+from datetime import date
+from pathlib import Path
+
+from history import BIT, History, Rollups, register_tasks
+from store import SCHEMA_VERSION, DataStore, JsonBackend, UserRecord
+
+QUERY_CHUNK = 500  # käyttäjää per IN (...)-kysely (SQLiten parametriraja)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id     INTEGER PRIMARY KEY,
+    points      INTEGER NOT NULL DEFAULT 0,
+    last_date   TEXT,
+    streak      INTEGER NOT NULL DEFAULT 0,
+    best_streak INTEGER NOT NULL DEFAULT 0,
+    tz          TEXT,
+    delivery    TEXT
+);
+CREATE TABLE IF NOT EXISTS completions (
+    user_id INTEGER NOT NULL,
+    date    TEXT NOT NULL,
+    task    TEXT NOT NULL,
+    PRIMARY KEY (user_id, date, task)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS completions_user_task_date ON completions (user_id, task, date);
+CREATE TABLE IF NOT EXISTS reminders (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date    TEXT NOT NULL,
+    time    TEXT,
+    text    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reminders_date_user ON reminders (date, user_id);
+CREATE INDEX IF NOT EXISTS reminders_user_date ON reminders (user_id, date);
+CREATE TABLE IF NOT EXISTS rollups (
+    user_id INTEGER PRIMARY KEY,
+    data    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+UPSERT_USER = """
+INSERT INTO users (user_id, points, last_date, streak, best_streak, tz, delivery) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id) DO UPDATE SET
+    points = excluded.points,
+    last_date = excluded.last_date,
+    streak = excluded.streak,
+    best_streak = excluded.best_streak,
+    tz = excluded.tz,
+    delivery = excluded.delivery
+"""
+UPSERT_ROLLUPS = "INSERT INTO rollups (user_id, data) VALUES (?, ?) ON CONFLICT (user_id) DO UPDATE SET data = excluded.data"
+UPSERT_META = "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+
+
+# --------- SQLITE-TALLENNUS ---------
+class SqliteBackend:
+    """Isompien asennusten tallennus: jokainen tehty tehtävä on oma rivinsä
+    completions-taulussa, joten tilastot ovat indeksoituja SQL-koosteita.
+
+    Menneiden päivien historia ja tämän päivän tehtävät ovat samassa
+    taulussa: päivä, joka on käyttäjän last_date, on "today".
+    """
+
+    queries_need_sync = True
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._conn = None  # kirjoitusyhteys (lataus + taustakirjoittaja)
+        self.bytes_read = 0  # kannan koko latauksessa (mittarit)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        # kyselyt ajetaan asyncio.to_thread-säikeissä, jokaisella oma yhteys
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def load(self):
+        self.bytes_read = self.path.stat().st_size if self.path.exists() else 0
+        conn = self._conn = self._connect()
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(reminders)")}
+        if "time" not in columns:
+            # skeemaversio 1: muistutuksilla ei vielä ollut kellonaikaa
+            with conn:
+                conn.execute("ALTER TABLE reminders ADD COLUMN time TEXT")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        if "tz" not in columns:
+            # skeemaversio 3: ei käyttäjäkohtaista aikavyöhykettä
+            with conn:
+                conn.execute("ALTER TABLE users ADD COLUMN tz TEXT")
+        if "delivery" not in columns:
+            # skeemaversio 4: ei DM-jakelun tilaa
+            with conn:
+                conn.execute("ALTER TABLE users ADD COLUMN delivery TEXT")
+        meta = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+        version = meta.get("schema_version", SCHEMA_VERSION)
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Tietokannan skeemaversio {version} on uudempi kuin botin ({SCHEMA_VERSION})."
+            )
+        meta["schema_version"] = SCHEMA_VERSION
+        register_tasks(meta.get("task_bits", ()))
+
+        users = {}
+        for user_id, points, last_date, streak, best_streak, tz, delivery in conn.execute(
+            "SELECT user_id, points, last_date, streak, best_streak, tz, delivery FROM users"
+        ):
+            users[user_id] = UserRecord(
+                points, {}, last_date, streak, best_streak, tz=tz,
+                delivery=json.loads(delivery) if delivery else {},
+            )
+
+        past = {}  # user_id -> {päivämäärä: [tehtävät]}
+        for user_id, date_str, task in conn.execute(
+            "SELECT user_id, date, task FROM completions ORDER BY user_id, date"
+        ):
+            record = users.get(user_id)
+            if record is None:
+                continue
+            if date_str == record.last_date:
+                record.today[task] = True
+            else:
+                past.setdefault(user_id, {}).setdefault(date_str, []).append(task)
+        for user_id, days in past.items():
+            users[user_id].history = History.from_lists(days)
+        for user_id, data in conn.execute("SELECT user_id, data FROM rollups"):
+            # arkistoidut kuukaudet: completions-rivit on poistettu, yhteenvedot jäävät
+            record = users.get(user_id)
+            if record is not None:
+                record.history.rollups = Rollups.decode(json.loads(data))
+
+        for user_id, date_str, time_str, text in conn.execute(
+            "SELECT user_id, date, time, text FROM reminders ORDER BY id"
+        ):
+            record = users.get(user_id)
+            if record is not None:
+                entry = {"text": text}
+                if time_str:
+                    entry["time"] = time_str
+                record.reminders.setdefault(date_str, []).append(entry)
+
+        return users, meta, []
+
+    def prepare(self, store, events, compact=False):
+        """Muuntaa tapahtumat SQL-lauseiksi event loopissa. Käyttäjärivit
+        otetaan muistista tässä hetkessä, joten kirjoitussäie ei koske tietueisiin."""
+        statements = []
+        touched = set()
+        for event in events:
+            kind = event["type"]
+            user_id = event.get("user")
+            if user_id is not None:
+                touched.add(user_id)
+            touched.update(event.get("users", ()))
+            if kind == "task_done":
+                statements.append((
+                    "INSERT OR IGNORE INTO completions (user_id, date, task) VALUES (?, ?, ?)",
+                    (user_id, event["date"], event["task"]),
+                ))
+            elif kind == "tasks_done":
+                statements += [
+                    ("INSERT OR IGNORE INTO completions (user_id, date, task) VALUES (?, ?, ?)",
+                     (user_id, event["date"], task))
+                    for task in event["tasks"]
+                ]
+            elif kind == "task_undone":
+                statements.append((
+                    "DELETE FROM completions WHERE user_id = ? AND date = ? AND task = ?",
+                    (user_id, event["date"], event["task"]),
+                ))
+            elif kind == "day_reset":
+                statements.append((
+                    "DELETE FROM completions WHERE user_id = ? AND date = ?",
+                    (user_id, event["date"]),
+                ))
+            elif kind == "reminder_added":
+                statements.append((
+                    "INSERT INTO reminders (user_id, date, time, text) VALUES (?, ?, ?, ?)",
+                    (user_id, event["date"], event.get("time"), event["text"]),
+                ))
+            elif kind in ("reminders_delivered", "reminders_expired"):
+                statements.append((
+                    "DELETE FROM reminders WHERE id IN ("
+                    "SELECT id FROM reminders WHERE user_id = ? AND date = ? AND time IS ? ORDER BY id LIMIT ?)",
+                    (user_id, event["date"], event.get("time"), event.get("count", -1)),
+                ))
+            elif kind == "reminder_removed":
+                statements.append((
+                    "DELETE FROM reminders WHERE id = ("
+                    "SELECT id FROM reminders WHERE user_id = ? AND date = ? ORDER BY id LIMIT 1 OFFSET ?)",
+                    (user_id, event["date"], event["index"]),
+                ))
+            elif kind == "history_archived":
+                # tämän päivän rivit jäävät, vaikka last_date olisi arkistoitua vanhempi
+                statements.append((
+                    "DELETE FROM completions WHERE user_id = ? AND date < ? AND date IS NOT ?",
+                    (user_id, event["rollups"]["until"], store.users[user_id].last_date),
+                ))
+                statements.append((UPSERT_ROLLUPS, (user_id, json.dumps(event["rollups"]))))
+            elif kind == "meta_set":
+                statements.append((UPSERT_META, (event["key"], json.dumps(event["value"]))))
+            elif kind == "job_ran":
+                statements.append((UPSERT_META, ("jobs", json.dumps(store.meta["jobs"]))))
+            # day_rolled, reward_bought, timezone_set, notifications_set ja
+            # deliveries_recorded näkyvät käyttäjärivillä
+
+        for user_id in touched:
+            record = store.users.get(user_id)
+            if record is not None:
+                statements.append((
+                    UPSERT_USER,
+                    (user_id, record.points, record.last_date, record.streak, record.best_streak, record.tz,
+                     json.dumps(record.delivery) if record.delivery else None),
+                ))
+        statements.append((UPSERT_META, ("schema_version", json.dumps(SCHEMA_VERSION))))
+        return SqlBatch(events, statements)
+
+    def write(self, batch):
+        # yksi transaktio per erä; tavumäärää ei tiedetä (sivut kirjoittaa SQLite)
+        with self._conn:
+            for sql, params in batch.statements:
+                self._conn.execute(sql, params)
+
+    def requeued(self, batch):
+        pass
+
+    # --- kyselyt (indeksoidut koosteet) ---
+    def period_masks(self, store, user_id, start, end):
+        """Päivien bittimaskit väliltä start..end (mukaan lukien), yksi per päivä."""
+        masks = History().window(start, end)
+        first = date.fromisoformat(start)
+        for date_str, task in self._reader().execute(
+            "SELECT date, task FROM completions WHERE user_id = ? AND date BETWEEN ? AND ?",
+            (int(user_id), start, end),
+        ):
+            if task in BIT:
+                masks[(date.fromisoformat(date_str) - first).days] |= 1 << BIT[task]
+        record = store.find_user(user_id)
+        if record is not None:
+            store.archive.fill(int(user_id), record.history.rollups, masks, first.toordinal())
+        return masks
+
+    def period_masks_many(self, store, user_ids, start, end):
+        """period_masks usealle käyttäjälle: {user_id: maskit}. Yksi kysely
+        per QUERY_CHUNK käyttäjää eikä kysely per käyttäjä (viikkoraportti)."""
+        first = date.fromisoformat(start)
+        result = {int(user_id): History().window(start, end) for user_id in user_ids}
+        ids = list(result)
+        conn = self._reader()
+        for i in range(0, len(ids), QUERY_CHUNK):
+            chunk = ids[i:i + QUERY_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            for user_id, date_str, task in conn.execute(
+                f"SELECT user_id, date, task FROM completions WHERE user_id IN ({marks}) AND date BETWEEN ? AND ?",
+                (*chunk, start, end),
+            ):
+                if task in BIT:
+                    result[user_id][(date.fromisoformat(date_str) - first).days] |= 1 << BIT[task]
+        for user_id, masks in result.items():
+            record = store.find_user(user_id)
+            if record is not None:
+                store.archive.fill(user_id, record.history.rollups, masks, first.toordinal())
+        return result
+
+
+class SqlBatch:
+    __slots__ = ("events", "statements")
+
+    def __init__(self, events, statements):
+        self.events = events
+        self.statements = statements
+
+
+# --------- TUONTI JSON-TIEDOSTOSTA ---------
+def import_json(json_path, db_path):
+    """Kertaluontoinen siirto: lukee winter_arc_data.json:n (ja journalin)
+    ja kirjoittaa sen SQLite-kantaan."""
+    source = DataStore(JsonBackend(json_path))
+    source.load()
+
+    backend = SqliteBackend(db_path)
+    backend.load()
+    conn = backend._conn
+    with conn:
+        for user_id, record in source.users.items():
+            conn.execute(
+                UPSERT_USER,
+                (user_id, record.points, record.last_date, record.streak, record.best_streak, record.tz,
+                 json.dumps(record.delivery) if record.delivery else None),
+            )
+            rows = [
+                (user_id, date_str, task)
+                for date_str, tasks in record.history.items()
+                for task in tasks
+            ]
+            if record.last_date is not None:
+                rows += [(user_id, record.last_date, t) for t, done in record.today.items() if done]
+            conn.executemany(
+                "INSERT OR IGNORE INTO completions (user_id, date, task) VALUES (?, ?, ?)", rows
+            )
+            if record.history.rollups is not None:
+                conn.execute(UPSERT_ROLLUPS, (user_id, json.dumps(record.history.rollups.encode())))
+            conn.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+            conn.executemany(
+                "INSERT INTO reminders (user_id, date, time, text) VALUES (?, ?, ?, ?)",
+                [
+                    (user_id, date_str, entry.get("time"), entry["text"])
+                    for date_str, entries in record.reminders.items()
+                    for entry in entries
+                ],
+            )
+        for key, value in source.meta.items():
+            if key == "journal_seq":
+                continue
+            conn.execute(UPSERT_META, (key, json.dumps(value)))
+    source.archive.copy_to(Path(db_path).with_suffix(".archive"))
+    return len(source.users)
+
+
+if __name__ == "__main__":
+    # python sqlite_backend.py winter_arc_data.json winter_arc.db
+    if len(sys.argv) != 3:
+        print("Käyttö: python sqlite_backend.py <winter_arc_data.json> <tietokanta.db>")
+        sys.exit(1)
+    count = import_json(sys.argv[1], sys.argv[2])
+    print(f"Tuotiin {count} käyttäjää kantaan {sys.argv[2]}.")
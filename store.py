@@ -0,0 +1,792 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+from archive import Archive
+from history import History, Rollups, mask_of, register_tasks
+from ranking import RankingIndex
+
+# Nykyinen datatiedoston skeemaversio. Nosta tätä ja lisää migraatio
+# MIGRATIONS-listaan aina kun käyttäjätietueen rakenne muuttuu.
+SCHEMA_VERSION = 5
+
+
+# --------- KÄYTTÄJÄTIETUE ---------
+class UserRecord:
+    """Yhden käyttäjän tiedot muistissa. __slots__ pitää tietueen pienenä
+    myös tuhansilla käyttäjillä."""
+
+    __slots__ = ("points", "today", "last_date", "streak", "best_streak", "history", "reminders", "tz",
+                 "delivery")
+
+    def __init__(self, points=0, today=None, last_date=None, streak=0, best_streak=0,
+                 history=None, reminders=None, tz=None, delivery=None):
+        self.points = points
+        self.today = today if today is not None else {}
+        self.last_date = last_date
+        self.streak = streak
+        self.best_streak = best_streak
+        self.history = history if history is not None else History()  # menneiden päivien tehtävät bittimaskeina
+        # päivämäärä -> lista muistutuksia {"text": ..., "time": "HH:MM"};
+        # ilman kellonaikaa olevat tulevat päivän 18:00-viestissä
+        self.reminders = reminders if reminders is not None else {}
+        self.tz = tz  # IANA-aikavyöhyke (!timezone), None = botin oletus (Suomen aika)
+        # DM-jakelun tila (broadcast.Deliveries): "ok" viimeisin onnistunut päivä,
+        # "failures"/"reason"/"retry" peräkkäiset epäonnistumiset, "off" = !notifications off
+        self.delivery = delivery if delivery is not None else {}
+
+    @classmethod
+    def from_dict(cls, raw):
+        # raw on jo migroitu, joten kaikki kentät löytyvät
+        return cls(
+            points=raw["points"],
+            today=raw["today"],
+            last_date=raw["last_date"],
+            streak=raw["streak"],
+            best_streak=raw["best_streak"],
+            history=History.decode(raw["history"]),
+            reminders=raw["reminders"],
+            tz=raw["tz"],
+            delivery=raw["delivery"],
+        )
+
+    def copy(self):
+        """Kopio, jota voi muuttaa koskematta alkuperäiseen (ks. DataStore.preview)."""
+        return UserRecord(
+            points=self.points,
+            today=dict(self.today),
+            last_date=self.last_date,
+            streak=self.streak,
+            best_streak=self.best_streak,
+            history=self.history.copy(),
+            reminders=self.reminders,
+            tz=self.tz,
+            delivery=self.delivery,
+        )
+
+    def to_dict(self):
+        return {
+            "points": self.points,
+            "today": self.today,
+            "last_date": self.last_date,
+            "streak": self.streak,
+            "best_streak": self.best_streak,
+            "history": self.history.encode(),
+            "reminders": self.reminders,
+            "tz": self.tz,
+            "delivery": self.delivery,
+        }
+
+
+def delivery_issue(record):
+    """Onko käyttäjä kieltänyt DM-raportit tai epäonnistuuko toimitus."""
+    return bool(record.delivery.get("off") or record.delivery.get("failures"))
+
+
+# --------- SKEEMAMIGRAATIOT ---------
+def _migrate_v0_to_v1(data):
+    """Vanhat tiedostot: täydennetään puuttuvat kentät kerralla
+    (korvaa aiemmat setdefault-kutsut jokaisella lukukerralla)."""
+    for user_id_str, raw in data.items():
+        if not user_id_str.isdigit():
+            continue
+        raw.setdefault("points", 0)
+        raw.setdefault("streak", 0)
+        raw.setdefault("best_streak", 0)
+        raw.setdefault("today", {})
+        raw.setdefault("last_date", None)
+        raw.setdefault("history", {})
+        raw.setdefault("reminders", {})
+
+
+def _migrate_v1_to_v2(data):
+    """Muistutukset tekstistä sanakirjoiksi, jotta niille voi antaa kellonajan."""
+    for user_id_str, raw in data.items():
+        if not user_id_str.isdigit():
+            continue
+        for date_str, entries in raw["reminders"].items():
+            raw["reminders"][date_str] = [
+                {"text": entry} if isinstance(entry, str) else entry for entry in entries
+            ]
+
+
+def _migrate_v2_to_v3(data):
+    """Historia listoista tiiviiksi bittimaskitaulukoksi (ks. history.py)."""
+    for user_id_str, raw in data.items():
+        if not user_id_str.isdigit():
+            continue
+        raw["history"] = History.from_lists(raw["history"]).encode()
+
+
+def _migrate_v3_to_v4(data):
+    """Käyttäjäkohtainen aikavyöhyke; puuttuva = botin oletusvyöhyke."""
+    for user_id_str, raw in data.items():
+        if not user_id_str.isdigit():
+            continue
+        raw.setdefault("tz", None)
+
+
+def _migrate_v4_to_v5(data):
+    """DM-jakelun tila (epäonnistumiset, !notifications); puuttuva = ei tietoa."""
+    for user_id_str, raw in data.items():
+        if not user_id_str.isdigit():
+            continue
+        raw.setdefault("delivery", {})
+
+
+# MIGRATIONS[i] vie datan versiosta i versioon i + 1
+MIGRATIONS = [
+    _migrate_v0_to_v1,
+    _migrate_v1_to_v2,
+    _migrate_v2_to_v3,
+    _migrate_v3_to_v4,
+    _migrate_v4_to_v5,
+]
+
+
+def migrate(data):
+    """Ajaa puuttuvat migraatiot. Palauttaa True jos dataa muutettiin."""
+    meta = data.setdefault("_meta", {})
+    version = meta.get("schema_version", 0)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Datatiedoston skeemaversio {version} on uudempi kuin botin ({SCHEMA_VERSION})."
+        )
+    for step in MIGRATIONS[version:]:
+        step(data)
+    meta["schema_version"] = SCHEMA_VERSION
+    return version != SCHEMA_VERSION
+
+
+# --------- TAPAHTUMAT ---------
+# Kaikki muutokset tehdään tapahtumina: sama käsittelijä ajetaan sekä
+# komennon aikana että journalia uudelleen toistettaessa käynnistyksessä.
+EVENT_HANDLERS = {}
+
+
+def event_handler(event_type):
+    def decorator(fn):
+        EVENT_HANDLERS[event_type] = fn
+        return fn
+    return decorator
+
+
+@event_handler("task_done")  # vanhemmissa journaleissa yksi tehtävä per tapahtuma
+def _apply_task_done(store, record, event):
+    record.points += event["points"]
+    record.today[event["task"]] = True
+
+
+@event_handler("tasks_done")
+def _apply_tasks_done(store, record, event):
+    # useampi tehtävä yhdellä komennolla tai napilla: tehtävä -> pisteet
+    for task, points in event["tasks"].items():
+        record.points += points
+        record.today[task] = True
+
+
+@event_handler("task_undone")
+def _apply_task_undone(store, record, event):
+    record.points -= event["points"]
+    record.today.pop(event["task"], None)
+
+
+@event_handler("reward_bought")
+def _apply_reward_bought(store, record, event):
+    record.points -= event["cost"]
+
+
+@event_handler("day_reset")
+def _apply_day_reset(store, record, event):
+    record.today = {}
+
+
+@event_handler("day_rolled")
+def _apply_day_rolled(store, record, event):
+    # Tallennetaan edellisen päivän tehtävät historiaan. Streakin onnistuminen
+    # lasketaan päivänvaihdossa ja kirjataan tapahtumaan, jotta toisto ei
+    # riipu myöhemmin muuttuneista asetuksista. missed = väliin jääneet
+    # kokonaiset päivät (botti alhaalla); tyhjä päivä katkaisee streakin.
+    if record.last_date is not None:
+        tasks = [t for t, done in record.today.items() if done]
+        if tasks:
+            record.history.set_day(record.last_date, tasks)
+        if event["success"] and not event.get("missed"):
+            record.streak += 1
+            record.best_streak = max(record.best_streak, record.streak)
+        elif event["success"]:
+            record.best_streak = max(record.best_streak, record.streak + 1)
+            record.streak = 0
+        else:
+            record.streak = 0
+    record.today = {}
+    record.last_date = event["date"]
+
+
+def _reminder_entry(event):
+    entry = {"text": event["text"]}
+    if event.get("time"):
+        entry["time"] = event["time"]
+    return entry
+
+
+def _drop_reminders(record, date_str, keep):
+    entries = [entry for entry in record.reminders.get(date_str, []) if keep(entry)]
+    if entries:
+        record.reminders[date_str] = entries
+    else:
+        record.reminders.pop(date_str, None)
+
+
+@event_handler("reminder_added")
+def _apply_reminder_added(store, record, event):
+    record.reminders.setdefault(event["date"], []).append(_reminder_entry(event))
+
+
+@event_handler("reminders_delivered")
+@event_handler("reminders_expired")
+def _apply_reminders_delivered(store, record, event):
+    # poistetaan päivän muistutukset, joilla on sama kellonaika (None = 18:00-viestin muistutukset);
+    # expired = liian myöhään toimitettavaksi, poistetaan lähettämättä. count: vain
+    # näin monta ensimmäistä (lähetyksen aikana lisätyt jäävät)
+    time_str = event.get("time")
+    matching = [entry for entry in record.reminders.get(event["date"], []) if entry.get("time") == time_str]
+    dropped = {id(entry) for entry in matching[:event.get("count")]}
+    _drop_reminders(record, event["date"], lambda entry: id(entry) not in dropped)
+
+
+@event_handler("reminder_removed")
+def _apply_reminder_removed(store, record, event):
+    entries = record.reminders.get(event["date"], [])
+    if 0 <= event["index"] < len(entries):
+        del entries[event["index"]]
+    if not entries:
+        record.reminders.pop(event["date"], None)
+
+
+
+@event_handler("timezone_set")
+def _apply_timezone_set(store, record, event):
+    record.tz = event["tz"]
+
+
+@event_handler("notifications_set")
+def _apply_notifications_set(store, record, event):
+    if event["enabled"]:
+        # uusi yritys heti seuraavassa ajossa
+        record.delivery = {"ok": record.delivery["ok"]} if "ok" in record.delivery else {}
+    else:
+        record.delivery["off"] = True
+
+
+@event_handler("deliveries_recorded")
+def _apply_deliveries_recorded(store, record, event):
+    # yksi tapahtuma per DM-ajo; "users" kertoo tallennukselle muuttuneet tietueet
+    for user_id in event["ok"]:
+        delivery = store._record(user_id).delivery
+        delivery["ok"] = event["date"]
+        for key in ("failures", "reason", "retry"):
+            delivery.pop(key, None)
+    for user_id, reason, retry in event["failed"]:
+        delivery = store._record(user_id).delivery
+        delivery["failures"] = delivery.get("failures", 0) + 1
+        delivery["reason"] = reason
+        delivery["retry"] = retry
+
+
+@event_handler("history_archived")
+def _apply_history_archived(store, record, event):
+    # päivät on jo kirjoitettu arkistoon; tietueeseen jäävät yhteenvedot
+    record.history.archive(Rollups.decode(event["rollups"]))
+
+
+@event_handler("meta_set")
+def _apply_meta_set(store, record, event):
+    store.meta[event["key"]] = event["value"]
+
+
+@event_handler("job_ran")
+def _apply_job_ran(store, record, event):
+    store.meta.setdefault("jobs", {})[event["name"]] = event["at"]
+
+
+# --------- JOURNAL ---------
+class Journal:
+    """Append-only tapahtumaloki (yksi JSON-rivi per tapahtuma)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def read(self, after_seq=0):
+        """Palauttaa tapahtumat, joiden seq > after_seq. Kaatumisessa kesken
+        jäänyt viimeinen rivi ohitetaan."""
+        if not self.path.exists():
+            return []
+        events = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                if event["seq"] > after_seq:
+                    events.append(event)
+        return events
+
+    def append(self, events):
+        """Lisää erän tapahtumia ja fsyncaa kerran per erä. Palauttaa kirjoitetut tavut."""
+        data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(data)
+
+    def truncate(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# --------- JSON-TALLENNUS (TILANNEKUVA + JOURNAL) ---------
+class JsonBackend:
+    """Oletustallennus pienille asennuksille: JSON-tilannekuva ja journal.
+
+    Kyselyt lasketaan suoraan muistissa olevasta datasta.
+    """
+
+    queries_need_sync = False
+
+    def __init__(self, path, journal_path=None, compact_every=1000):
+        self.path = Path(path)
+        self.journal = Journal(journal_path or self.path.with_suffix(".journal"))
+        self.compact_every = compact_every  # tapahtumia journalissa ennen tiivistystä
+        self._journal_len = 0
+        self._stale = set()   # käyttäjät, joiden JSON-pala pitää serialisoida uudelleen
+        self._encoded = {}    # int user_id -> valmiiksi serialisoitu JSON-pala
+        self.bytes_read = 0   # edellisessä load()-kutsussa luetut tavut (mittarit)
+
+    def load(self):
+        """Palauttaa (käyttäjät, meta, toistettavat tapahtumat)."""
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.bytes_read = self.path.stat().st_size
+        else:
+            data = {}
+            self.bytes_read = 0
+
+        migrate(data)
+        meta = data.pop("_meta")
+        # asetustiedostosta lisättyjen tehtävien bittipaikat samoiksi kuin ennen
+        register_tasks(meta.get("task_bits", ()))
+        users = {}
+        for user_id_str, raw in data.items():
+            # ohitetaan muut kuin käyttäjäavaimet
+            if not user_id_str.isdigit():
+                continue
+            users[int(user_id_str)] = UserRecord.from_dict(raw)
+        self._encoded = {}
+        self._stale = set(users)
+
+        events = self.journal.read(after_seq=meta.get("journal_seq", 0))
+        self._journal_len = len(events)
+        if self.journal.path.exists():
+            self.bytes_read += self.journal.path.stat().st_size
+        return users, meta, events
+
+    def prepare(self, store, events, compact=False):
+        """Kootaan kirjoituserä event loopissa. Tilannekuvassa serialisoidaan
+        vain edellisen tiivistyksen jälkeen muuttuneet käyttäjät."""
+        for event in events:
+            user_id = event.get("user")
+            if user_id is not None:
+                self._stale.add(user_id)
+            self._stale.update(event.get("users", ()))
+        self._journal_len += len(events)
+        parts = None
+        if compact or self._journal_len >= self.compact_every:
+            parts = self._snapshot(store)
+            self._journal_len = 0
+        return WriteBatch(events, parts)
+
+    def _snapshot(self, store):
+        for user_id in self._stale:
+            record = store.users.get(user_id)
+            if record is None:
+                self._encoded.pop(user_id, None)
+            else:
+                self._encoded[user_id] = json.dumps(record.to_dict(), ensure_ascii=False)
+        self._stale.clear()
+        store.meta["journal_seq"] = store.seq
+        parts = [f'"{user_id}":{encoded}' for user_id, encoded in self._encoded.items()]
+        parts.append('"_meta":' + json.dumps(store.meta, ensure_ascii=False))
+        return parts
+
+    def write(self, batch):
+        """Kirjoittaa erän. Palauttaa kirjoitetut tavut."""
+        written = 0
+        if batch.events:
+            written += self.journal.append(batch.events)
+        if batch.parts is not None:
+            # tilannekuva sisältää journal_seq:n, joten jos kaadutaan ennen
+            # journalin tyhjennystä, vanhat tapahtumat ohitetaan toistossa
+            written += write_snapshot(self.path, batch.parts)
+            self.journal.truncate()
+        return written
+
+    def requeued(self, batch):
+        self._journal_len -= len(batch.events)
+
+    # --- kyselyt ---
+    def period_masks(self, store, user_id, start, end):
+        """Päivien bittimaskit väliltä start..end (mukaan lukien), yksi per
+        päivä, tämä päivä mukaan lukien."""
+        record = store.find_user(user_id)
+        if record is None:
+            return History().window(start, end)
+        masks = record.history.window(start, end)
+        store.archive.fill(user_id, record.history.rollups, masks, date.fromisoformat(start).toordinal())
+        if record.last_date is not None and start <= record.last_date <= end:
+            mask, _ = mask_of(t for t, done in record.today.items() if done)
+            masks[(date.fromisoformat(record.last_date) - date.fromisoformat(start)).days] |= mask
+        return masks
+
+    def period_masks_many(self, store, user_ids, start, end):
+        """period_masks usealle käyttäjälle: {user_id: maskit}."""
+        return {int(user_id): self.period_masks(store, user_id, start, end) for user_id in user_ids}
+
+
+class WriteBatch:
+    """Yhden kirjoituskierroksen sisältö: journaliin lisättävät tapahtumat ja
+    tiivistyksessä myös uusi tilannekuva."""
+
+    __slots__ = ("events", "parts")
+
+    def __init__(self, events, parts):
+        self.events = events
+        self.parts = parts
+
+
+def write_snapshot(path, parts):
+    """Kirjoittaa tilannekuvan väliaikaistiedostoon ja vaihtaa sen atomisesti
+    paikalleen, joten kaatuminen kesken kirjoituksen ei riko vanhaa tiedostoa.
+    Palauttaa tiedoston koon tavuina."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("{")
+        f.write(",\n".join(parts))
+        f.write("}\n")
+        f.flush()
+        os.fsync(f.fileno())
+        size = os.fstat(f.fileno()).st_size
+    os.replace(tmp_path, path)
+    return size
+
+
+# --------- MUISTISSA PYSYVÄ TIETOVARASTO ---------
+class DataStore:
+    """Lataa datan kerran käynnistyksessä ja pitää sen muistissa.
+
+    Komennot lukevat tietueita suoraan, mutta muuttavat niitä vain apply():n
+    kautta. Tapahtumat kirjoitetaan valitun tallennustavan (JsonBackend,
+    BinaryBackend tai SqliteBackend) kautta PersistenceWorkerin taustasäikeessä.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.users = {}  # int user_id -> UserRecord
+        self.meta = {}
+        self.ranking = RankingIndex()  # pisteiden mukaan järjestetty, päivittyy tapahtumista
+        self.modified = {}  # user_id -> viimeisimmän tapahtuman seq (kuvien välimuistin avain)
+        self.on_dirty = None  # kutsutaan aina kun jotain muuttuu (esim. writer.notify)
+        self.on_ranking = None  # kutsutaan, kun jonkun pisteet muuttuvat (elävä pistetaulukko)
+        self.sync = None      # async-kutsu, joka odottaa odottavien tapahtumien kirjoituksen
+        self.metrics = None   # metrics.Metrics: latauksen ja kirjoitusten kesto ja tavut
+        self.archive = Archive(backend.path.with_suffix(".archive"))  # arkistoidut historiakuukaudet
+        self.seq = 0
+        self._pending = []    # kirjoittamattomat tapahtumat
+
+    def load(self):
+        started = time.perf_counter()
+        users, meta, events = self.backend.load()
+        self.users = users
+        self.meta = meta
+        if hasattr(users, "points"):
+            # binary_backend.LazyUsers: pisteet indeksistä purkamatta tietueita
+            self.ranking.rebuild(users.points())
+        else:
+            self.ranking.rebuild((user_id, record.points) for user_id, record in users.items())
+        self.seq = meta.get("journal_seq", 0)
+        # toistetaan tilannekuvan jälkeen journaloidut tapahtumat
+        for event in events:
+            # uudelleenyritetty erä voi olla journalissa kahdesti
+            if event["seq"] <= self.seq:
+                continue
+            self._apply(event)
+            self.seq = event["seq"]
+        self._pending = []
+        if self.metrics is not None:
+            self.metrics.observe("storage_seconds", time.perf_counter() - started, op="load")
+            self.metrics.inc("storage_bytes_total", self.backend.bytes_read, op="load")
+
+    def _record(self, user_id):
+        record = self.users.get(user_id)
+        if record is None:
+            record = UserRecord()
+            self.users[user_id] = record
+            self.ranking.update(user_id, 0)
+        return record
+
+    def get_user(self, user_id):
+        """Palauttaa käyttäjän tietueen, luo uuden tarvittaessa. Uusi tietue
+        tallentuu ensimmäisen tapahtumansa myötä."""
+        return self._record(int(user_id))
+
+    def find_user(self, user_id):
+        """Kuten get_user, mutta ei luo uutta käyttäjää."""
+        return self.users.get(int(user_id))
+
+    def last_date_of(self, user_id):
+        """Käyttäjän viimeisin päivä (last_date) tai None. Laiskasti ladatulta
+        käyttäjältä luetaan vain tilannekuvan sarake."""
+        if hasattr(self.users, "last_date"):
+            return self.users.last_date(user_id)
+        return self.users[user_id].last_date
+
+    def with_reminders(self):
+        """(user_id, tietue) käyttäjille, joilla voi olla muistutuksia. Laiskasti
+        ladatuista käyttäjistä puretaan vain ne, joilla muistutuksia on."""
+        if hasattr(self.users, "with_reminders"):
+            return self.users.with_reminders()
+        return self.users.items()
+
+    def with_timezone(self):
+        """Kuten with_reminders, mutta !timezone-asetuksen tehneille."""
+        if hasattr(self.users, "with_timezone"):
+            return self.users.with_timezone()
+        return self.users.items()
+
+    def with_delivery_issues(self):
+        """Kuten with_reminders, mutta käyttäjille, joiden DM-raportit ovat pois
+        tai epäonnistuvat (ks. broadcast.Deliveries)."""
+        if hasattr(self.users, "with_delivery_issues"):
+            return self.users.with_delivery_issues()
+        return ((user_id, record) for user_id, record in list(self.users.items()) if delivery_issue(record))
+
+    def with_history_before(self, ordinal):
+        """(user_id, tietue) käyttäjille, joiden historia alkaa ennen päivää
+        ordinal (arkistointi). Laiskasti ladatuista puretaan vain ne."""
+        if hasattr(self.users, "with_history_before"):
+            return self.users.with_history_before(ordinal)
+        cut = date.fromordinal(ordinal).isoformat()
+        return (
+            (user_id, record) for user_id, record in list(self.users.items())
+            if (record.history.start or ordinal) < ordinal or any(d < cut for d in record.history.extra)
+        )
+
+    def _apply(self, event):
+        user_id = event.get("user")
+        if user_id is None:
+            EVENT_HANDLERS[event["type"]](self, None, event)
+            return
+        record = self._record(user_id)
+        self.modified[user_id] = event["seq"]
+        points = record.points
+        EVENT_HANDLERS[event["type"]](self, record, event)
+        if record.points != points:
+            self.ranking.update(user_id, record.points)
+            if self.on_ranking is not None:
+                self.on_ranking()
+
+    def apply(self, event_type, user_id=None, **fields):
+        """Tekee muutoksen tapahtumana ja jonottaa sen kirjoitettavaksi."""
+        event = {"type": event_type}
+        if user_id is not None:
+            event["user"] = int(user_id)
+        event.update(fields)
+        self.seq += 1
+        event["seq"] = self.seq
+        self._apply(event)
+        self._pending.append(event)
+        if self.on_dirty is not None:
+            self.on_dirty()
+        return event
+
+    def preview(self, event_type, user_id, **fields):
+        """Kuten apply, mutta tietueen kopioon: tapahtumaa ei kirjata, eikä
+        tietue tai pistetaulukko muutu. Vain käyttäjän omaa tietuetta
+        muuttaville tapahtumille (esim. day_rolled lukevissa komennoissa)."""
+        record = self.users[int(user_id)].copy()
+        event = {"type": event_type, "user": int(user_id), **fields}
+        EVENT_HANDLERS[event_type](self, record, event)
+        return record
+
+    @property
+    def dirty(self):
+        return bool(self._pending)
+
+    def drain(self, compact=False):
+        """Ottaa talteen odottavat tapahtumat kirjoituseräksi. Ajetaan event
+        loopissa, jotta tietueita ei muokata kesken serialisoinnin.
+        Palauttaa None, jos kirjoitettavaa ei ole."""
+        if not self._pending and not compact:
+            return None
+        events, self._pending = self._pending, []
+        return self.backend.prepare(self, events, compact)
+
+    def requeue(self, batch):
+        """Palauttaa epäonnistuneen erän tapahtumat jonon alkuun."""
+        self._pending = batch.events + self._pending
+        self.backend.requeued(batch)
+
+    def save(self):
+        """Kirjoittaa kaiken heti samassa säikeessä (työkaluja ja sammutusta varten)."""
+        self.backend.write(self.drain(compact=True))
+
+    async def query(self, name, *args):
+        """Ajaa tallennustavan kyselyn. SQLitelle kysely ajetaan omassa
+        säikeessään vasta kun odottavat tapahtumat on kirjoitettu."""
+        fn = getattr(self.backend, name)
+        if not self.backend.queries_need_sync:
+            return fn(self, *args)
+        if self.sync is not None:
+            await self.sync()
+        return await asyncio.to_thread(fn, self, *args)
+
+
+# --------- TAUSTAKIRJOITTAJA ---------
+class PersistenceWorker:
+    """Oma säie levylle kirjoittamiseen, ettei event loop koskaan odota tiedostoa.
+
+    notify() herättää säikeen; säie odottaa `interval` sekuntia, jotta
+    peräkkäiset tapahtumat (esim. !done-ryöppy) kirjoitetaan yhtenä eränä.
+    """
+
+    def __init__(self, store, interval=0.5):
+        self.store = store
+        self.interval = interval
+        self._loop = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._urgent = False
+        self._waiters = []  # sync()-kutsujen futuret, ratkaistaan kun erä on levyllä
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        # threading.Event.set on kevyt ja säieturvallinen
+        self._wake.set()
+
+    async def sync(self):
+        """Odottaa, että kaikki tähän mennessä tehdyt tapahtumat on kirjoitettu."""
+        if not self.is_running():
+            self._write(self.store.drain())
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._urgent = True
+        self._wake.set()
+        await future
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            if self._stop.is_set():
+                break
+            # kootaan lyhyen ajan muutokset yhteen kirjoitukseen
+            if not self._urgent:
+                self._stop.wait(self.interval)
+            self._urgent = False
+            self._wake.clear()
+            try:
+                batch, waiters = self._on_loop(self._collect)
+            except Exception as e:
+                print(f"[persistence] erän kokoaminen epäonnistui: {e}")
+                continue
+            if self._write(batch):
+                self._resolve(waiters)
+            else:
+                self._on_loop(self._waiters.extend, waiters)
+
+    def _collect(self):
+        waiters, self._waiters = self._waiters, []
+        return self.store.drain(), waiters
+
+    def _resolve(self, waiters):
+        for future in waiters:
+            future.get_loop().call_soon_threadsafe(_set_done, future)
+
+    def _on_loop(self, fn, *args):
+        """Ajaa fn:n event loopissa ja odottaa tuloksen. Jos loop ei aja,
+        fn ajetaan suoraan tässä säikeessä."""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            return fn(*args)
+
+        async def call():
+            return fn(*args)
+
+        future = asyncio.run_coroutine_threadsafe(call(), loop)
+        while True:
+            try:
+                return future.result(timeout=1.0)
+            except TimeoutError:
+                # loop pysähtyi ennen kuin ehti ajaa kutsun -> tehdään se tässä
+                if not loop.is_running():
+                    future.cancel()
+                    return fn(*args)
+
+    def _write(self, batch):
+        if batch is None:
+            return True
+        metrics = self.store.metrics
+        with self._write_lock:
+            try:
+                started = time.perf_counter()
+                written = self.store.backend.write(batch)
+                if metrics is not None:
+                    metrics.observe("storage_seconds", time.perf_counter() - started, op="write")
+                    if written is not None:
+                        metrics.inc("storage_bytes_total", written, op="write")
+                return True
+            except Exception as e:
+                if metrics is not None:
+                    metrics.inc("storage_errors_total")
+                # palautetaan erä jonoon ja yritetään uudelleen hetken päästä
+                print(f"[persistence] tallennus epäonnistui: {e}")
+                self._on_loop(self.store.requeue, batch)
+                self._wake.set()
+                time.sleep(self.interval)
+                return False
+
+    def flush(self):
+        """Pysäyttää säikeen ja kirjoittaa kaiken odottavan (JSON-tallennuksessa
+        journal tiivistetään tilannekuvaksi). Kutsutaan sammutuksessa, kun
+        event loop ei enää aja."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._write_lock:
+            self.store.save()
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(None)
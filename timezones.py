@@ -0,0 +1,120 @@
+import re
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+from clock import Clock
+
+# UTC+3, utc-5, GMT+10 -> Etc/GMT-3 jne. (Etc-vyöhykkeiden etumerkki on käänteinen)
+UTC_OFFSET = re.compile(r"(?:utc|gmt)\s*([+-])\s*(\d{1,2})(?::00)?", re.IGNORECASE)
+
+_names = None  # pienaakkosnimi -> IANA-nimi, luetaan ensimmäisellä käytöllä
+
+
+def parse_timezone(text):
+    """Käyttäjän antama aikavyöhyke IANA-nimeksi: 'Europe/London',
+    'europe/london', 'UTC', 'UTC+3' tai 'GMT-5'. None, jos ei tunnistettu."""
+    global _names
+    text = text.strip()
+    match = UTC_OFFSET.fullmatch(text)
+    if match:
+        sign, hours = match.groups()
+        hours = int(hours)
+        if hours == 0:
+            return "UTC"
+        if hours > (14 if sign == "+" else 12):
+            return None
+        return f"Etc/GMT{'-' if sign == '+' else '+'}{hours}"
+    if _names is None:
+        _names = {name.lower(): name for name in available_timezones()}
+    name = _names.get(text.lower())
+    if name is not None:
+        return name
+    try:
+        # järjestelmässä ei ehkä ole vyöhykeluetteloa (esim. Windows ilman tzdataa)
+        return ZoneInfo(text).key
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+# --------- AIKAVYÖHYKEINDEKSI ---------
+class TimezoneIndex:
+    """Käyttäjien aikavyöhykkeet ryhmiteltyinä.
+
+    Päivänvaihto ja illan DM-ajot ajetaan jokaiselle vyöhykkeelle sen
+    paikalliseen aikaan (scheduler.Zoned). Ajo saa ajohetken sen vyöhykkeen
+    aikana, jolle se ajastettiin, ja users_at() palauttaa vain ne käyttäjät,
+    joiden kello näyttää samaa (sama UTC-poikkeama sillä hetkellä). Ilman
+    asetusta olevat käyttäjät ovat oletusvyöhykkeessä, eikä heitä indeksoida.
+    """
+
+    def __init__(self, store, default, clock=None):
+        self.store = store
+        self.default = default
+        self.clock = clock or Clock()
+        self._users = {}    # vyöhykkeen nimi -> {user_id}, vain !timezone-asetuksen tehneet
+        self._zone_of = {}  # user_id -> ZoneInfo
+
+    def rebuild(self):
+        self._users = {}
+        self._zone_of = {}
+        for user_id, record in self.store.with_timezone():
+            if record.tz:
+                self._add(user_id, record.tz)
+
+    def _add(self, user_id, name):
+        self._users.setdefault(name, set()).add(user_id)
+        self._zone_of[user_id] = ZoneInfo(name)
+
+    def refresh(self, user_id):
+        """Päivittää käyttäjän vyöhykkeen tietueesta (!timezone)."""
+        old = self._zone_of.pop(user_id, None)
+        if old is not None:
+            users = self._users[old.key]
+            users.discard(user_id)
+            if not users:
+                del self._users[old.key]
+        record = self.store.find_user(user_id)
+        if record is not None and record.tz:
+            self._add(user_id, record.tz)
+
+    def zone_of(self, user_id):
+        return self._zone_of.get(user_id, self.default)
+
+    def zones(self):
+        """Käytössä olevat vyöhykkeet (oletus aina mukana)."""
+        return {self.default} | {ZoneInfo(name) for name in self._users}
+
+    def counts(self):
+        """Vyöhykkeen nimi -> käyttäjiä; oletusvyöhykkeeseen lasketaan asetuksettomat."""
+        counts = {name: len(users) for name, users in self._users.items()}
+        default = len(self.store.users) - len(self._zone_of)
+        counts[self.default.key] = counts.get(self.default.key, 0) + default
+        return counts
+
+    def local(self, user_id, now=None):
+        """Käyttäjän paikallinen aika (now = mikä tahansa aikavyöhyketietoinen hetki)."""
+        zone = self.zone_of(user_id)
+        return now.astimezone(zone) if now is not None else self.clock.now(zone)
+
+    def user_ids_at(self, moment):
+        """Käyttäjät, joiden paikallinen kello hetkellä moment on sama kuin
+        momentin oma: ajo 18:00 Lontoon aikaa koskee kaikkia, joiden
+        vyöhykkeessä on silloin 18:00, mutta ei muita. Tietueita ei lueta."""
+
+        def matches(zone):
+            return moment.replace(tzinfo=zone).utcoffset() == moment.utcoffset()
+
+        buckets = [users for name, users in self._users.items() if matches(ZoneInfo(name))]
+        if matches(self.default):
+            for user_id in list(self.store.users):
+                if user_id not in self._zone_of:
+                    yield user_id
+        for users in buckets:
+            yield from list(users)
+
+    def users_at(self, moment):
+        """Kuten user_ids_at, mutta (user_id, tietue); tietue luetaan vasta,
+        kun sitä pyydetään (binääritallennuksessa mmap:sta)."""
+        for user_id in self.user_ids_at(moment):
+            record = self.store.find_user(user_id)
+            if record is not None:
+                yield user_id, record
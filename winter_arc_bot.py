@@ -1,218 +1,243 @@
+import asyncio
+import calendar
 import discord
+import io
 import os
-from discord.ext import commands, tasks
-import json
+import time
+from discord.ext import commands
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from typing import Optional
 from zoneinfo import ZoneInfo  # aikavyöhyke Suomea varten
 
-TOKEN = os.environ["DISCORD_TOKEN"]
+from store import JsonBackend, UserRecord
+from sqlite_backend import SqliteBackend
+from binary_backend import BinaryBackend
+from guilds import HOME, Partitions
+from scheduler import Cron, Dynamic, Scheduler, Zoned
+from clock import Clock
+from broadcast import Broadcaster, Deliveries
+from history import TASK_BITS, Rollups, mask_value, month_first
+from archive import Archive
+from plans import DAY_NAMES
+from config import CHANNEL_KEYS, ConfigError, Settings
+from reminders import LATE_GRACE, RETRY_DELAY, entries_at, upcoming
+from metrics import Metrics, instrument_discord
+from live import LiveMessage
+from charts import ChartRenderer, heatmap as render_heatmap, progress as render_progress
+from timezones import parse_timezone
 
-
-# KANAVA-ID:t
-TODAY_PLAN_CHANNEL_ID = 1440185625100943451  # #today-plan
-WEEK_VISION_CHANNEL_ID = 1440185692796751942  # #week-vision
-LEADERBOARD_CHANNEL_ID = 1440429546175463534  # #leaderboard
 FIN_TZ = ZoneInfo("Europe/Helsinki")  # Suomen aikavyöhyke
+# Kaikki "nyt"-kyselyt tämän kautta; benchmarks/simulate.py ajaa kelloa virtuaaliajassa
+clock = Clock()
 
 intents = discord.Intents.default()
 intents.message_content = True  # tärkeä, että komennot toimivat
 bot = commands.Bot(command_prefix="!", intents=intents)
 
-DATA_FILE = Path("winter_arc_data.json")
-
-# --------- POINT SYSTEM: TASKS ---------
-TASKS = {
-    # Päivittäinen rutiini
-    "wake": 3,             # Herätys 05:30
-    "morning_workout": 2,  # Aamujumppa
-    "protein": 1,          # Proteiinitavoite
-    "water": 1,            # 2–3L vettä
-    "vitamins": 1,
-    "stretch": 1,          # Iltavenyttely
-    "tidy": 1,             # Päivän 10–15min siivous
-    "sleep_early": 2,      # Nukkumaan ennen 21:30
-    "no_phone": 3,         # Ei puhelinta klo 20 jälkeen
-
-    # Treenit (päiväkohtaiset)
-    "gym_push": 4,         # Maanantai
-    "gym_pull": 4,         # Keskiviikko
-    "gym_legs": 4,         # Perjantai
-    "light_activity": 2,   # Ti / To (kävely yms.)
-
-    # Kotihommat
-    "groceries": 2,        # Ma & Pe
-    "dishes": 2,           # Ti & La
-    "laundry": 2,          # Ke & Su
-    "clean_quick": 3,      # To pikasiivous
-    "big_clean": 5,        # Su isompi siivous
-}
-
-# --------- REWARDS ---------
-REWARDS = {
-    "tiktok10": 5,
-    "tiktok20": 8,
-    "gaming30": 10,
-    "gaming60": 20,
-    "movie": 35,
-}
-
-# --------- WEEK STRUCTURE (Winter Arc) ---------
-DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-
-DAY_PLAN = {
-    "Monday": {
-        "label": "PUSH DAY + Groceries",
-        "core_tasks": ["gym_push", "groceries"],
-    },
-    "Tuesday": {
-        "label": "RECOVERY + Dishes",
-        "core_tasks": ["light_activity", "dishes"],
-    },
-    "Wednesday": {
-        "label": "PULL DAY + Laundry",
-        "core_tasks": ["gym_pull", "laundry"],
-    },
-    "Thursday": {
-        "label": "LIGHT DAY + Quick clean",
-        "core_tasks": ["light_activity", "clean_quick"],
-    },
-    "Friday": {
-        "label": "LEG DAY + Groceries",
-        "core_tasks": ["gym_legs", "groceries"],
-    },
-    "Saturday": {
-        "label": "Optional training + Dishes",
-        "core_tasks": ["dishes"],
-    },
-    "Sunday": {
-        "label": "FULL RESET + Laundry + Big clean",
-        "core_tasks": ["laundry", "big_clean"],
-    },
-}
+# Komentojen, ajojen, tallennuksen ja Discord-kutsujen mittarit: !perf ja
+# Prometheus-päätepiste http://127.0.0.1:9108/metrics (0 = ei päätepistettä)
+metrics = Metrics()
+instrument_discord(bot, metrics)
+METRICS_PORT = int(os.environ.get("WINTER_ARC_METRICS_PORT", "9108"))
+
+# Isommille asennuksille SQLite: aseta WINTER_ARC_DB=winter_arc.db
+# (siirto vanhasta tiedostosta: python sqlite_backend.py winter_arc_data.json winter_arc.db)
+DB_FILE = os.environ.get("WINTER_ARC_DB")
+# Nopea käynnistys suurella käyttäjämäärällä: WINTER_ARC_FORMAT=binary lukee
+# muistikartoitetun tilannekuvan winter_arc_data.wab (binary_backend.py)
+# (siirto: python binary_backend.py winter_arc_data.json winter_arc_data.wab)
+BINARY = os.environ.get("WINTER_ARC_FORMAT") == "binary"
+DATA_FILE = Path("winter_arc_data.wab" if BINARY else "winter_arc_data.json")
+
+if DB_FILE:
+    Backend, SUFFIX = SqliteBackend, ".db"
+elif BINARY:
+    Backend, SUFFIX = BinaryBackend, ".wab"
+else:
+    Backend, SUFFIX = JsonBackend, ".json"
+
+# Jokaisella palvelimella on oma dataosionsa (guilds.py). Kotipalvelin ja
+# yksityisviestit käyttävät yllä olevaa tiedostoa, muut palvelimet omaa
+# tiedostoaan hakemistossa GUILD_DIR (<guild_id>.json, .wab tai .db).
+GUILD_DIR = Path(os.environ.get("WINTER_ARC_GUILDS", "guilds"))
+
+partitions = Partitions(
+    Backend(DB_FILE or DATA_FILE),
+    GUILD_DIR,
+    SUFFIX,
+    Backend,
+    FIN_TZ,
+    metrics,
+    clock,
+)  # ladataan kerran käynnistyksessä, pidetään muistissa
+broadcaster = Broadcaster(bot, concurrency=8, metrics=metrics, clock=clock)  # ajastettujen DM-raporttien jakelu
+scheduler = Scheduler(
+    FIN_TZ,
+    # ajastus on yhteinen kaikille palvelimille, viimeisimmät ajot kotiosioon
+    on_ran=lambda name, when: partitions.home.store.apply("job_ran", name=name, at=when.isoformat()),
+    metrics=metrics,
+    clock=clock,
+)
+metrics.gauge("users", lambda: sum(len(part.store.users) for part in partitions), "Käyttäjiä muistissa")
+metrics.gauge("guilds", lambda: len(partitions), "Palvelinosioita")
+
+# --------- ASETUKSET ---------
+# Tehtävät ja pisteet, palkinnot, viikko-ohjelma, rutiinit ja kanava-ID:t
+# luetaan tiedostosta; muutokset käyttöön ilman uudelleenkäynnistystä: !reload
+CONFIG_FILE = Path(os.environ.get("WINTER_ARC_CONFIG", "winter_arc_config.json"))
+settings = Settings(CONFIG_FILE)  # settings.current = voimassa oleva Config
+
+def reload_config():
+    """Lukee asetustiedoston ja ottaa sen käyttöön kerralla. Virheellinen
+    tiedosto nostaa ConfigErrorin ja vanhat asetukset jäävät voimaan."""
+    cfg = settings.reload()
+    for part in partitions:
+        save_task_bits(part)
+        part.leaderboard.interval = cfg.leaderboard_interval
+        part.deliveries.inactive_days = cfg.dm_inactive_days
+    return cfg
+
+def save_task_bits(part):
+    if part.store.meta.get("task_bits") != TASK_BITS:
+        # uusien tehtävien bittipaikat talteen, jotta historia tulkitaan samoin jatkossakin
+        part.store.apply("meta_set", key="task_bits", value=list(TASK_BITS))
+
+def open_partition(part):
+    """Ladatun osion valmistelu (käynnistyksessä ja uuden palvelimen ensimmäisellä komennolla)."""
+    if settings.current is not None:
+        save_task_bits(part)
+    part.timezones.rebuild()
+    part.reminders.rebuild()
+    part.deliveries = Deliveries(part.store, settings.current.dm_inactive_days if settings.current is not None else 0)
+    part.leaderboard = LiveMessage(
+        bot,
+        render=lambda: build_leaderboard_embed(part),
+        target=lambda: (
+            channel_id_for(part, settings.current, "leaderboard"),
+            part.store.meta.get("leaderboard_message_id"),
+        ),
+        remember=lambda message_id: part.store.apply("meta_set", key="leaderboard_message_id", value=message_id),
+        interval=settings.current.leaderboard_interval if settings.current is not None else 0,
+        clock=clock,
+    )
+    # pisteiden muutos päivittää pistetaulukkoviestin (koottuna, ks. live.py)
+    part.store.on_ranking = part.leaderboard.touch
 
-# Päivittäiset rutiinitehtävät streakin laskentaa varten
-DAILY_ROUTINE_TASKS = [
-    "wake",
-    "morning_workout",
-    "protein",
-    "water",
-    "vitamins",
-    "stretch",
-    "tidy",
-    "sleep_early",
-    "no_phone",
-]
-MIN_TASKS_FOR_STREAK = 5  # vähintään näin monta rutiinia / päivä -> onnistunut päivä
+partitions.on_open = open_partition
 
 # --------- DATA HELPERS ---------
-def load_data():
-    if DATA_FILE.exists():
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_data(data):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-def get_user(data, user_id):
-    user_id = str(user_id)
-    if user_id not in data:
-        data[user_id] = {
-            "points": 0,
-            "today": {},
-            "last_date": None,
-            "streak": 0,
-            "best_streak": 0,
-            "history": {},    # menneiden päivien tehtävät
-            "reminders": {},  # päivämäärä -> lista muistutuksista
-        }
-    else:
-        # varmistetaan että kentät löytyy myös vanhoille käyttäjille
-        data[user_id].setdefault("streak", 0)
-        data[user_id].setdefault("best_streak", 0)
-        data[user_id].setdefault("today", {})
-        data[user_id].setdefault("last_date", None)
-        data[user_id].setdefault("history", {})
-        data[user_id].setdefault("reminders", {})
-    return data[user_id]
-
-def get_today_name():
+def partition_for(ctx):
+    """Komennon palvelimen dataosio; yksityisviestit kotiosioon."""
+    guild_id = ctx.guild.id if ctx.guild is not None else None
+    return partitions.get(partitions.key_for(guild_id, settings.current.home_guild))
+
+def channel_id_for(part, cfg, name):
+    """Osion kanava: !setchannel-asetus, kotiosiolle muuten asetustiedoston kanava."""
+    channel_id = part.channels.get(name)
+    if channel_id is None and part.key == HOME:
+        channel_id = cfg.channels[name]
+    return channel_id or None
+
+def get_user(part, user_id):
+    return part.store.get_user(user_id)
+
+def user_now(part, user_id):
+    """Käyttäjän paikallinen aika (!timezone, oletuksena Suomen aika)."""
+    return part.timezones.local(int(user_id))
+
+def get_today_name(now=None):
     # Käytetään Suomen aikavyöhykettä
-    today = datetime.now(FIN_TZ)
+    today = now or clock.now(FIN_TZ)
     weekday_index = today.weekday()  # 0 = Monday
     return DAY_NAMES[weekday_index]
 
-def reset_if_new_day(user_data):
-    """Tarkistaa onko uusi päivä. Jos on, tallentaa eilisen historiaan
-    ja päivittää streakin ennen 'today'-tietojen nollausta."""
-    today = datetime.now(FIN_TZ)
-    today_str = today.strftime("%Y-%m-%d")
-    last_date = user_data.get("last_date")
-
-    if last_date != today_str:
-        # Arvioidaan edellinen päivä, jos sellainen on
-        if last_date is not None:
-            # Tallenna eilisen tehtävät historiaan
-            history = user_data.setdefault("history", {})
-            done_tasks = [t for t, done in user_data["today"].items() if done]
-            history[last_date] = done_tasks
-
-            # Streak-logiikka eilisen perusteella
-            done_count = sum(
-                1 for t in DAILY_ROUTINE_TASKS if user_data["today"].get(t)
-            )
-            success = done_count >= MIN_TASKS_FOR_STREAK
-
-            if success:
-                user_data["streak"] = user_data.get("streak", 0) + 1
-                user_data["best_streak"] = max(
-                    user_data.get("best_streak", 0),
-                    user_data["streak"],
-                )
-            else:
-                user_data["streak"] = 0
-
-        # Nollataan tämän päivän suoritukset ja päivitetään päivämäärä
-        user_data["today"] = {}
-        user_data["last_date"] = today_str
+def day_succeeded(cfg, user_data):
+    """Täyttääkö käyttäjän nykyinen päivä streakin rajan."""
+    done_count = sum(1 for t in cfg.routine_tasks if user_data.today.get(t))
+    return done_count >= cfg.min_tasks_for_streak
+
+def day_rolled_fields(user_data, today_str):
+    """day_rolled-tapahtuman kentät tai None, jos päivä on jo today_str."""
+    if user_data.last_date is None or user_data.last_date >= today_str:
+        return None
+    missed = (date.fromisoformat(today_str) - date.fromisoformat(user_data.last_date)).days - 1
+    return {"date": today_str, "success": day_succeeded(settings.current, user_data), "missed": missed}
+
+def roll_user(part, user_id, user_data, today_str):
+    """Käyttäjän päivänvaihto: eilinen historiaan, streak päivitetään ja
+    'today' tyhjennetään. Useamman päivän aukko (botti alhaalla) kirjataan
+    väliin jääneinä päivinä, jotka katkaisevat streakin. True, jos vaihdettiin."""
+    fields = day_rolled_fields(user_data, today_str)
+    if fields is None:
+        return False
+    part.store.apply("day_rolled", user_id, **fields)
+    return True
+
+def roll_over(part, user_ids, now):
+    """Päivänvaihto käyttäjille user_ids: päivä on kunkin käyttäjän paikallinen
+    päivä hetkellä now. Vanhentuneet valitaan last_date-arvosta, joten
+    binääritallennuksessa puretaan vain vaihdettavien tietueet."""
+    days = {}  # aikavyöhyke -> päivämäärä
+    rolled = 0
+    for user_id in user_ids:
+        zone = part.timezones.zone_of(user_id)
+        today_str = days.get(zone)
+        if today_str is None:
+            today_str = days[zone] = now.astimezone(zone).strftime("%Y-%m-%d")
+        last = part.store.last_date_of(user_id)
+        if last is None or last >= today_str:
+            continue
+        rolled += roll_user(part, user_id, part.store.users[user_id], today_str)
+    shown = ", ".join(sorted(set(days.values())))
+    print(f"[rollover] {shown or now.strftime('%Y-%m-%d')} {part.key or 'home'}: {rolled} käyttäjää")
+
+def load_user(part, user_id):
+    """Hakee käyttäjän osiosta kirjoittavalle komennolle; tuntematon käyttäjä
+    luodaan. Päivänvaihto on jo tehty käyttäjän keskiyön ajossa; tässä
+    tarkistetaan vain käyttäjän oma päivä siltä varalta, että ajo ei ole
+    vielä ehtinyt (esim. kone heräsi lepotilasta)."""
+    today_str = user_now(part, user_id).strftime("%Y-%m-%d")
+    user_data = get_user(part, user_id)
+    if user_data.last_date is None:
+        # uusi käyttäjä: ei edellistä päivää arvioitavaksi
+        part.store.apply("day_rolled", user_id, date=today_str, success=False)
+    else:
+        roll_user(part, user_id, user_data, today_str)
+    return user_data
+
+def peek_user(part, user_id):
+    """Kuten load_user, mutta lukeville komennoille, eikä mitään kirjata:
+    tuntemattomalle palautetaan tallentamaton tyhjä tietue, ja jos käyttäjän
+    päivänvaihto ei ole vielä ehtinyt, palautetaan vaihdettu kopio (vaihto
+    tehdään keskiyön ajossa tai seuraavassa kirjoittavassa komennossa)."""
+    user_data = part.store.find_user(user_id)
+    if user_data is None:
+        return UserRecord()
+    fields = day_rolled_fields(user_data, user_now(part, user_id).strftime("%Y-%m-%d"))
+    if fields is None:
+        return user_data
+    return part.store.preview("day_rolled", user_id, **fields)
+
+def history_stats(part, user_id, user_data):
+    """Tilastoindeksi koko historialle. Arkistoidut kuukaudet lasketaan
+    yhteenvedoista; kylmä arkisto luetaan vain, jos kysely alkaa tai
+    päättyy kesken arkistoidun kuukauden."""
+    return user_data.history.stats(settings.current.stats, lambda month: part.store.archive.month(user_id, month))
 
 # --------- HELPER-TEXTERI TODAYPLAN / WEEKPLAN ---------
-def build_todayplan_message():
-    day_name = get_today_name()
-    plan = DAY_PLAN.get(day_name)
-    if not plan:
-        return "Ei suunnitelmaa tälle päivälle (outoa)."
-
-    label = plan["label"]
-    core_tasks = plan["core_tasks"]
-    daily_routine = DAILY_ROUTINE_TASKS
-
-    def format_task(t):
-        pts = TASKS.get(t, "?")
-        return f"- **{t}** ({pts} pts)"
-
-    text = f"**{day_name} — {label}**\n\n"
-    text += "__Päivittäinen rutiini:__\n" + "\n".join(format_task(t) for t in daily_routine) + "\n\n"
-    text += "__Tämän päivän ydintehtävät:__\n" + "\n".join(format_task(t) for t in core_tasks)
-    return text
-
-def build_weekplan_message():
-    lines = []
-    for day in DAY_NAMES:
-        plan = DAY_PLAN[day]
-        label = plan["label"]
-        tlist = ", ".join(plan["core_tasks"])
-        lines.append(f"**{day}** — {label} → {tlist}")
-    return "**Winter Arc -viikkosuunnitelma:**\n" + "\n".join(lines)
+# Näkymät on renderöity valmiiksi asetuksia ladattaessa (cfg.plans).
+def build_todayplan_message(cfg, now=None):
+    return cfg.plans.day(get_today_name(now)) or "Ei suunnitelmaa tälle päivälle (outoa)."
 
-# --------- LEADERBOARD HELPERS ---------
-def build_leaderboard_embed():
-    """Rakentaa leaderboard-embedin data-tiedoston perusteella."""
-    data = load_data()
+def build_weekplan_message(cfg):
+    return cfg.plans.week()
 
-    if not data:
+# --------- LEADERBOARD HELPERS ---------
+def build_leaderboard_embed(part):
+    """Rakentaa palvelimen leaderboard-embedin muistissa olevan datan perusteella."""
+    ranking = part.store.ranking
+    if not ranking:
         embed = discord.Embed(
             title="Winter Arc – Pistetaulukko",
             description="Kukaan ei ole vielä kerännyt pisteitä. Aloita komennolla `!done wake`.",
@@ -220,17 +245,7 @@ def build_leaderboard_embed():
         )
         return embed
 
-    entries = []
-    for user_id_str, user_data in data.items():
-        pts = user_data.get("points", 0)
-        try:
-            user_id = int(user_id_str)
-        except ValueError:
-            continue
-        entries.append((user_id, pts))
-
-    entries.sort(key=lambda x: x[1], reverse=True)
-    top = entries[:10]
+    top = ranking.top(10)
 
     lines = []
     rank = 1
@@ -254,49 +269,185 @@ def build_leaderboard_embed():
 @bot.event
 async def on_ready():
     print(f"Logged in as {bot.user}")
-    if not update_daily_leaderboard.is_running():
-        update_daily_leaderboard.start()
-    if not send_daily_todayplan.is_running():
-        send_daily_todayplan.start()
-    if not send_week_vision.is_running():
-        send_week_vision.start()
-    if not send_daily_report.is_running():
-        send_daily_report.start()
-    if not send_evening_todo.is_running():
-        send_evening_todo.start()
-    if not send_day_completion_check.is_running():
-        send_day_completion_check.start()
-    if not send_weekly_summary.is_running():
-        send_weekly_summary.start()
+    if settings.current.home_guild is None and "home_guild" not in partitions.home.store.meta and len(bot.guilds) == 1:
+        # ainoa palvelin saa vanhan datatiedoston jo ennen ensimmäistä komentoa
+        partitions.bind_home(bot.guilds[0].id)
+    await start_background()
+
+async def start_background(jobs=True):
+    """Käynnistää taustakirjoittajat ja (jobs=True) päivänvaihdon,
+    myöhästyneet muistutukset ja ajastimen. Uudelleenyhdistäessä ei tee mitään."""
+    partitions.start()
+    if METRICS_PORT and not metrics.serving:
+        try:
+            await metrics.serve("127.0.0.1", METRICS_PORT)
+            print(f"[metrics] http://127.0.0.1:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"[metrics] päätepistettä ei käynnistetty: {e}")
+    if jobs and not scheduler.is_running():
+        await each_guild(rollover_stale)(clock.now(FIN_TZ))
+        await each_guild(deliver_overdue_reminders)(clock.now(FIN_TZ))
+        scheduler.start(last_runs=partitions.home.store.meta.get("jobs", {}))
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.perf_started = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_time(ctx):
+    # after_invoke ajetaan myös, kun komento kaatuu
+    name = ctx.command.qualified_name
+    metrics.observe("command_seconds", time.perf_counter() - ctx.perf_started, command=name)
+    if ctx.command_failed:
+        metrics.inc("command_errors_total", command=name)
+
+@bot.command(name="perf")
+@commands.has_permissions(administrator=True)
+async def perf_cmd(ctx):
+    """(Admin) Komentojen viiveet, ajastettujen töiden kestot, tallennus ja Discord-kutsut."""
+    uptime = int(metrics.uptime)
+    lines = [f"📈 **Suorituskyky** (käynnissä {uptime // 3600} h {uptime % 3600 // 60} min)", ""]
+
+    def ms(seconds):
+        return f"{seconds * 1000:.1f}"
+
+    lines.append("__Komennot__ (kpl — p50 / p99 / max ms)")
+    errors = {dict(labels)["command"]: n for labels, n in metrics.counters("command_errors_total").items()}
+    commands_seen = sorted(metrics.histograms("command_seconds").items(), key=lambda item: -item[1].count)
+    for labels, h in commands_seen:
+        name = dict(labels)["command"]
+        failed = f", {errors[name]} virhettä" if errors.get(name) else ""
+        lines.append(
+            f"• `{name}` {h.count} — {ms(h.quantile(0.5))} / {ms(h.quantile(0.99))} / {ms(h.max)}{failed}"
+        )
+    if not commands_seen:
+        lines.append("• ei vielä komentoja")
+
+    lines += ["", "__Ajastetut työt__ (ajoja — viimeisin / max s)"]
+    for labels, h in sorted(metrics.histograms("job_seconds").items()):
+        job = dict(labels)["job"]
+        failed = metrics.total("job_runs_total", job=job, status="error")
+        sent = metrics.total("broadcast_messages_total", job=job, result="delivered")
+        dm_failed = metrics.total("broadcast_messages_total", job=job, result="failed")
+        extra = f", DM {sent} toimitettu / {dm_failed} epäonnistui" if sent or dm_failed else ""
+        extra += f", {failed} kaatui" if failed else ""
+        lines.append(f"• `{job}` {h.count} — {h.last:.2f} / {h.max:.2f}{extra}")
+
+    lines += ["", "__DM-jakelu__ (ohitetut ilman API-kutsua)"]
+    skipped = {}
+    for labels, n in metrics.counters("broadcast_skipped_total").items():
+        reason = dict(labels)["reason"]
+        skipped[reason] = skipped.get(reason, 0) + n
+    sent = metrics.total("broadcast_messages_total", result="delivered")
+    lines.append(
+        f"• toimitettu {sent}, epäonnistui {metrics.total('broadcast_messages_total', result='failed')}, ohitettu: "
+        + (", ".join(f"{reason} {n}" for reason, n in sorted(skipped.items())) or "–")
+    )
+    states = [part.deliveries.counts(clock.now(FIN_TZ)) for part in partitions]
+    lines.append(
+        f"• käyttäjiä: {sum(c['off'] for c in states)} raportit pois, {sum(c['failing'] for c in states)} "
+        f"epäonnistuu, joista {sum(c['backoff'] for c in states)} odottaa uutta yritystä"
+    )
 
-@bot.command(name="tomorrowplan")
-async def tomorrowplan_cmd(ctx):
-    """Näytä huomisen suunnitelma."""
-    now = datetime.now(FIN_TZ)
-    tomorrow = now + timedelta(days=1)
-    day_index = tomorrow.weekday()  # 0 = Monday
-    day_name = DAY_NAMES[day_index]
+    lines += ["", "__Tallennus__"]
+    for op, title in (("load", "lataus"), ("write", "kirjoituserät")):
+        h = metrics.histograms("storage_seconds").get((("op", op),))
+        if h is None:
+            continue
+        mb = metrics.total("storage_bytes_total", op=op) / 2**20
+        lines.append(f"• {title}: {h.count} kpl, p50 {ms(h.quantile(0.5))} ms, max {ms(h.max)} ms, {mb:.2f} MB")
+    if metrics.total("storage_errors_total"):
+        lines.append(f"• epäonnistuneita kirjoituksia: {metrics.total('storage_errors_total')}")
 
-    plan = DAY_PLAN.get(day_name)
-    if not plan:
-        await ctx.send("Huomiselle ei löytynyt suunnitelmaa (outoa).")
+    lines += [
+        "",
+        "__Discord API__",
+        f"• REST-kutsuja {metrics.total('discord_requests_total')}, "
+        f"virheitä {metrics.total('discord_errors_total')}, "
+        f"429-vastauksia {metrics.total('discord_rate_limited_total')}",
+        f"• pistetaulukkoviestit: {sum(part.leaderboard.edits for part in partitions)} muokkausta, "
+        f"{sum(part.leaderboard.skipped for part in partitions)} ohitettu (ei muutosta)",
+    ]
+    await ctx.send("\n".join(lines)[:2000])
+
+@bot.command(name="schedule")
+@commands.has_permissions(administrator=True)
+async def schedule_cmd(ctx):
+    """(Admin) Näytä tulevat ajastetut työt ja niiden edelliset ajot."""
+    lines = ["🗓 **Ajastetut työt:**"]
+    for due, job in scheduler.upcoming():
+        last = job.last_run.strftime("%Y-%m-%d %H:%M") if job.last_run else "–"
+        lines.append(
+            f"• `{job.name}` — seuraava **{due:%a %d.%m. %H:%M}** ({job.spec.describe()}), edellinen {last}"
+        )
+    await ctx.send("\n".join(lines))
+
+@bot.command(name="reload")
+@commands.has_permissions(administrator=True)
+async def reload_cmd(ctx):
+    """(Admin) Lataa tehtävät, palkinnot, viikko-ohjelman ja kanavat uudelleen asetustiedostosta."""
+    try:
+        cfg = reload_config()
+    except ConfigError as e:
+        await ctx.send(f"❌ Asetuksia ei ladattu, vanhat ovat yhä voimassa: {e}")
         return
+    await ctx.send(
+        f"✅ Asetukset ladattu (versio {cfg.version}): {len(cfg.tasks)} tehtävää, "
+        f"{len(cfg.rewards)} palkintoa, streak-raja {cfg.min_tasks_for_streak}/{len(cfg.routine_tasks)} rutiinia."
+    )
 
-    label = plan["label"]
-    core_tasks = plan["core_tasks"]
+@bot.command(name="setchannel")
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def setchannel_cmd(ctx, name: str = None, target: str = None):
+    """(Admin) Tämän palvelimen kanavat: !setchannel leaderboard [#kanava | off].
+    Ilman kanavaa käytetään tätä kanavaa, ilman argumentteja näytetään nykyiset."""
+    part = partition_for(ctx)
+    cfg = settings.current
+    if name is None:
+        lines = ["📡 **Tämän palvelimen kanavat:**"]
+        for key in CHANNEL_KEYS:
+            channel_id = channel_id_for(part, cfg, key)
+            lines.append(f"• `{key}` — {f'<#{channel_id}>' if channel_id else 'ei käytössä'}")
+        await ctx.send("\n".join(lines))
+        return
+    name = name.lower()
+    if name not in CHANNEL_KEYS:
+        await ctx.send(f"Tuntematon kanava. Vaihtoehdot: {', '.join(f'`{key}`' for key in CHANNEL_KEYS)}")
+        return
 
-    def format_task(t):
-        pts = TASKS.get(t, "?")
-        return f"- **{t}** ({pts} pts)"
+    if target is not None and target.lower() in ("off", "pois"):
+        channel_id = 0
+    elif target is None:
+        channel_id = ctx.channel.id
+    else:
+        try:
+            channel_id = (await commands.TextChannelConverter().convert(ctx, target)).id
+        except commands.BadArgument:
+            await ctx.send("Kanavaa ei löytynyt. Anna kanava muodossa #kanava tai `off`.")
+            return
 
-    daily_routine = DAILY_ROUTINE_TASKS
+    channels = dict(part.channels)
+    channels[name] = channel_id
+    part.store.apply("meta_set", key="channels", value=channels)
+    if name == "leaderboard":
+        # uudelle kanavalle uusi viesti
+        part.store.apply("meta_set", key="leaderboard_message_id", value=None)
+        part.leaderboard.reset()
+    shown = f"<#{channel_id}>" if channel_id else "ei käytössä"
+    await ctx.send(f"✅ `{name}` → {shown}")
 
-    msg = f"📅 **Huominen — {day_name}: {label}**\n\n"
-    msg += "__Päivittäinen rutiini:__\n"
-    msg += "\n".join(format_task(t) for t in daily_routine)
-    msg += "\n\n__Ydintehtävät:__\n"
-    msg += "\n".join(format_task(t) for t in core_tasks)
+@bot.command(name="tomorrowplan")
+async def tomorrowplan_cmd(ctx):
+    """Näytä huomisen suunnitelma."""
+    now = user_now(partition_for(ctx), ctx.author.id)
+    tomorrow = now + timedelta(days=1)
+    day_name = get_today_name(tomorrow)
 
+    msg = settings.current.plans.day(day_name, "tomorrow")
+    if msg is None:
+        await ctx.send("Huomiselle ei löytynyt suunnitelmaa (outoa).")
+        return
     await ctx.send(msg)
 
 
@@ -323,135 +474,225 @@ async def dayplan_cmd(ctx, *, day: str):
 
     day_name = DAY_ALIASES[day_lower]
 
-    plan = DAY_PLAN.get(day_name)
-    if not plan:
+    msg = settings.current.plans.day(day_name, "dayplan")
+    if msg is None:
         await ctx.send("Tälle päivälle ei löytynyt suunnitelmaa.")
         return
-
-    label = plan["label"]
-    core_tasks = plan["core_tasks"]
-
-    def format_task(t):
-        pts = TASKS.get(t, "?")
-        return f"- **{t}** ({pts} pts)"
-
-    daily_routine = DAILY_ROUTINE_TASKS
-
-    msg = f"📅 **{day_name} — {label}**\n\n"
-    msg += "__Päivittäinen rutiini:__\n"
-    msg += "\n".join(format_task(t) for t in daily_routine)
-    msg += "\n\n__Ydintehtävät:__\n"
-    msg += "\n".join(format_task(t) for t in core_tasks)
-
     await ctx.send(msg)
 
 
 @bot.command(name="tasks")
 async def tasks_cmd(ctx):
     """Näytä kaikki tehtävät ja niiden pisteet."""
-    lines = [f"**{name}** → {pts} pts" for name, pts in TASKS.items()]
+    lines = [f"**{name}** → {pts} pts" for name, pts in settings.current.tasks.items()]
     text = "**Tehtävälista (Winter Arc):**\n" + "\n".join(lines)
     await ctx.send(text)
 
 @bot.command(name="todayplan")
 async def todayplan_cmd(ctx):
     """Näytä tämän päivän suunnitelma Winter Arc -ohjelman mukaan."""
-    text = build_todayplan_message()
+    text = build_todayplan_message(settings.current, user_now(partition_for(ctx), ctx.author.id))
     await ctx.send(text)
 
 @bot.command(name="weekplan")
 async def weekplan_cmd(ctx):
     """Näytä koko viikon Winter Arc -rakennetta."""
-    text = build_weekplan_message()
+    text = build_weekplan_message(settings.current)
     await ctx.send(text)
 
 @bot.command(name="done")
-async def done_cmd(ctx, task_name: str):
-    """Merkitse tehtävä tehdyksi: !done wake, !done gym_push, jne."""
-    task_name = task_name.lower()
-    if task_name not in TASKS:
+async def done_cmd(ctx, *task_names: str):
+    """Merkitse tehtävät tehdyksi: !done wake, !done wake protein water, jne."""
+    cfg = settings.current
+    names = [name for arg in task_names for name in arg.lower().split(",") if name]
+    if not names:
+        await ctx.send("Anna tehtävä: `!done wake` tai useampi kerralla `!done wake protein water`.")
+        return
+    unknown = [name for name in names if name not in cfg.tasks]
+    names = [name for name in dict.fromkeys(names) if name in cfg.tasks]
+    if not names:
         await ctx.send("Tuntematon tehtävä. Käytä `!tasks` nähdäksesi listan.")
         return
 
-    data = load_data()
-    user_data = get_user(data, ctx.author.id)
-    reset_if_new_day(user_data)
-
-    today_name = get_today_name()
-    today_plan = DAY_PLAN.get(today_name, {})
-    core_tasks = today_plan.get("core_tasks", [])
+    part = partition_for(ctx)
+    today_name = get_today_name(user_now(part, ctx.author.id))
+    core_tasks = cfg.core_sets.get(today_name, frozenset())
 
-    if user_data["today"].get(task_name, False):
-        await ctx.send(f"Olet jo merkinnyt **{task_name}** tehdyksi tänään. Ei lisäpisteitä.")
-    else:
-        pts = TASKS[task_name]
-        user_data["points"] += pts
-        user_data["today"][task_name] = True
-        save_data(data)
+    async with part.locks.user(ctx.author.id):
+        user_data = load_user(part, ctx.author.id)
+        already = [name for name in names if user_data.today.get(name, False)]
+        new = {name: cfg.tasks[name] for name in names if name not in already}
+        if new:
+            # kaikki tehtävät yhtenä tapahtumana: yksi kirjoitus ja yksi vastausviesti
+            part.store.apply("tasks_done", ctx.author.id, date=user_data.last_date, tasks=new)
 
-        msg = f"✅ **{task_name}** tehty! +{pts} pts. Yhteensä: **{user_data['points']}** pts."
-        if task_name in ["gym_push", "gym_pull", "gym_legs", "light_activity", "groceries", "dishes", "laundry", "clean_quick", "big_clean"]:
-            if task_name not in core_tasks:
-                msg += f"\n⚠ Huom: **{task_name}** ei normaalisti kuulu **{today_name}**-päivään, mutta sait silti pisteet."
-        await ctx.send(msg)
+    lines = []
+    if len(new) == 1:
+        task_name, pts = next(iter(new.items()))
+        lines.append(f"✅ **{task_name}** tehty! +{pts} pts. Yhteensä: **{user_data.points}** pts.")
+    elif new:
+        done_list = ", ".join(f"**{name}** (+{pts})" for name, pts in new.items())
+        lines.append(f"✅ Tehty: {done_list}. Yhteensä +{sum(new.values())} pts → **{user_data.points}** pts.")
+    if len(already) == 1 and not new:
+        lines.append(f"Olet jo merkinnyt **{already[0]}** tehdyksi tänään. Ei lisäpisteitä.")
+    elif already:
+        lines.append(f"Jo merkitty tänään (ei lisäpisteitä): {', '.join(already)}")
+    if unknown:
+        lines.append(f"Tuntematon tehtävä: {', '.join(unknown)} — katso `!tasks`.")
+    # päiväkohtainen tehtävä (jonkin päivän ydintehtävä) muuna päivänä
+    off_day = [name for name in new if name in cfg.scheduled_tasks and name not in core_tasks]
+    if off_day:
+        lines.append(f"⚠ Huom: **{', '.join(off_day)}** ei normaalisti kuulu **{today_name}**-päivään, mutta sait silti pisteet.")
+    await ctx.send("\n".join(lines))
+
+# --------- CHECK-IN-NAPIT ---------
+# Napin custom_id sisältää omistajan ja tehtävän, joten napit toimivat myös
+# botin uudelleenkäynnistyksen jälkeen (bot.add_dynamic_items).
+class CheckinButton(discord.ui.DynamicItem[discord.ui.Button], template=r"wa:checkin:(?P<user>[0-9]+):(?P<task>.+)"):
+    """Yhden tehtävän kytkin check-in-viestissä: painallus merkitsee tehdyksi
+    tai peruu merkinnän. Yksi tapahtuma ja yksi viestin muokkaus per painallus."""
+
+    def __init__(self, user_id, task, done=False):
+        super().__init__(discord.ui.Button(
+            label=task,
+            style=discord.ButtonStyle.success if done else discord.ButtonStyle.secondary,
+            emoji="✅" if done else None,
+            custom_id=f"wa:checkin:{user_id}:{task}",
+        ))
+        self.user_id = user_id
+        self.task = task
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(int(match["user"]), match["task"])
+
+    async def callback(self, interaction):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Tämä check-in on toisen käyttäjän. Oma: `!checkin`", ephemeral=True)
+            return
+        with metrics.timer("command_seconds", command="checkin_button"):
+            cfg = settings.current
+            pts = cfg.tasks.get(self.task)
+            if pts is None:
+                await interaction.response.send_message(f"Tehtävää **{self.task}** ei enää ole. Hae uusi: `!checkin`", ephemeral=True)
+                return
+            part = partition_for(interaction)
+            async with part.locks.user(self.user_id):
+                user_data = load_user(part, self.user_id)
+                if not user_data.today.get(self.task, False):
+                    part.store.apply("tasks_done", self.user_id, date=user_data.last_date, tasks={self.task: pts})
+                elif user_data.points >= pts:
+                    # peruminen vähentää tehtävän nykyiset pisteet
+                    part.store.apply("task_undone", self.user_id, date=user_data.last_date, task=self.task, points=pts)
+                else:
+                    await interaction.response.send_message(
+                        f"Pisteet on jo käytetty, joten merkintää **{self.task}** ei voi perua.", ephemeral=True
+                    )
+                    return
+                content, view = build_checkin(cfg, self.user_id, user_data, user_now(part, self.user_id))
+            await interaction.response.edit_message(content=content, view=view)
+
+bot.add_dynamic_items(CheckinButton)
+
+def checkin_tasks(cfg, now=None):
+    """Check-in-viestin tehtävät: rutiinit ja päivän ydintehtävät (enintään 25 nappia)."""
+    tasks = list(cfg.routine_tasks) + list(cfg.core_tasks(get_today_name(now)))
+    return list(dict.fromkeys(tasks))[:25]
+
+def build_checkin(cfg, user_id, user_data, now=None):
+    """Check-in-viestin teksti ja napit käyttäjän tämän päivän tilasta."""
+    now = now or clock.now(FIN_TZ)
+    tasks = checkin_tasks(cfg, now)
+    done = sum(1 for task in tasks if user_data.today.get(task, False))
+    content = (
+        f"☀️ **Check-in – {get_today_name(now)} {now.strftime('%Y-%m-%d')}** <@{user_id}>\n"
+        f"{done}/{len(tasks)} tehty · **{user_data.points}** pts\n"
+        "Paina tehtävää merkitäksesi sen tehdyksi, uudelleen painamalla perut."
+    )
+    view = discord.ui.View(timeout=None)
+    for task in tasks:
+        view.add_item(CheckinButton(user_id, task, user_data.today.get(task, False)))
+    return content, view
+
+@bot.command(name="checkin")
+async def checkin_cmd(ctx):
+    """Päivän check-in napeilla: rutiinit ja ydintehtävät yhdellä viestillä."""
+    cfg = settings.current
+    part = partition_for(ctx)
+    user_data = peek_user(part, ctx.author.id)
+    content, view = build_checkin(cfg, ctx.author.id, user_data, user_now(part, ctx.author.id))
+    await ctx.send(content, view=view)
 
 @bot.command(name="points")
 async def points_cmd(ctx):
     """Näytä nykyiset pisteet."""
-    data = load_data()
-    user_data = get_user(data, ctx.author.id)
-    reset_if_new_day(user_data)
-    save_data(data)
-    await ctx.send(f"⭐ {ctx.author.display_name}, sinulla on **{user_data['points']}** pistettä.")
+    user_data = peek_user(partition_for(ctx), ctx.author.id)
+    await ctx.send(f"⭐ {ctx.author.display_name}, sinulla on **{user_data.points}** pistettä.")
 
 @bot.command(name="leaderboard", aliases=["lb"])
 async def leaderboard_cmd(ctx):
-    """Näytä pistetaulukko (top 10 grindaaajaa)."""
-    embed = build_leaderboard_embed()
+    """Näytä tämän palvelimen pistetaulukko (top 10 grindaaajaa)."""
+    embed = build_leaderboard_embed(partition_for(ctx))
     await ctx.send(embed=embed)
 
+@bot.command(name="rank")
+async def rank_cmd(ctx):
+    """Näytä oma sijoituksesi ja lähimmät kilpailijat."""
+    part = partition_for(ctx)
+    user_data = part.store.find_user(ctx.author.id)
+    if user_data is None:
+        # pelkkä kysely ei luo käyttäjää eikä riviä pistetaulukkoon
+        await ctx.send(f"🏅 {ctx.author.display_name}, sinulla ei ole vielä pisteitä. Aloita: `!done wake`.")
+        return
+    ranking = part.store.ranking
+    rows = ranking.around(ctx.author.id, radius=2)
+
+    lines = [f"🏅 **{ctx.author.display_name}**, olet sijalla **{ranking.rank(ctx.author.id)}** / {len(ranking)} (**{user_data.points}** pts).", ""]
+    for rank, uid, pts in rows:
+        marker = "➡" if uid == ctx.author.id else "  "
+        lines.append(f"{marker} **{rank}.** <@{uid}> — **{pts}** pts")
+    # naapureita ei pingata
+    await ctx.send("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
+
 @bot.command(name="rewards")
 async def rewards_cmd(ctx):
     """Näytä palkintokaupan sisältö."""
-    lines = [f"**{name}** → {cost} pts" for name, cost in REWARDS.items()]
+    lines = [f"**{name}** → {cost} pts" for name, cost in settings.current.rewards.items()]
     await ctx.send("**Reward shop:**\n" + "\n".join(lines))
 
 @bot.command(name="buy")
 async def buy_cmd(ctx, reward_name: str):
     """Käytä pisteitä palkintoon: !buy gaming60"""
+    rewards = settings.current.rewards
     reward_name = reward_name.lower()
-    if reward_name not in REWARDS:
+    if reward_name not in rewards:
         await ctx.send("Tuntematon palkinto. Käytä `!rewards` nähdäksesi listan.")
         return
 
-    cost = REWARDS[reward_name]
-    data = load_data()
-    user_data = get_user(data, ctx.author.id)
-    reset_if_new_day(user_data)
+    cost = rewards[reward_name]
+    part = partition_for(ctx)
+    async with part.locks.user(ctx.author.id):
+        user_data = load_user(part, ctx.author.id)
 
-    if user_data["points"] < cost:
-        await ctx.send(f"Ei tarpeeksi pisteitä. Tarvitset {cost}, sinulla on {user_data['points']}.")
-        return
-
-    user_data["points"] -= cost
-    save_data(data)
-    await ctx.send(f"🎁 Ostit **{reward_name}** {cost} pisteellä! Pisteitä jäljellä: **{user_data['points']}**.")
+        if user_data.points < cost:
+            msg = f"Ei tarpeeksi pisteitä. Tarvitset {cost}, sinulla on {user_data.points}."
+        else:
+            part.store.apply("reward_bought", ctx.author.id, reward=reward_name, cost=cost)
+            msg = f"🎁 Ostit **{reward_name}** {cost} pisteellä! Pisteitä jäljellä: **{user_data.points}**."
+    await ctx.send(msg)
 
 @bot.command(name="streak")
 async def streak_cmd(ctx):
     """Näytä nykyinen streak ja paras streak."""
-    data = load_data()
-    user_data = get_user(data, ctx.author.id)
-    reset_if_new_day(user_data)
-    save_data(data)
+    user_data = peek_user(partition_for(ctx), ctx.author.id)
 
-    streak = user_data.get("streak", 0)
-    best = user_data.get("best_streak", 0)
+    streak = user_data.streak
+    best = user_data.best_streak
 
     msg = (
         f"🔥 {ctx.author.display_name}, sinulla on nyt **{streak} päivän** putki.\n"
         f"🏆 Paras putkesi on **{best} päivää**.\n"
-        f"(Päivä lasketaan onnistuneeksi, kun saat vähintään {MIN_TASKS_FOR_STREAK} "
+        f"(Päivä lasketaan onnistuneeksi, kun saat vähintään {settings.current.min_tasks_for_streak} "
         f"päivittäistä rutiinitehtävää tehtyä saman vuorokauden aikana.)"
     )
     await ctx.send(msg)
@@ -459,91 +700,237 @@ async def streak_cmd(ctx):
 @bot.command(name="resetday")
 async def resetday_cmd(ctx):
     """Nollaa tämän päivän tehtävät (pisteet säilyvät)."""
-    data = load_data()
-    user_data = get_user(data, ctx.author.id)
-    reset_if_new_day(user_data)
-    user_data["today"] = {}
-    save_data(data)
+    part = partition_for(ctx)
+    async with part.locks.user(ctx.author.id):
+        user_data = load_user(part, ctx.author.id)
+        part.store.apply("day_reset", ctx.author.id, date=user_data.last_date)
     await ctx.send("🔄 Tämän päivän tehtävät nollattu. Uusi yritys tälle päivälle.")
 
+def parse_day(arg, today):
+    """Päivä komennon argumentista: YYYY-MM-DD, today/tänään tai yesterday/eilen."""
+    arg = arg.lower()
+    if arg in ("today", "tänään"):
+        return today
+    if arg in ("yesterday", "eilen"):
+        return today - timedelta(days=1)
+    return datetime.strptime(arg, "%Y-%m-%d").date()
+
 @bot.command(name="stats")
-async def stats_cmd(ctx, task_name: str):
-    """Näytä montako päivänä olet tehnyt tietyn tehtävän: !stats wake"""
+async def stats_cmd(ctx, task_name: str, start: str = None, end: str = None):
+    """Montako päivänä olet tehnyt tehtävän: !stats wake [YYYY-MM-DD] [YYYY-MM-DD]"""
+    cfg = settings.current
     task_name = task_name.lower()
-    if task_name not in TASKS:
+    if task_name not in cfg.tasks:
         await ctx.send("Tuntematon tehtävä. Käytä `!tasks` nähdäksesi kaikki tehtävät.")
         return
 
-    data = load_data()
-    user_data = get_user(data, ctx.author.id)
-    history = user_data.get("history", {})
-
-    days = 0
-    for date_str, tasks in history.items():
-        if task_name in tasks:
-            days += 1
-
-    await ctx.send(f"📈 **{ctx.author.display_name}**, olet tehnyt tehtävän **`{task_name}`** yhteensä **{days} päivänä**.")
-
-@bot.command(name="monthstats")
-async def monthstats_cmd(ctx):
-    """Näytä kuluvan kuukauden habit-yhteenveto."""
-    data = load_data()
-    user_data = get_user(data, ctx.author.id)
-    history = user_data.get("history", {})
+    part = partition_for(ctx)
+    user_data = peek_user(part, ctx.author.id)
+    today = user_now(part, ctx.author.id).date()
+    try:
+        first = parse_day(start, today) if start else None
+        last = parse_day(end, today) if end else today
+    except ValueError:
+        await ctx.send("Päivä ei kelpaa. Käytä muotoa YYYY-MM-DD, esim. `!stats wake 2025-01-01 2025-01-31`.")
+        return
+    last = min(last, today)  # tulevia päiviä ei lasketa jaksoon
+    if first is not None and first > last:
+        await ctx.send(
+            f"Alkupäivä ei voi olla loppupäivän ({last}) jälkeen. "
+            "Käytä muotoa YYYY-MM-DD, esim. `!stats wake 2025-01-01 2025-01-31`."
+        )
+        return
 
-    now = datetime.now(FIN_TZ)
-    year = now.year
-    month = now.month
+    index = history_stats(part, ctx.author.id, user_data)
+    lo = first.toordinal() if first else 0
+    days = index.task_days(task_name, lo, last.toordinal())
+    if (first is None or first <= today) and last >= today and user_data.today.get(task_name):
+        days += 1
 
-    days_with_any = 0
-    successful_days = 0  # päivät, joissa streak-raja täyttyi
-    total_tasks = 0
+    if first is None:
+        await ctx.send(f"📈 **{ctx.author.display_name}**, olet tehnyt tehtävän **`{task_name}`** yhteensä **{days} päivänä**.")
+    else:
+        span = (last - first).days + 1
+        await ctx.send(
+            f"📈 **{ctx.author.display_name}**, tehtävä **`{task_name}`** välillä {first}–{last}: "
+            f"**{days}/{span} päivää**."
+        )
 
-    for date_str, tasks in history.items():
-        try:
-            d = datetime.strptime(date_str, "%Y-%m-%d").date()
-        except ValueError:
-            continue
+@bot.command(name="completion")
+async def completion_cmd(ctx, task_name: str, *period: str):
+    """Tehtävän toteutumisprosentti viime päiviltä: !completion wake last 30d"""
+    cfg = settings.current
+    task_name = task_name.lower()
+    if task_name not in cfg.tasks:
+        await ctx.send("Tuntematon tehtävä. Käytä `!tasks` nähdäksesi kaikki tehtävät.")
+        return
+    words = [w for w in period if w.lower() not in ("last", "viim")]
+    try:
+        n_days = int(words[0].lower().rstrip("dpv")) if words else 30
+    except ValueError:
+        n_days = 0
+    if not 1 <= n_days <= 3660:
+        await ctx.send("Anna jakso päivinä, esim. `!completion wake last 30d`.")
+        return
 
-        if d.year == year and d.month == month:
-            days_with_any += 1
-            unique_tasks = set(tasks)
-            total_tasks += len(unique_tasks)
+    part = partition_for(ctx)
+    user_data = peek_user(part, ctx.author.id)
+    today = user_now(part, ctx.author.id).date()
+    first = today - timedelta(days=n_days - 1)
+    index = history_stats(part, ctx.author.id, user_data)
+    days = index.task_days(task_name, first.toordinal(), today.toordinal())
+    if user_data.today.get(task_name):
+        days += 1
+    await ctx.send(
+        f"🎯 **`{task_name}`** viimeiset {n_days} päivää: **{days}/{n_days}** "
+        f"(**{100 * days / n_days:.0f} %**)"
+    )
 
-            routines_done = sum(1 for t in DAILY_ROUTINE_TASKS if t in unique_tasks)
-            if routines_done >= MIN_TASKS_FOR_STREAK:
-                successful_days += 1
+@bot.command(name="monthstats")
+async def monthstats_cmd(ctx, month: str = None):
+    """Kuukauden habit-yhteenveto: !monthstats [YYYY-MM] (oletus kuluva kuukausi)."""
+    cfg = settings.current
+    part = partition_for(ctx)
+    now = user_now(part, ctx.author.id)
+    try:
+        month_start = datetime.strptime(month, "%Y-%m").date() if month else now.date().replace(day=1)
+    except ValueError:
+        await ctx.send("Kuukausi ei kelpaa. Käytä muotoa YYYY-MM, esim. `!monthstats 2025-01`.")
+        return
+    month_str = month_start.strftime("%Y-%m")
+    month_end = month_start.replace(day=calendar.monthrange(month_start.year, month_start.month)[1])
+
+    user_data = peek_user(part, ctx.author.id)
+    index = history_stats(part, ctx.author.id, user_data)
+    first, last = month_start.toordinal(), month_end.toordinal()
+    # menneet päivät; tämä päivä lasketaan mukaan vasta päivänvaihdossa
+    days_with_any = index.active_days(first, last)
+    successful_days = index.success_days(first, last)  # päivät, joissa streak-raja täyttyi
+    total_tasks = index.tasks_between(first, last)
+    total_points = index.points_between(first, last)
 
     msg_lines = [
-        f"📆 **Kuukauden habit-tilasto ({now.strftime('%Y-%m')})**",
+        f"📆 **Kuukauden habit-tilasto ({month_str})**",
         "",
         f"• Päiviä, jolloin teit jotain: **{days_with_any}**",
-        f"• Päiviä, joissa streak-raja ({MIN_TASKS_FOR_STREAK} rutiinia) täyttyi: **{successful_days}**",
+        f"• Päiviä, joissa streak-raja ({cfg.min_tasks_for_streak} rutiinia) täyttyi: **{successful_days}**",
         f"• Suoritettuja eri tehtäviä yhteensä (päivistä laskettuna): **{total_tasks}**",
+        f"• Pisteitä tehtävistä: **{total_points}**",
     ]
 
     await ctx.send("\n".join(msg_lines))
 
+@bot.command(name="streaks")
+async def streaks_cmd(ctx):
+    """Streak-historia: pisimmät ja viimeisimmät putket."""
+    cfg = settings.current
+    part = partition_for(ctx)
+    user_data = peek_user(part, ctx.author.id)
+    runs = history_stats(part, ctx.author.id, user_data).streaks()
+    if not runs:
+        await ctx.send("Ei vielä yhtään onnistunutta päivää historiassa. Tee vähintään "
+                       f"{cfg.min_tasks_for_streak} rutiinia päivässä!")
+        return
+
+    def fmt(run):
+        a, b, n = run
+        return f"• **{n} pv** ({a:%d.%m.%Y}–{b:%d.%m.%Y})"
+
+    longest = sorted(runs, key=lambda run: (-run[2], run[0]))[:5]
+    msg_lines = [f"🔥 **Streak-historia – {ctx.author.display_name}**", "", "__Pisimmät putket:__"]
+    msg_lines += [fmt(run) for run in longest]
+    msg_lines += ["", "__Viimeisimmät putket:__"]
+    msg_lines += [fmt(run) for run in reversed(runs[-3:])]
+    msg_lines += ["", f"Putkia yhteensä {len(runs)}, nykyinen streak **{user_data.streak}** pv."]
+    await ctx.send("\n".join(msg_lines))
+
+# --------- KUVAAJAT (PNG) ---------
+# Kuvat piirretään prosessipoolissa (charts.py), jottei event loop pysähdy.
+# Valmiit kuvat ovat välimuistissa, kunnes käyttäjän data tai asetukset muuttuvat.
+PROGRESS_DAYS = 90
+charts = ChartRenderer(workers=int(os.environ.get("WINTER_ARC_CHART_WORKERS", "2")), metrics=metrics)
+
+def chart_key(part, user_id, kind, first, last):
+    # käyttäjän viimeisin tapahtuma ja asetusversio: muuttunut data = uusi avain
+    modified = part.store.modified.get(user_id, 0)
+    return (part.key, user_id, kind, first.toordinal(), last.toordinal(), modified, settings.current.version)
+
+async def progress_png(part, user_id, days, today, masks=None):
+    """Pisteet ajan yli viimeiseltä days päivältä: (PNG, päivien maskit).
+    masks: valmiiksi haetut maskit (viikkoraportti hakee kaikille kerralla)."""
+    first = today - timedelta(days=days - 1)
+    key = chart_key(part, user_id, "progress", first, today)
+    if masks is None:
+        masks = await part.store.query("period_masks", user_id, first.isoformat(), today.isoformat())
+    png = await charts.render(key, render_progress, masks.tobytes(), settings.current.point_weights)
+    return png, masks
+
+def chart_file(png, name):
+    return discord.File(io.BytesIO(png), filename=name)
+
+@bot.command(name="heatmap")
+async def heatmap_cmd(ctx, member: Optional[discord.Member] = None, year: int = None):
+    """Vuoden habit-kalenteri kuvana: !heatmap [@käyttäjä] [vuosi]"""
+    user = member or ctx.author
+    part = partition_for(ctx)
+    today = user_now(part, user.id).date()
+    year = year or today.year
+    if not 2000 <= year <= today.year:
+        await ctx.send(f"Vuosi ei kelpaa. Anna vuosi 2000–{today.year}, esim. `!heatmap {today.year}`.")
+        return
+
+    first, last = date(year, 1, 1), date(year, 12, 31)
+    shown = (min(last, today) - first).days + 1  # tulevat päivät jätetään tyhjiksi
+    key = chart_key(part, user.id, "heatmap", first, min(last, today))
+    masks = await part.store.query("period_masks", user.id, first.isoformat(), last.isoformat())
+    png = await charts.render(key, render_heatmap, masks.tobytes(), first.toordinal(), shown)
+
+    active = sum(1 for mask in masks if mask)
+    tasks = sum(mask.bit_count() for mask in masks)
+    await ctx.send(
+        f"📅 **{user.display_name} – {year}**: {active}/{shown} aktiivista päivää, {tasks} tehtävää. "
+        "Tummempi ruutu = enemmän tehtäviä.",
+        file=chart_file(png, f"heatmap-{year}.png"),
+    )
+
+@bot.command(name="progress")
+async def progress_cmd(ctx, member: Optional[discord.Member] = None, days: int = PROGRESS_DAYS):
+    """Pisteet ajan yli kuvana: !progress [@käyttäjä] [päiviä] (oletus 90)"""
+    user = member or ctx.author
+    if not 7 <= days <= 366:
+        await ctx.send("Anna jakso päivinä 7–366, esim. `!progress 30`.")
+        return
+
+    part = partition_for(ctx)
+    today = user_now(part, user.id).date()
+    png, masks = await progress_png(part, user.id, days, today)
+    daily = [mask_value(mask, settings.current.point_weights) for mask in masks]
+    best = max(daily)
+    text = f"📈 **{user.display_name} – viimeiset {days} päivää**: +{sum(daily)} pts tehtävistä"
+    if best:
+        best_day = today - timedelta(days=days - 1 - daily.index(best))
+        text += f", paras päivä {best} pts ({best_day:%d.%m.})"
+    text += ". Ylhäällä kertyneet pisteet, alhaalla päivän pisteet."
+    await ctx.send(text, file=chart_file(png, "progress.png"))
+
 @bot.command(name="todo")
 async def todo_cmd(ctx):
     """Näytä tämän päivän tekemättömät tehtävät."""
-    data = load_data()
-    user_data = get_user(data, ctx.author.id)
-    reset_if_new_day(user_data)
+    cfg = settings.current
+    part = partition_for(ctx)
+    user_data = peek_user(part, ctx.author.id)
 
-    today_name = get_today_name()
-    plan = DAY_PLAN.get(today_name, {})
-    core_tasks = plan.get("core_tasks", [])
+    today_name = get_today_name(user_now(part, ctx.author.id))
+    core_tasks = cfg.core_tasks(today_name)
 
-    daily_routines = DAILY_ROUTINE_TASKS
-    today_done = user_data.get("today", {})
+    daily_routines = cfg.routine_tasks
+    today_done = user_data.today
 
     missing_routines = [t for t in daily_routines if not today_done.get(t)]
     missing_core = [t for t in core_tasks if not today_done.get(t)]
 
     def fmt(t):
-        return f"- **{t}** ({TASKS.get(t, '?')} pts)"
+        return f"- **{t}** ({cfg.tasks.get(t, '?')} pts)"
 
     msg = f"📝 **Päivän tekemättömät tehtävät – {today_name}**\n\n"
 
@@ -565,17 +952,17 @@ async def todo_cmd(ctx):
 @bot.command(name="remind")
 async def remind_cmd(ctx, day: str, *, text: str):
     """
-    Lisää muistutus tietyllä päivälle.
+    Lisää muistutus tietyllä päivälle. Ilman kellonaikaa muistutus tulee
+    päivän 18:00-viestissä, kellonajan kanssa DM:nä juuri silloin.
     Esim:
     !remind tomorrow maksa laskut
-    !remind today siivoa keittiö
-    !remind 2025-01-30 hammaslääkäri klo 12
+    !remind today 16:45 hae paketti
+    !remind 2025-01-30 11:30 hammaslääkäri klo 12
     """
-    data = load_data()
-    user_data = get_user(data, ctx.author.id)
-
     day_lower = day.lower()
-    today = datetime.now(FIN_TZ).date()
+    part = partition_for(ctx)
+    now = user_now(part, ctx.author.id)  # päivä ja kellonaika käyttäjän omaa aikaa
+    today = now.date()
 
     if day_lower in ("today", "tänään"):
         date_obj = today
@@ -588,133 +975,323 @@ async def remind_cmd(ctx, day: str, *, text: str):
             await ctx.send("Päivä ei kelpaa. Käytä `today`, `tomorrow` tai muotoa YYYY-MM-DD (esim. 2025-01-30).")
             return
 
+    time_str = None
+    first, _, rest = text.partition(" ")
+    try:
+        time_str = datetime.strptime(first, "%H:%M").strftime("%H:%M")
+        text = rest.strip()
+    except ValueError:
+        pass
+    if not text:
+        await ctx.send("Kirjoita muistutukselle myös teksti, esim. `!remind today 16:45 hae paketti`.")
+        return
+
     date_str = date_obj.strftime("%Y-%m-%d")
-    reminders = user_data.setdefault("reminders", {})
-    reminders.setdefault(date_str, []).append(text)
-    save_data(data)
+    due = datetime.strptime(f"{date_str} {time_str or '18:00'}", "%Y-%m-%d %H:%M").replace(tzinfo=now.tzinfo)
+    if due <= now:
+        await ctx.send("Ajankohta on jo mennyt. Anna tuleva päivä tai kellonaika.")
+        return
 
-    await ctx.send(f"📌 Lisätty muistutus päivälle **{date_str}**: _{text}_")
+    entry = {"text": text}
+    if time_str:
+        entry["time"] = time_str
+    async with part.locks.user(ctx.author.id):
+        part.store.apply("reminder_added", ctx.author.id, date=date_str, **entry)
+        part.reminders.add(ctx.author.id, date_str, entry)
+    if time_str:
+        scheduler.reschedule("timed_reminders")
+        await ctx.send(f"📌 Lisätty muistutus **{date_str} klo {time_str}**: _{text}_")
+    else:
+        await ctx.send(f"📌 Lisätty muistutus päivälle **{date_str}**: _{text}_")
+
+@bot.command(name="reminders")
+async def reminders_cmd(ctx):
+    """Näytä omat tulevat muistutukset numeroituna (poisto: !unremind <nro>)."""
+    part = partition_for(ctx)
+    user_data = part.store.find_user(ctx.author.id)
+    rows = upcoming(user_data, user_now(part, ctx.author.id).strftime("%Y-%m-%d")) if user_data else []
+    if not rows:
+        await ctx.send("Sinulla ei ole tulevia muistutuksia. Lisää: `!remind tomorrow maksa laskut`")
+        return
+    lines = ["📌 **Tulevat muistutuksesi:**"]
+    for n, (date_str, _, entry) in enumerate(rows, start=1):
+        when = f"{date_str} klo {entry['time']}" if entry.get("time") else f"{date_str} (18:00-viesti)"
+        lines.append(f"**{n}.** {when} — {entry['text']}")
+    lines.append("")
+    lines.append("Poista muistutus: `!unremind <nro>`")
+    await ctx.send("\n".join(lines))
+
+@bot.command(name="unremind")
+async def unremind_cmd(ctx, number: int):
+    """Poista muistutus !reminders-listan numerolla."""
+    uid = ctx.author.id
+    part = partition_for(ctx)
+    async with part.locks.user(uid):
+        user_data = part.store.find_user(uid)
+        rows = upcoming(user_data, user_now(part, uid).strftime("%Y-%m-%d")) if user_data else []
+        if not 1 <= number <= len(rows):
+            reply = "Numeroa ei löydy. Katso numerot komennolla `!reminders`."
+        else:
+            date_str, index, entry = rows[number - 1]
+            part.store.apply("reminder_removed", uid, date=date_str, index=index)
+            # kellonajalliset poistuvat keosta laiskasti, 18:00-hakemisto päivitetään heti
+            part.reminders.refresh(uid, date_str)
+            reply = f"🗑 Poistettu muistutus: _{entry['text']}_"
+    await ctx.send(reply)
+
+# --------- AIKAVYÖHYKE ---------
+RESET_WORDS = ("off", "default", "oletus", "pois")
+
+@bot.command(name="timezone", aliases=["tz"])
+async def timezone_cmd(ctx, *, name: str = None):
+    """
+    Oma aikavyöhyke: päivänvaihto, muistutukset ja illan DM:t tulevat paikallista aikaa.
+    Esim:
+    !timezone Europe/London
+    !timezone UTC-5
+    !timezone off   (takaisin Suomen aikaan)
+    """
+    part = partition_for(ctx)
+    uid = ctx.author.id
+    if name is None:
+        record = part.store.find_user(uid)
+        shown = record.tz if record is not None and record.tz else f"{FIN_TZ.key} (oletus)"
+        await ctx.send(
+            f"🕒 Aikavyöhykkeesi: **{shown}**, kello on nyt {user_now(part, uid):%H:%M (UTC%z)}. "
+            "Vaihda: `!timezone Europe/London` tai `!timezone UTC-5`."
+        )
+        return
+    tz = None if name.lower() in RESET_WORDS else parse_timezone(name)
+    if tz is None and name.lower() not in RESET_WORDS:
+        await ctx.send(
+            "Aikavyöhykettä ei tunnistettu. Anna nimi, esim. `Europe/London` tai "
+            "`America/New_York`, tai poikkeama, esim. `UTC+3`."
+        )
+        return
 
-# --------- AUTOMAATTINEN LEADERBOARD KLO 06:00 (MUOKKAA SAMA VIesti) ---------
-@tasks.loop(minutes=1)
-async def update_daily_leaderboard():
-    """Päivittää leaderboardin joka aamu klo 06:00 Suomen aikaa muokkaamalla samaa viestiä."""
-    now = datetime.now(FIN_TZ)
-    if now.hour == 6 and now.minute == 0:
-        channel = bot.get_channel(LEADERBOARD_CHANNEL_ID)
-        if channel is None:
-            return
+    async with part.locks.user(uid):
+        # kesken oleva päivä vaihdetaan vielä vanhan vyöhykkeen mukaan
+        load_user(part, uid)
+        part.store.apply("timezone_set", uid, tz=tz)
+        part.timezones.refresh(uid)
+        part.reminders.reindex(uid)
+    reschedule_zoned()
+    await ctx.send(
+        f"🕒 Aikavyöhyke: **{tz or FIN_TZ.key + ' (oletus)'}**, kello on nyt {user_now(part, uid):%H:%M (UTC%z)}. "
+        "Päivä vaihtuu keskiyöllä ja illan viestit (18:00, 21:00, 21:30) tulevat tämän mukaan."
+    )
 
-        data = load_data()
-        meta = data.get("_meta", {})
-        msg_id = meta.get("leaderboard_message_id")
+def reschedule_zoned():
+    """Vyöhykkeitä tuli tai poistui: vyöhykekohtaisten ajojen ja
+    kellonajallisten muistutusten seuraavat ajohetket uudelleen."""
+    for name, job in scheduler.jobs.items():
+        if isinstance(job.spec, Zoned) or name == "timed_reminders":
+            scheduler.reschedule(name)
 
-        embed = build_leaderboard_embed()
+# --------- ILMOITUKSET (DM-RAPORTIT) ---------
+ON_WORDS = ("on", "päälle", "kyllä")
+OFF_WORDS = ("off", "pois", "ei")
 
-        if msg_id:
-            try:
-                msg = await channel.fetch_message(msg_id)
-                await msg.edit(embed=embed)
-                return
-            except discord.NotFound:
-                pass
+@bot.command(name="notifications", aliases=["ilmoitukset"])
+async def notifications_cmd(ctx, state: str = None):
+    """
+    Ajastetut DM-raportit päälle tai pois (päiväraportti, 18:00 todo, 21:30 tarkistus, viikkoraportti).
+    Omat muistutukset (!remind) tulevat aina.
+    !notifications on
+    !notifications off
+    """
+    part = partition_for(ctx)
+    uid = ctx.author.id
+    if state is None or state.lower() not in ON_WORDS + OFF_WORDS:
+        record = part.store.find_user(uid)
+        delivery = record.delivery if record is not None else {}
+        lines = [
+            f"🔔 DM-raportit: **{'pois' if delivery.get('off') else 'päällä'}**. "
+            "Vaihda: `!notifications on` tai `!notifications off`."
+        ]
+        if delivery.get("ok"):
+            lines.append(f"Viimeisin toimitettu DM: {delivery['ok']}.")
+        if delivery.get("failures"):
+            lines.append(
+                f"⚠️ {delivery['failures']} epäonnistunutta yritystä peräkkäin ({delivery['reason']}). "
+                "Salli yksityisviestit palvelimen jäseniltä ja kirjoita `!notifications on`."
+            )
+        if settings.current.dm_inactive_days:
+            lines.append(
+                f"Raportit tulevat, jos olet merkinnyt tehtäviä viimeisen {settings.current.dm_inactive_days} päivän aikana."
+            )
+        await ctx.send("\n".join(lines))
+        return
+
+    enabled = state.lower() in ON_WORDS
+    async with part.locks.user(uid):
+        load_user(part, uid)
+        # päälle kytkeminen nollaa myös epäonnistumiset: seuraava ajo yrittää heti
+        part.store.apply("notifications_set", uid, enabled=enabled)
+    if enabled:
+        await ctx.send("🔔 DM-raportit päällä. Seuraava raportti tulee normaalisti aikataulun mukaan.")
+    else:
+        await ctx.send("🔕 DM-raportit pois. Omat muistutukset (`!remind`) tulevat edelleen. Takaisin: `!notifications on`.")
+
+# --------- PALVELINKOHTAISET AJOT ---------
+def each_guild(job):
+    """Ajastettava työ, joka ajaa job(part, now) jokaiselle osiolle rinnakkain.
+    Osioilla on omat lukot, joten suuren palvelimen ajo ei viivästytä muita,
+    eikä yhden palvelimen virhe estä muiden ajoa."""
+    async def run(now):
+        parts = list(partitions)
+        results = await asyncio.gather(*(job(part, now) for part in parts), return_exceptions=True)
+        failed = [(part, result) for part, result in zip(parts, results) if isinstance(result, Exception)]
+        for part, error in failed:
+            print(f"[{job.__name__}] palvelin {part.key or 'home'}: {error!r}")
+        if failed and len(failed) == len(parts):
+            # ajastin kirjaa ajon virheeksi vasta, kun mikään osio ei onnistunut
+            raise failed[0][1]
+    return run
+
+def user_zones():
+    """Kaikkien osioiden käytössä olevat aikavyöhykkeet (Zoned-ajastus)."""
+    return set().union(*(part.timezones.zones() for part in partitions)) or {FIN_TZ}
+
+def next_reminder_due(after=None):
+    """Aikaisin kellonajallinen muistutus kaikista osioista (Dynamic-ajastus)."""
+    due = [d for d in (part.reminders.next_due(after) for part in partitions) if d is not None]
+    return min(due, default=None)
+
+# --------- PÄIVÄNVAIHTO KLO 00:00 (PAIKALLISTA AIKAA) ---------
+async def midnight_rollover(part, now):
+    """Vaihtaa päivän kerralla niille osion käyttäjille, joiden paikallinen
+    keskiyö on nyt, jotta raportit ja komennot näkevät tämän päivän tiedot."""
+    async with part.locks.exclusive():
+        roll_over(part, part.timezones.user_ids_at(now), now)
+
+async def rollover_stale(part, now):
+    """Käynnistyksessä: päivänvaihto kaikille, joiden paikallinen päivä on
+    vaihtunut botin ollessa alhaalla."""
+    async with part.locks.exclusive():
+        roll_over(part, list(part.store.users), now)
+
+# --------- HISTORIAN ARKISTOINTI KLO 04:00 ---------
+ARCHIVE_BATCH = 500  # käyttäjää per levykirjoitus (yksi synkronointi per erä)
+
+async def archive_history(part, now):
+    """Siirtää history_hot_days-ikkunaa vanhemmat kokonaiset kuukaudet
+    kylmään arkistoon (archive.Archive). Tietueeseen jäävät kuukausien
+    yhteenvedot, joten koko historian tilastot eivät tarvitse vanhoja päiviä."""
+    cfg = settings.current
+    if not cfg.history_hot_days:
+        return
+    until = month_first((now.date() - timedelta(days=cfg.history_hot_days)).toordinal())
+    store = part.store
+    users = [user_id for user_id, _ in store.with_history_before(until)]
+    for i in range(0, len(users), ARCHIVE_BATCH):
+        segments = {}
+        for user_id in users[i:i + ARCHIVE_BATCH]:
+            segments[user_id] = Archive.split(store.users[user_id].history, until)
+        # tiedostot kirjoitetaan säikeessä; tietueet muuttuvat vasta tapahtumasta
+        merged = await asyncio.to_thread(store.archive.write_batch, segments)
+        for user_id, months in merged.items():
+            async with part.locks.user(user_id):
+                history = store.users[user_id].history
+                if Archive.split(history, until) != segments[user_id]:
+                    continue  # vanhaa päivää muutettiin kirjoituksen aikana: seuraava ajo
+                rollups = (history.rollups or Rollups(until)).replace(until, months, cfg.stats)
+                store.apply("history_archived", user_id, rollups=rollups.encode())
+    if users:
+        print(f"[archive_history] palvelin {part.key or 'home'}: {len(users)} käyttäjää, "
+              f"arkistoitu ennen {date.fromordinal(until)}")
 
-        new_msg = await channel.send(embed=embed)
-        meta["leaderboard_message_id"] = new_msg.id
-        data["_meta"] = meta
-        save_data(data)
+# --------- AUTOMAATTINEN LEADERBOARD KLO 06:00 (MUOKKAA SAMA VIesti) ---------
+async def update_daily_leaderboard(part, now):
+    """Päivittää palvelimen leaderboardin joka aamu klo 06:00 Suomen aikaa muokkaamalla samaa viestiä.
+    Päivän aikana viesti päivittyy pisteiden muuttuessa (leaderboard_interval); aamun ajo
+    muokkaa aina, joten poistettu viesti luodaan viimeistään silloin uudelleen."""
+    await part.leaderboard.refresh(force=True)
 
 # --------- AUTOMAATTINEN TODAYPLAN JOKA PÄIVÄ KLO 05:30 ---------
-@tasks.loop(minutes=1)
-async def send_daily_todayplan():
-    """Lähettää joka päivä klo 05:30 päivän todayplanin TODAY_PLAN_CHANNEL_ID-kanavalle."""
-    now = datetime.now(FIN_TZ)
-    if now.hour == 5 and now.minute == 30:
-        channel = bot.get_channel(TODAY_PLAN_CHANNEL_ID)
-        if channel is None:
-            return
-        text = build_todayplan_message()
-        await channel.send(text)
+async def send_daily_todayplan(part, now):
+    """Lähettää joka päivä klo 05:30 päivän todayplanin #today-plan-kanavalle."""
+    cfg = settings.current
+    channel_id = channel_id_for(part, cfg, "today_plan")
+    channel = bot.get_channel(channel_id) if channel_id else None
+    if channel is None:
+        return
+    text = build_todayplan_message(cfg, now)
+    await channel.send(text)
 
 # --------- AUTOMAATTINEN ENSI VIIKON OHJELMA SUNNUNTAISIN KLO 18:00 ---------
-@tasks.loop(minutes=1)
-async def send_week_vision():
-    """Lähettää joka sunnuntai klo 18:00 ensi viikon ohjelman WEEK_VISION_CHANNEL_ID-kanavalle."""
-    now = datetime.now(FIN_TZ)
-    # weekday(): Monday=0 ... Sunday=6
-    if now.weekday() == 6 and now.hour == 18 and now.minute == 0:
-        channel = bot.get_channel(WEEK_VISION_CHANNEL_ID)
-        if channel is None:
-            return
-        text = build_weekplan_message()
-        await channel.send(text)
-
-# --------- AUTOMAATTINEN PÄIVÄRAPORTTI KLO 21:00 (DM) ---------
-@tasks.loop(minutes=1)
-async def send_daily_report():
-    """Lähettää joka ilta klo 21:00 käyttäjälle raportin päivän suorituksista (DM)."""
-    now = datetime.now(FIN_TZ)
-    if now.hour == 21 and now.minute == 0:
-        data = load_data()
-
-        for user_id_str, user_data in data.items():
-            # ohitetaan meta-data (esim. "_meta")
-            if not user_id_str.isdigit():
-                continue
-
-            today_tasks = [t for t, done in user_data.get("today", {}).items() if done]
-            routines_done = sum(1 for t in DAILY_ROUTINE_TASKS if user_data["today"].get(t))
-            today_points = sum(TASKS.get(t, 0) for t in today_tasks)
-            streak_today = routines_done >= MIN_TASKS_FOR_STREAK
-            current_streak = user_data.get("streak", 0)
-
-            try:
-                user = await bot.fetch_user(int(user_id_str))
-            except Exception:
-                continue
-
-            msg_lines = [
-                f"📊 **Päivän raportti ({now.strftime('%Y-%m-%d')})**",
-                "",
-                f"• Tehtyjä rutiinitehtäviä tänään: **{routines_done}**",
-                f"• Päivän pisteet (tehtävistä): **{today_points}**",
-                f"• Nykyinen streak (eiliseen asti): **{current_streak}** päivää",
-                f"• Tämä päivä täyttää streakin rajan ({MIN_TASKS_FOR_STREAK} rutiinia): **{'KYLLÄ' if streak_today else 'EI'}**",
-            ]
-            try:
-                await user.send("\n".join(msg_lines))
-            except Exception:
-                continue  # esim. DM estetty
-
-# --------- AUTOMAATTINEN 18:00 TODO + MUISTUTUKSET (DM) ---------
-@tasks.loop(minutes=1)
-async def send_evening_todo():
-    """Lähettää klo 18:00 DM-muistutuksen: mitkä tehtävät tehty/tekemättä + päivän muistutukset."""
-    now = datetime.now(FIN_TZ)
-    if now.hour == 18 and now.minute == 0:
-        data = load_data()
-        today_name = get_today_name()
-        today_str = now.strftime("%Y-%m-%d")
-
-        for user_id_str, user_data in data.items():
-            if not user_id_str.isdigit():
-                continue
-
-            today_done = user_data.get("today", {})
-            plan = DAY_PLAN.get(today_name, {})
-            core_tasks = plan.get("core_tasks", [])
-            routines = DAILY_ROUTINE_TASKS
+async def send_week_vision(part, now):
+    """Lähettää joka sunnuntai klo 18:00 ensi viikon ohjelman #week-vision-kanavalle."""
+    cfg = settings.current
+    channel_id = channel_id_for(part, cfg, "week_vision")
+    channel = bot.get_channel(channel_id) if channel_id else None
+    if channel is None:
+        return
+    text = build_weekplan_message(cfg)
+    await channel.send(text)
+
+# --------- AUTOMAATTINEN PÄIVÄRAPORTTI KLO 21:00 (DM, PAIKALLISTA AIKAA) ---------
+async def send_daily_report(part, now):
+    """Lähettää joka ilta klo 21:00 käyttäjälle raportin päivän suorituksista (DM).
+    Ajo koskee niitä, joiden paikallinen kello on nyt 21:00 (ks. timezones.py)."""
+    cfg = settings.current
+    outgoing = []
+    for user_id, user_data in part.timezones.users_at(now):
+        today_tasks = [t for t, done in user_data.today.items() if done]
+        routines_done = sum(1 for t in cfg.routine_tasks if user_data.today.get(t))
+        today_points = sum(cfg.tasks.get(t, 0) for t in today_tasks)
+        streak_today = routines_done >= cfg.min_tasks_for_streak
+        current_streak = user_data.streak
+
+        msg_lines = [
+            f"📊 **Päivän raportti ({now.strftime('%Y-%m-%d')})**",
+            "",
+            f"• Tehtyjä rutiinitehtäviä tänään: **{routines_done}**",
+            f"• Päivän pisteet (tehtävistä): **{today_points}**",
+            f"• Nykyinen streak (eiliseen asti): **{current_streak}** päivää",
+            f"• Tämä päivä täyttää streakin rajan ({cfg.min_tasks_for_streak} rutiinia): **{'KYLLÄ' if streak_today else 'EI'}**",
+        ]
+        outgoing.append((user_id, "\n".join(msg_lines)))
+
+    await broadcaster.send("daily_report", outgoing, part.deliveries, now)
+
+# --------- AUTOMAATTINEN 18:00 TODO + MUISTUTUKSET (DM, PAIKALLISTA AIKAA) ---------
+async def send_evening_todo(part, now):
+    """Lähettää klo 18:00 DM-muistutuksen: mitkä tehtävät tehty/tekemättä + päivän muistutukset.
+    Omat muistutukset tulevat aina: jos raportti ohitetaan (off, passiivinen),
+    ne lähetetään erillisenä viestinä, ja ne poistetaan vasta perillemenon jälkeen."""
+    cfg = settings.current
+    today_name = get_today_name(now)
+    today_str = now.strftime("%Y-%m-%d")
+    core_tasks = cfg.core_tasks(today_name)
+    routines = cfg.routine_tasks
+
+    # Viestit kootaan yhtenä lukittuna ajona; muistutuksista otetaan talteen
+    # määrä, ettei lähetyksen aikana lisätty muistutus poistu lähettämättä.
+    outgoing = []
+    reminder_only = []  # raportin ohittaville pelkät muistutukset (report=False)
+    sent = {}  # raportin mukana: user_id -> [(päivämäärä, None, montako)]
+    sent_alone = {}
+    async with part.locks.exclusive():
+        reminder_users = part.reminders.users_for(today_str)
+        for user_id, user_data in part.timezones.users_at(now):
+            today_done = user_data.today
 
             def line_for(t):
                 done = today_done.get(t, False)
                 emoji = "✅" if done else "⬜"
-                return f"{emoji} {t} ({TASKS.get(t, '?')} pts)"
+                return f"{emoji} {t} ({cfg.tasks.get(t, '?')} pts)"
 
             routine_lines = [line_for(t) for t in routines]
             core_lines = [line_for(t) for t in core_tasks]
 
-            reminders = user_data.get("reminders", {})
-            todays_reminders = reminders.get(today_str, [])
+            todays_reminders = entries_at(user_data, today_str, None) if user_id in reminder_users else []
+            if todays_reminders and part.deliveries.skip_reason(user_id, now) is not None:
+                reminder_only.append((user_id, "\n".join(
+                    [f"📌 **Muistutukset tälle päivälle ({today_name})**", ""] + [f"• {txt}" for txt in todays_reminders]
+                )))
+                sent_alone[user_id] = [(today_str, None, len(todays_reminders))]
+                todays_reminders = []
 
             msg_lines = [
                 f"⏰ **18:00 muistutus – {today_name}**",
@@ -734,158 +1311,275 @@ async def send_evening_todo():
             if todays_reminders:
                 for txt in todays_reminders:
                     msg_lines.append(f"• {txt}")
-                # poistetaan tämän päivän muistutukset, etteivät toistu
-                del reminders[today_str]
-                user_data["reminders"] = reminders
-                save_data(data)
+                sent[user_id] = [(today_str, None, len(todays_reminders))]
             else:
                 msg_lines.append("Ei erillisiä muistutuksia tälle päivälle.")
-
-            try:
-                user = await bot.fetch_user(int(user_id_str))
-                await user.send("\n".join(msg_lines))
-            except Exception:
+            outgoing.append((user_id, "\n".join(msg_lines)))
+
+    outcomes = {}
+    await broadcaster.send("evening_todo", outgoing, part.deliveries, now, outcomes=outcomes)
+    settle_reminders(part, now, sent, outcomes)
+    if reminder_only:
+        outcomes = {}
+        await broadcaster.send("evening_reminders", reminder_only, part.deliveries, now, report=False, outcomes=outcomes)
+        settle_reminders(part, now, sent_alone, outcomes)
+
+# --------- KELLONAJALLISET MUISTUTUKSET (DM) ---------
+def settle_reminders(part, now, sent, outcomes):
+    """Lähetyksen jälkeen: perille menneet muistutukset poistetaan, muut
+    palaavat muistutusindeksiin (aikaisintaan käyttäjän backoffin päättyessä)
+    tai vanhenevat, jos ne ovat jo LATE_GRACE myöhässä.
+    sent: user_id -> [(päivämäärä, kellonaika, montako)]; outcomes: Broadcaster.send()."""
+    retried = expired = 0
+    for user_id, items in sent.items():
+        record = part.store.find_user(user_id)
+        if record is None:
+            continue
+        delivered = user_id in outcomes and outcomes[user_id] is None
+        at = max(now, clock.now(FIN_TZ)) + RETRY_DELAY
+        retry = record.delivery.get("retry")
+        if retry is not None:
+            at = max(at, datetime.fromisoformat(retry))
+        for date_str, time_str, count in items:
+            if delivered:
+                part.store.apply("reminders_delivered", user_id, date=date_str, time=time_str, count=count)
+            elif part.reminders.retry(user_id, date_str, time_str, at):
+                retried += 1
                 continue
-
-# --------- AUTOMAATTINEN 21:30 – TARKISTUS: TEITKÖ KAIKEN? (DM) ---------
-@tasks.loop(minutes=1)
-async def send_day_completion_check():
-    """Lähettää klo 21:30 DM-viestin, jossa kerrotaan onko päivän kaikki tehtävät tehty."""
-    now = datetime.now(FIN_TZ)
-    if now.hour == 21 and now.minute == 30:
-        data = load_data()
-        today_name = get_today_name()
-
-        plan = DAY_PLAN.get(today_name, {})
-        core_tasks = plan.get("core_tasks", [])
-        routines = DAILY_ROUTINE_TASKS
-
-        for user_id_str, user_data in data.items():
-            if not user_id_str.isdigit():
+            else:
+                expired += count
+                part.store.apply("reminders_expired", user_id, date=date_str, time=time_str, count=count)
+            if time_str is None:
+                part.reminders.refresh(user_id, date_str)
+    if retried:
+        print(f"[reminders] {retried} muistutusta jäi toimittamatta, uusi yritys myöhemmin")
+        scheduler.reschedule("timed_reminders")
+    if expired:
+        print(f"[reminders] poistettiin {expired} toimittamatta vanhentunutta muistutusta")
+
+async def send_timed_reminders(part, now):
+    """Lähettää muistutukset, joiden kellonaika on tullut. Ajastin herää vain
+    silloin, kun jonkin osion seuraava muistutus erääntyy. Mukana myös
+    aiemmin toimittamatta jääneet (ks. settle_reminders)."""
+    sent = {}  # user_id -> [(päivämäärä, kellonaika, montako)]
+    lines = {}  # user_id -> viestin rivit
+    async with part.locks.exclusive():
+        for due, user_id, date_str, time_str in part.reminders.pop_due(max(now, clock.now(FIN_TZ))):
+            texts = entries_at(part.store.find_user(user_id), date_str, time_str)
+            sent.setdefault(user_id, []).append((date_str, time_str, len(texts)))
+            lines.setdefault(user_id, []).extend(f"• {txt}" for txt in texts)
+
+    if sent:
+        outgoing = []
+        for user_id, items in sent.items():
+            times = ", ".join(sorted({time_str or "18:00" for _, time_str, _ in items}))
+            outgoing.append((user_id, "\n".join([f"⏰ **Muistutus klo {times}**", ""] + lines[user_id])))
+        outcomes = {}
+        await broadcaster.send("timed_reminders", outgoing, part.deliveries, now, report=False, outcomes=outcomes)
+        settle_reminders(part, now, sent, outcomes)
+
+async def deliver_overdue_reminders(part, now):
+    """Käynnistyksessä: toimittaa botin ollessa alhaalla erääntyneet muistutukset,
+    jos ne ovat alle LATE_GRACE myöhässä, ja poistaa sitä vanhemmat. Toimitetut
+    poistetaan vasta perillemenon jälkeen (settle_reminders)."""
+    late = {}  # user_id -> rivit
+    sent = {}  # user_id -> [(päivämäärä, kellonaika, montako)]
+    expired = 0
+    async with part.locks.exclusive():
+        part.reminders.rebuild()
+        overdue = part.reminders.pop_due(now) + part.reminders.overdue_digest(now)
+        for due, user_id, date_str, time_str in sorted(overdue, key=lambda item: item[0]):
+            user_data = part.store.find_user(user_id)
+            if now - due <= LATE_GRACE:
+                when = f"{date_str} klo {time_str or '18:00'}"
+                texts = entries_at(user_data, date_str, time_str)
+                late.setdefault(user_id, []).extend(f"• {txt} _({when})_" for txt in texts)
+                sent.setdefault(user_id, []).append((date_str, time_str, len(texts)))
                 continue
+            expired += len(entries_at(user_data, date_str, time_str))
+            part.store.apply("reminders_expired", user_id, date=date_str, time=time_str)
+            if time_str is None:
+                part.reminders.refresh(user_id, date_str)
+
+    if expired:
+        print(f"[reminders] poistettiin {expired} vanhentunutta muistutusta")
+    if late:
+        outgoing = [
+            (user_id, "\n".join(["⏰ **Myöhästyneet muistutukset** (botti oli hetken pois päältä)", ""] + lines))
+            for user_id, lines in late.items()
+        ]
+        outcomes = {}
+        await broadcaster.send("overdue_reminders", outgoing, part.deliveries, now, report=False, outcomes=outcomes)
+        settle_reminders(part, now, sent, outcomes)
+
+# --------- AUTOMAATTINEN 21:30 – TARKISTUS: TEITKÖ KAIKEN? (DM, PAIKALLISTA AIKAA) ---------
+async def send_day_completion_check(part, now):
+    """Lähettää klo 21:30 DM-viestin, jossa kerrotaan onko päivän kaikki tehtävät tehty."""
+    cfg = settings.current
+    today_name = get_today_name(now)
 
-            today_done = user_data.get("today", {})
+    core_tasks = cfg.core_tasks(today_name)
+    routines = cfg.routine_tasks
 
-            def line_for(t):
-                done = today_done.get(t, False)
-                emoji = "✅" if done else "❌"
-                return f"{emoji} {t}"
+    outgoing = []
+    for user_id, user_data in part.timezones.users_at(now):
+        today_done = user_data.today
 
-            routine_lines = [line_for(t) for t in routines]
-            core_lines = [line_for(t) for t in core_tasks]
+        def line_for(t):
+            done = today_done.get(t, False)
+            emoji = "✅" if done else "❌"
+            return f"{emoji} {t}"
 
-            all_routines_done = all(today_done.get(t, False) for t in routines)
-            all_core_done = all(today_done.get(t, False) for t in core_tasks)
-            everything_done = all_routines_done and all_core_done
+        routine_lines = [line_for(t) for t in routines]
+        core_lines = [line_for(t) for t in core_tasks]
 
-            if everything_done:
-                status_msg = (
-                    "🎉 **Täydellinen päivä!**\n"
-                    "Olet tehnyt **kaikki** tämän päivän tehtävät.\n"
-                    "🔥 Todella kova suoritus!"
-                )
-            else:
-                status_msg = (
-                    "⚠️ **Et saanut kaikkea tehtyä tänään.**\n"
-                    "Ei haittaa — huomenna uusi mahdollisuus! 💪"
-                )
-
-            message = [
-                f"🌙 **21:30 päivän tarkistus – {today_name}**",
-                "",
-                status_msg,
-                "",
-                "__Päivittäiset rutiinit:__",
-            ]
-            message += routine_lines
-            message += [
-                "",
-                "__Päivän ydintehtävät:__",
-            ]
-            message += core_lines
+        all_routines_done = all(today_done.get(t, False) for t in routines)
+        all_core_done = all(today_done.get(t, False) for t in core_tasks)
+        everything_done = all_routines_done and all_core_done
 
-            try:
-                user = await bot.fetch_user(int(user_id_str))
-                await user.send("\n".join(message))
-            except Exception:
-                continue
+        if everything_done:
+            status_msg = (
+                "🎉 **Täydellinen päivä!**\n"
+                "Olet tehnyt **kaikki** tämän päivän tehtävät.\n"
+                "🔥 Todella kova suoritus!"
+            )
+        else:
+            status_msg = (
+                "⚠️ **Et saanut kaikkea tehtyä tänään.**\n"
+                "Ei haittaa — huomenna uusi mahdollisuus! 💪"
+            )
 
-# --------- AUTOMAATTINEN VIIKKORAPORTTI SUNNUNTAISIN KLO 20:00 (DM) ---------
-@tasks.loop(minutes=1)
-async def send_weekly_summary():
+        message = [
+            f"🌙 **21:30 päivän tarkistus – {today_name}**",
+            "",
+            status_msg,
+            "",
+            "__Päivittäiset rutiinit:__",
+        ]
+        message += routine_lines
+        message += [
+            "",
+            "__Päivän ydintehtävät:__",
+        ]
+        message += core_lines
+        outgoing.append((user_id, "\n".join(message)))
+
+    await broadcaster.send("day_completion_check", outgoing, part.deliveries, now)
+
+# --------- AUTOMAATTINEN VIIKKORAPORTTI SUNNUNTAISIN KLO 20:00 (DM, PAIKALLISTA AIKAA) ---------
+def with_progress_chart(part, user_id, text, today, masks=None):
+    """DM, jonka liitteenä on !progress-kuva. Kuva tehdään vasta lähetettäessä
+    (discord.File käy vain kerran), ja sama kuva tulee välimuistista."""
+    async def build():
+        png, _ = await progress_png(part, user_id, PROGRESS_DAYS, today, masks)
+        return {"content": text, "file": chart_file(png, "progress.png")}
+    return build
+
+async def send_weekly_summary(part, now):
     """Lähettää sunnuntaisin klo 20:00 viikkoraportin viimeisestä 7 päivästä (DM)."""
-    now = datetime.now(FIN_TZ)
-    # Sunday = 6
-    if now.weekday() == 6 and now.hour == 20 and now.minute == 0:
-        data = load_data()
-        today_date = now.date()
-
-        for user_id_str, user_data in data.items():
-            if not user_id_str.isdigit():
-                continue
-
-            history = user_data.get("history", {})
-            # kerätään viimeiset 7 päivää (mukana tänään)
-            dates = [today_date - timedelta(days=i) for i in range(7)]
-            dates.reverse()  # vanhimmasta uusimpaan
-
-            total_points = 0
-            days_with_any = 0
-            success_days = 0  # päivät, joissa streak-raja täyttyi
-            per_day_lines = []
-
-            for d in dates:
-                date_str = d.strftime("%Y-%m-%d")
-                # historiassa edelliset päivät, tänään -> yhdistelmä today-sanakirjasta
-                if date_str == user_data.get("last_date"):
-                    tasks_done = [t for t, done in user_data.get("today", {}).items() if done]
-                else:
-                    tasks_done = history.get(date_str, [])
-
-                if not tasks_done:
-                    per_day_lines.append(f"{date_str}: (ei tehtäviä)")
-                    continue
+    cfg = settings.current
+    today_date = now.date()
+    # kerätään viimeiset 7 päivää (mukana tänään)
+    dates = [today_date - timedelta(days=i) for i in range(7)]
+    dates.reverse()  # vanhimmasta uusimpaan
+
+    # koko ryhmän maskit yhdellä kyselyllä: progress-kuvan jakso, josta viikko on loppu
+    users = list(part.timezones.users_at(now))
+    first = today_date - timedelta(days=PROGRESS_DAYS - 1)
+    periods = await part.store.query(
+        "period_masks_many", [user_id for user_id, _ in users], first.isoformat(), today_date.isoformat()
+    )
 
-                days_with_any += 1
-                unique_tasks = set(tasks_done)
-                day_points = sum(TASKS.get(t, 0) for t in unique_tasks)
-                total_points += day_points
+    outgoing = []
+    for user_id, user_data in users:
+        period = periods[int(user_id)]
+        week = period[-7:]
 
-                routines_done = sum(1 for t in DAILY_ROUTINE_TASKS if t in unique_tasks)
-                if routines_done >= MIN_TASKS_FOR_STREAK:
-                    success_days += 1
-                    flag = "✅"
-                else:
-                    flag = "⚠️"
+        total_points = 0
+        days_with_any = 0
+        success_days = 0  # päivät, joissa streak-raja täyttyi
+        per_day_lines = []
 
-                per_day_lines.append(
-                    f"{date_str}: {flag} {len(unique_tasks)} tehtävää, {day_points} pts (rutiineja: {routines_done})"
-                )
+        for d, mask in zip(dates, week):
+            date_str = d.strftime("%Y-%m-%d")
 
-            if days_with_any == 0:
-                # ei lähe viestiä jos koko viikko tyhjä
+            if not mask:
+                per_day_lines.append(f"{date_str}: (ei tehtäviä)")
                 continue
 
-            best_streak = user_data.get("best_streak", 0)
+            days_with_any += 1
+            day_points = mask_value(mask, cfg.point_weights)
+            total_points += day_points
 
-            msg_lines = [
-                "📈 **Viikkoraportti (viimeiset 7 päivää)**",
-                "",
-                f"• Päiviä, jolloin teit jotain: **{days_with_any}/7**",
-                f"• Päiviä, joissa streak-raja ({MIN_TASKS_FOR_STREAK} rutiinia) täyttyi: **{success_days}**",
-                f"• Pisteitä yhteensä: **{total_points}**",
-                f"• Paras streak tähän mennessä: **{best_streak}** päivää",
-                "",
-                "__Päiväkohtaiset rivit:__",
-            ]
-            msg_lines += per_day_lines
+            routines_done = (mask & cfg.routine_mask).bit_count()
+            if routines_done >= cfg.min_tasks_for_streak:
+                success_days += 1
+                flag = "✅"
+            else:
+                flag = "⚠️"
 
-            try:
-                user = await bot.fetch_user(int(user_id_str))
-                await user.send("\n".join(msg_lines))
-            except Exception:
-                continue
+            per_day_lines.append(
+                f"{date_str}: {flag} {mask.bit_count()} tehtävää, {day_points} pts (rutiineja: {routines_done})"
+            )
+
+        if days_with_any == 0:
+            # ei lähe viestiä jos koko viikko tyhjä
+            outgoing.append((user_id, None))
+            continue
 
-bot.run(TOKEN)
+        best_streak = user_data.best_streak
+
+        msg_lines = [
+            "📈 **Viikkoraportti (viimeiset 7 päivää)**",
+            "",
+            f"• Päiviä, jolloin teit jotain: **{days_with_any}/7**",
+            f"• Päiviä, joissa streak-raja ({cfg.min_tasks_for_streak} rutiinia) täyttyi: **{success_days}**",
+            f"• Pisteitä yhteensä: **{total_points}**",
+            f"• Paras streak tähän mennessä: **{best_streak}** päivää",
+            "",
+            "__Päiväkohtaiset rivit:__",
+        ]
+        msg_lines += per_day_lines
+        outgoing.append((user_id, with_progress_chart(part, user_id, "\n".join(msg_lines), today_date, period)))
+
+    await broadcaster.send("weekly_summary", outgoing, part.deliveries, now)
+
+# --------- AJASTUS ---------
+# Kanavaviestit Suomen aikaa; päivänvaihto ja DM:t jokaisen käytössä olevan
+# aikavyöhykkeen paikalliseen aikaan (Zoned), ja ajo käsittelee vain sen vyöhykkeen käyttäjät.
+# catch_up: kuinka myöhään uudelleenkäynnistyksen takia väliin jäänyt ajo vielä ajetaan
+scheduler.add("midnight_rollover", Zoned(Cron(0, 0), user_zones), each_guild(midnight_rollover), catch_up=timedelta(hours=24))
+scheduler.add("archive_history", Cron(4, 0), each_guild(archive_history), catch_up=timedelta(hours=20))
+scheduler.add("daily_todayplan", Cron(5, 30), each_guild(send_daily_todayplan), catch_up=timedelta(hours=6))
+scheduler.add("daily_leaderboard", Cron(6, 0), each_guild(update_daily_leaderboard), catch_up=timedelta(hours=18))
+scheduler.add("evening_todo", Zoned(Cron(18, 0), user_zones), each_guild(send_evening_todo), catch_up=timedelta(hours=3))
+scheduler.add("week_vision", Cron(18, 0, weekdays=[6]), each_guild(send_week_vision), catch_up=timedelta(hours=5))
+scheduler.add("weekly_summary", Zoned(Cron(20, 0, weekdays=[6]), user_zones), each_guild(send_weekly_summary), catch_up=timedelta(hours=3))
+scheduler.add("daily_report", Zoned(Cron(21, 0), user_zones), each_guild(send_daily_report), catch_up=timedelta(minutes=30))
+scheduler.add("day_completion_check", Zoned(Cron(21, 30), user_zones), each_guild(send_day_completion_check), catch_up=timedelta(hours=2))
+scheduler.add("timed_reminders", Dynamic(next_reminder_due, "muistutusten mukaan"), each_guild(send_timed_reminders))
+
+# --------- KÄYNNISTYS ---------
+def setup():
+    """Lataa datan ja asetukset muistiin. Ei yhdistä Discordiin, joten moduulia
+    voi käyttää myös ilman bottia (benchmarks/, työkalut)."""
+    partitions.load()
+    reload_config()
+
+def main():
+    token = os.environ["DISCORD_TOKEN"]
+    try:
+        setup()
+    except ConfigError as e:
+        raise SystemExit(f"Asetustiedosto {CONFIG_FILE}: {e}")
+    try:
+        bot.run(token)
+    finally:
+        # kirjoitetaan odottavat muutokset ennen sammutusta
+        partitions.flush()
+        charts.close()
+
+if __name__ == "__main__":
+    main()
 
 